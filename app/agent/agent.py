@@ -1,8 +1,10 @@
 # app/agent/agent.py
 from __future__ import annotations
 
-from typing import Dict, Any, List, Optional, Callable
+from typing import Dict, Any, List, Optional, Callable, Tuple
+import copy
 import json
+import time
 
 from app.logger import log_info, log_warning, log_error
 from app.agent.capabilities import CapabilityDiscovery
@@ -24,6 +26,9 @@ class AideonAgent:
       - run_autonomous(goal: str, max_steps: int = 5) -> Dict[str, Any]
       - plan_high_level(goal: str) -> Any
     И адаптер для planner: planner.build_high_level_plan(goal) доступен всегда.
+
+    boot() кэшируется: capabilities — на agent_boot_ttl секунд (config, по умолчанию 300),
+    навыки перезагружаются только при смене отпечатка (mtime каталога навыков и манифестов).
     """
 
     def __init__(
@@ -38,10 +43,17 @@ class AideonAgent:
         self.file_manager = file_manager
         self.improver_bridge = improver_bridge
 
+        # --- Кэш boot()
+        self.boot_ttl: float = float(self.config.get("agent_boot_ttl", 300.0))
+        self._caps_cache: Optional[List[Dict[str, Any]]] = None
+        self._caps_at: float = 0.0
+        self._skills_fp: Optional[Tuple[Any, ...]] = None
+        self._boot_state: Optional[Dict[str, Any]] = None
+
         # --- Базовые компоненты
         self.discovery = CapabilityDiscovery()
         self.registry = SkillRegistry()
-        self.planner = Planner()
+        self.planner = Planner(config=self.config, registry=self.registry)
 
         # --- Политика безопасности
         try:
@@ -93,15 +105,39 @@ class AideonAgent:
     # --------------------
     # Высокоуровневые API
     # --------------------
-    def boot(self) -> Dict[str, Any]:
-        caps = self.discovery.scan()
-        self.registry.load()
-        state = {
-            "capabilities": [c.__dict__ for c in caps],
-            "skills": self.registry.list(),
-        }
-        log_info(f"[Agent] загрузился: skills={len(state['skills'])}")
-        return state
+    def boot(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Состояние агента (capabilities + навыки). Повторные вызовы в пределах TTL
+        стоят один проход stat по каталогу навыков; force=True — полный пересбор.
+        Возвращается копия: вызывающие могут менять её свободно.
+        """
+        now = time.monotonic()
+        changed = False
+
+        if force or self._caps_cache is None or now - self._caps_at >= self.boot_ttl:
+            self._caps_cache = [dict(c.__dict__) for c in self.discovery.scan()]
+            self._caps_at = now
+            changed = True
+
+        fp = self.registry.fingerprint()
+        if force or fp != self._skills_fp or not fp:
+            self.registry.load()  # без импорта модулей; изменённые skill.py перезагрузятся при запуске
+            self._skills_fp = fp
+            changed = True
+
+        if changed or self._boot_state is None:
+            self._boot_state = {
+                "capabilities": self._caps_cache,
+                "skills": self.registry.list(),
+            }
+            log_info(f"[Agent] загрузился: skills={len(self._boot_state['skills'])}")
+        return copy.deepcopy(self._boot_state)
+
+    def invalidate_boot(self) -> None:
+        """Сбросить кэш boot() (например, после установки навыка или смены окружения)."""
+        self._caps_cache = None
+        self._skills_fp = None
+        self._boot_state = None
 
     def plan_high_level(self, goal: str) -> Any:
         """
@@ -129,6 +165,18 @@ class AideonAgent:
         except TypeError:
             results = self.executor.run(plan)
 
+        # Частичный сбой — перепланируем остаток (успешный префикс плана не повторяется)
+        replan = getattr(self.planner, "replan", None)
+        if callable(replan) and self.config.get("agent_replan", True) and any(r.get("status") != "ok" for r in results):
+            tail = replan(goal, state, plan, results)
+            done = {str(r.get("id")) for r in results if r.get("status") == "ok"}
+            for step in tail:
+                step["needs"] = [d for d in step.get("needs") or [] if d not in done]
+            left = max_steps - sum(1 for r in results if "elapsed_ms" in r)
+            if tail and left > 0:
+                plan = plan + tail
+                results = results + self.executor.run(tail, max_steps=left)  # type: ignore[call-arg]
+
         return {"plan": plan, "results": results, "state": state}
 
     # --------------------
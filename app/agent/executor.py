@@ -1,30 +1,300 @@
 from __future__ import annotations
-from typing import List, Dict, Any
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import List, Dict, Any, Optional, Tuple
+
 from app.logger import log_info, log_warning
+from app.agent.skill_cache import SkillCache
+from app.agent.skill_workers import SkillWorkerPool, SkillWorkerTimeout
+
+# Статусы шагов
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+STATUS_MISSING = "missing"
+STATUS_BLOCKED = "blocked"
+STATUS_TIMEOUT = "timeout"
+STATUS_CANCELLED = "cancelled"
+STATUS_SKIPPED = "skipped"
+STATUS_INVALID = "invalid"
+
 
 class Executor:
-    def __init__(self, skills, safety):
+    """
+    Исполнитель плана как DAG.
+
+    Шаг плана: {"skill": ..., "args": {...}, "id": "read_readme", "needs": ["other_id"], "timeout": 10}.
+      - id     — необязателен, по умолчанию номер шага ("1", "2", ...);
+      - needs  — id шагов, которые должны успешно завершиться раньше; шаги без needs независимы;
+      - timeout — секунды на шаг (по умолчанию executor_step_timeout из config).
+
+    Независимые шаги выполняются параллельно, не больше executor_workers одновременно
+    (каждый шаг — в своём daemon-потоке).
+    Если зависимость не выполнилась успешно — шаг пропускается (skipped).
+    max_steps ограничивает число запускаемых шагов, остальные — skipped.
+    cancel() (или переданный cancel_event) останавливает запуск новых шагов — они cancelled.
+    Поток с шагом, превысившим timeout, прервать нельзя: шаг помечается timeout, результат отбрасывается,
+    а слот освобождается — брошенный поток не занимает место следующих шагов и не задерживает run().
+
+    Результаты — в порядке плана, с временем выполнения (elapsed_ms).
+    Идемпотентные навыки (manifest "cache") обслуживаются через SkillCache (skill_cache_size записей,
+    0 — выключен); в результат шага добавляется "cache": {"status": hit|revalidated|miss|bypass, "hit_rate": ...}.
+
+    skill_workers > 0 — навыки выполняются в пуле прогретых процессов (SkillWorkerPool): зависший шаг
+    убивается по timeout, лимиты на шаг — step["limits"] {"cpu_seconds", "max_rss_mb"} поверх
+    skill_worker_cpu_seconds / skill_worker_max_rss_mb. Навык с "isolation": "inprocess" в манифесте
+    всегда выполняется в процессе агента.
+    """
+    def __init__(
+        self,
+        skills,
+        safety,
+        *,
+        file_manager: Optional[Any] = None,
+        improver_bridge: Optional[Any] = None,
+        config: Optional[Dict[str, Any]] = None,
+    ):
         self.skills = skills
         self.safety = safety
+        self.file_manager = file_manager
+        self.improver_bridge = improver_bridge
+        self.config: Dict[str, Any] = dict(config or {})
+        self.workers: int = max(1, int(self.config.get("executor_workers", 4)))
+        timeout = self.config.get("executor_step_timeout", 120.0)
+        self.step_timeout: Optional[float] = float(timeout) if timeout else None
+        max_steps = self.config.get("executor_max_steps")
+        self.max_steps: Optional[int] = int(max_steps) if max_steps else None
+        self.cache = SkillCache(int(self.config.get("skill_cache_size", 256)))
+        self.worker_count: int = max(0, int(self.config.get("skill_workers", 0) or 0))
+        self._pool: Optional[SkillWorkerPool] = None
+        self._pool_lock = threading.Lock()
+        self._cancel = threading.Event()
+
+    def _worker_pool(self) -> Optional[SkillWorkerPool]:
+        if self.worker_count <= 0:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                skills = getattr(self.skills, "skills", self.skills)
+                preload = [
+                    (sk.module_name, sk.module_path) for sk in skills.values()
+                    if getattr(sk, "module_name", None) and sk.manifest.get("isolation") != "inprocess"
+                ]
+                limits = {
+                    "cpu_seconds": self.config.get("skill_worker_cpu_seconds"),
+                    "max_rss_mb": self.config.get("skill_worker_max_rss_mb"),
+                }
+                try:
+                    self._pool = SkillWorkerPool(
+                        self.worker_count, preload,
+                        default_limits={k: v for k, v in limits.items() if v},
+                        start_method=self.config.get("skill_worker_start_method"),
+                    )
+                except Exception as e:
+                    log_warning(f"[Executor] пул воркеров недоступен ({e}), навыки выполняются в процессе")
+                    self.worker_count = 0
+                    return None
+            return self._pool
+
+    def shutdown(self) -> None:
+        """Остановить пул воркеров (если был запущен)."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
 
-    def run(self, steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        results: List[Dict[str, Any]] = []
+    def cancel(self) -> None:
+        """Отменить текущий run(): уже идущие шаги доработают, новые не запустятся."""
+        self._cancel.set()
+
+    # ---------- разбор плана ----------
+
+    @staticmethod
+    def _step_ids(steps: List[Dict[str, Any]]) -> Tuple[List[str], List[Optional[str]]]:
+        """id шагов и ошибки разбора (дубликаты id) — по индексу шага."""
+        ids: List[str] = []
+        errors: List[Optional[str]] = []
+        seen = set()
         for i, step in enumerate(steps, 1):
-            skill_name = step["skill"]
-            args = step.get("args", {})
-            sk = self.skills.get(skill_name)
-            if not sk:
-                log_warning(f"[Executor] навык не найден: {skill_name}")
-                results.append({"step": i, "status": "missing", "skill": skill_name})
-                continue
-            ok, reason = self.safety.check(sk.manifest, args)
-            if not ok:
-                results.append({"step": i, "status": "blocked", "skill": skill_name, "reason": reason})
+            sid = str(step.get("id") or i)
+            errors.append(f"duplicate step id: {sid}" if sid in seen else None)
+            seen.add(sid)
+            ids.append(sid)
+        return ids, errors
+
+    @staticmethod
+    def _needs(step: Dict[str, Any]) -> List[str]:
+        needs = step.get("needs") or []
+        if isinstance(needs, (str, int)):
+            needs = [needs]
+        return [str(n) for n in needs]
+
+    # ---------- выполнение ----------
+
+    def run(
+        self,
+        steps: List[Dict[str, Any]],
+        max_steps: Optional[int] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> List[Dict[str, Any]]:
+        self._cancel.clear()
+        limit = max_steps if max_steps is not None else self.max_steps
+        ids, errors = self._step_ids(steps)
+        index = {sid: n for n, sid in enumerate(ids) if errors[n] is None}
+        results: List[Optional[Dict[str, Any]]] = [None] * len(steps)
+
+        def finish(n: int, status: str, **extra: Any) -> None:
+            res = {"step": n + 1, "id": ids[n], "status": status, "skill": steps[n].get("skill")}
+            res.update(extra)
+            results[n] = res
+
+        pending: List[int] = []
+        for n, step in enumerate(steps):
+            if errors[n]:
+                finish(n, STATUS_INVALID, reason=errors[n])
                 continue
+            unknown = [d for d in self._needs(step) if d not in index]
+            if unknown:
+                finish(n, STATUS_INVALID, reason=f"unknown needs: {', '.join(unknown)}")
+            elif not step.get("skill"):
+                finish(n, STATUS_INVALID, reason="step has no skill")
+            else:
+                pending.append(n)
+
+        started = 0
+        running: Dict[Future, int] = {}
+        start_times: Dict[int, float] = {}
+        while pending or running:
+            if pending and (self._cancel.is_set() or (cancel_event is not None and cancel_event.is_set())):
+                # новые шаги не запускаем; запущенные дорабатывают (в пределах своих timeout)
+                for n in pending:
+                    finish(n, STATUS_CANCELLED, reason="cancelled")
+                pending = []
+
+            # запуск готовых шагов (в порядке плана). Проход повторяем, пока он что-то меняет:
+            # шаг, упавший синхронно (missing/blocked), может стоять в плане позже зависящего от него
+            progress = True
+            while pending and progress:
+                still: List[int] = []
+                for n in pending:
+                    deps = [index[d] for d in self._needs(steps[n])]
+                    failed = [ids[d] for d in deps if results[d] is not None and results[d]["status"] != STATUS_OK]
+                    if failed:
+                        finish(n, STATUS_SKIPPED, reason=f"dependency failed: {', '.join(failed)}")
+                        continue
+                    if any(results[d] is None for d in deps):
+                        still.append(n)
+                        continue
+                    if limit is not None and started >= limit:
+                        finish(n, STATUS_SKIPPED, reason=f"max_steps={limit} reached")
+                        continue
+                    if len(running) >= self.workers:
+                        still.append(n)  # ждёт свободного слота
+                        continue
+                    fut = self._submit(n, steps[n], start_times, finish)
+                    if fut is not None:
+                        started += 1
+                        running[fut] = n
+                progress = len(still) < len(pending)
+                pending = still
+
+            if not running:
+                # остались только шаги, ждущие друг друга — цикл в needs
+                for n in pending:
+                    finish(n, STATUS_INVALID, reason="dependency cycle")
+                pending = []
+                break
+
+            done, _ = wait(list(running), timeout=self._wait_timeout(running, start_times, steps),
+                           return_when=FIRST_COMPLETED)
+            for fut in done:
+                n = running.pop(fut)
+                self._collect(n, steps[n]["skill"], fut, start_times, finish)
+            self._expire(running, start_times, steps, finish)
+        return [r for r in results if r is not None]
+
+    def _submit(self, n: int, step: Dict[str, Any], start_times: Dict[int, float], finish) -> Optional[Future]:
+        skill_name = step["skill"]
+        args = step.get("args", {}) or {}
+        sk = self.skills.get(skill_name)
+        if not sk:
+            log_warning(f"[Executor] навык не найден: {skill_name}")
+            finish(n, STATUS_MISSING)
+            return None
+        ok, reason = self.safety.check(sk.manifest, args)
+        if not ok:
+            finish(n, STATUS_BLOCKED, reason=reason)
+            return None
+
+        workers = self._worker_pool() if getattr(sk, "module_name", None) else None
+        if workers is not None and sk.manifest.get("isolation") != "inprocess":
+            timeout = self._timeout_of(step)
+            limits = step.get("limits")
+
+            def fn(**kw: Any) -> Any:
+                return workers.call(sk.module_name, sk.module_path, kw, timeout=timeout, limits=limits)
+        else:
+            def fn(**kw: Any) -> Any:
+                return sk.fn(**kw)
+
+        fut: Future = Future()
+
+        def call() -> None:
             try:
-                out = sk.fn(**args)
-                results.append({"step": i, "status": "ok", "skill": skill_name, "output": out})
-                log_info(f"[Executor] шаг {i} skill={skill_name} ok")
-            except Exception as e:
-                results.append({"step": i, "status": "error", "skill": skill_name, "error": str(e)})
-        return results
\ No newline at end of file
+                fut.set_result(self.cache.call(skill_name, sk.manifest, args, fn))
+            except BaseException as e:
+                fut.set_exception(e)
+
+        # свой daemon-поток на шаг: по timeout он просто бросается (завершение процесса не ждёт его)
+        start_times[n] = time.monotonic()
+        threading.Thread(target=call, name=f"executor-step-{n + 1}", daemon=True).start()
+        return fut
+
+    @staticmethod
+    def _elapsed(start_times: Dict[int, float], n: int) -> float:
+        t0 = start_times.get(n)
+        return round((time.monotonic() - t0) * 1000, 1) if t0 is not None else 0.0
+
+    def _collect(self, n: int, skill_name: str, fut: Future, start_times: Dict[int, float], finish) -> None:
+        elapsed = self._elapsed(start_times, n)
+        try:
+            out, cache_status = fut.result()
+        except SkillWorkerTimeout as e:
+            finish(n, STATUS_TIMEOUT, reason=str(e), elapsed_ms=elapsed)
+            return
+        except Exception as e:
+            finish(n, STATUS_ERROR, error=str(e), elapsed_ms=elapsed)
+            return
+        extra: Dict[str, Any] = {}
+        if cache_status is not None:
+            extra["cache"] = {"status": cache_status, "hit_rate": self.cache.stats(skill_name)["hit_rate"]}
+        finish(n, STATUS_OK, output=out, elapsed_ms=elapsed, **extra)
+        log_info(f"[Executor] шаг {n + 1} skill={skill_name} ok ({elapsed} ms{', cache ' + cache_status if cache_status else ''})")
+
+    def _timeout_of(self, step: Dict[str, Any]) -> Optional[float]:
+        t = step.get("timeout", self.step_timeout)
+        return float(t) if t else None
+
+    def _wait_timeout(self, running: Dict[Future, int], start_times: Dict[int, float],
+                      steps: List[Dict[str, Any]]) -> float:
+        """Сколько ждать завершения: до ближайшего дедлайна, но не дольше 0.2 c (реакция на cancel)."""
+        now = time.monotonic()
+        wait_for = 0.2
+        for n in running.values():
+            t0 = start_times.get(n)
+            timeout = self._timeout_of(steps[n])
+            if t0 is not None and timeout is not None:
+                wait_for = min(wait_for, max(0.0, t0 + timeout - now))
+        return wait_for
+
+    def _expire(self, running: Dict[Future, int], start_times: Dict[int, float],
+                steps: List[Dict[str, Any]], finish) -> None:
+        now = time.monotonic()
+        for fut, n in list(running.items()):
+            t0 = start_times.get(n)
+            timeout = self._timeout_of(steps[n])
+            if t0 is None or timeout is None or now - t0 < timeout or fut.done():
+                continue
+            running.pop(fut)
+            finish(n, STATUS_TIMEOUT, reason=f"timeout after {timeout:g}s", elapsed_ms=self._elapsed(start_times, n))
+            log_warning(f"[Executor] шаг {n + 1} skill={steps[n].get('skill')} — таймаут {timeout:g}s")
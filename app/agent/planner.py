@@ -1,15 +1,300 @@
 from __future__ import annotations
-from typing import List, Dict, Any
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
+from app.logger import log_info, log_warning
+
+PLAN_CACHE_PATH = os.path.join("app", "data", "plan_cache.json")
+
+# Цели, для которых план известен заранее (без обращения к модели)
+RULE_PLANS: Dict[str, List[Dict[str, Any]]] = {
+    "collect_project_context": [
+        {"id": "readme", "skill": "fs.read", "args": {"path": "README.md"}, "why": "получить контекст проекта"},
+    ],
+}
+
+_SYSTEM_PROMPT = (
+    "Ты — планировщик агента Aideon. Разбей цель на шаги из доступных навыков.\n"
+    "Ответь ТОЛЬКО JSON-объектом без пояснений:\n"
+    '{"steps": [{"id": "s1", "skill": "<имя навыка>", "args": {...}, "needs": ["<id>"], "why": "<зачем>"}]}\n'
+    "Правила: только навыки из списка; args — только из inputs навыка; needs — id предыдущих шагов, "
+    "результат которых нужен (независимые шаги выполняются параллельно); не больше {max_steps} шагов; "
+    "если цель невыполнима доступными навыками — {\"steps\": []}."
+)
+
+_TYPES: Dict[str, Tuple[type, ...]] = {
+    "str": (str,),
+    "int": (int,),
+    "float": (int, float),
+    "bool": (bool,),
+    "dict": (dict,),
+    "list": (list,),
+}
+
+
+def _digest(obj: Any) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def _extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """JSON-объект из ответа модели (допускаются ```json-блоки и текст вокруг)."""
+    text = (text or "").strip()
+    m = re.search(r"```(?:json)?\s*(.*?)```", text, re.S)
+    if m:
+        text = m.group(1).strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
 
 class Planner:
     """
-    Простейший планировщик: превращает цели в список шагов (скиллов).
-    Позже сюда можно внедрить ReAct/ToT/LLM-планирование.
+    Планировщик: превращает цели в список шагов (скиллов).
+
+    - Известные цели (RULE_PLANS) — без модели.
+    - Остальные — один вызов LLM со списком манифестов навыков, ответ — JSON
+      {"steps": [...]}, шаги проверяются по манифестам (имя навыка, имена и типы args, needs).
+    - Планы кэшируются (app/data/plan_cache.json) по (цель, хэш навыков, хэш capabilities):
+      повтор цели не стоит вызова модели; при смене навыков/окружения ключ меняется.
+    - replan() после частичного сбоя сохраняет успешно выполненный префикс плана
+      и просит у модели только оставшуюся часть.
+
+    chat — функция messages -> str; по умолчанию CodeAnalyzer._chat_call (создаётся лениво).
     """
+    def __init__(
+        self,
+        config: Optional[Dict[str, Any]] = None,
+        registry: Optional[Any] = None,
+        chat: Optional[Callable[[List[Dict[str, str]]], str]] = None,
+        cache_path: Optional[str] = PLAN_CACHE_PATH,
+    ):
+        self.config: Dict[str, Any] = dict(config or {})
+        self.registry = registry
+        self._chat = chat
+        self.cache_path = cache_path
+        self.cache_size = int(self.config.get("plan_cache_size", 200))
+        self.max_steps = int(self.config.get("planner_max_steps", 8))
+        self._cache: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self.llm_calls = 0
+        self.cache_hits = 0
+
+    # ---------- модель ----------
+
+    def _llm(self, messages: List[Dict[str, str]]) -> str:
+        if self._chat is None:
+            from app.modules.analyzer import CodeAnalyzer  # тяжёлый импорт — только когда нужна модель
+            self._chat = CodeAnalyzer(self.config)._chat_call
+        self.llm_calls += 1
+        return self._chat(messages)
+
+    # ---------- навыки / ключ ----------
+
+    def _manifests(self, state: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        skills = getattr(self.registry, "skills", None) or {}
+        if skills:
+            return {name: sk.manifest for name, sk in skills.items()}
+        return {name: {"name": name} for name in state.get("skills", [])}
+
+    def cache_key(self, goal: str, state: Dict[str, Any]) -> str:
+        manifests = self._manifests(state)
+        caps = [(c.get("name"), c.get("present")) for c in state.get("capabilities", []) if isinstance(c, dict)]
+        return f"{_digest(' '.join(goal.split()).lower())}:{_digest(manifests)}:{_digest(caps)}"
+
+    # ---------- кэш планов ----------
+
+    def _load_cache(self) -> Dict[str, Any]:
+        if self._cache is None:
+            self._cache = {}
+            if self.cache_path and os.path.isfile(self.cache_path):
+                try:
+                    with open(self.cache_path, "r", encoding="utf-8") as f:
+                        self._cache = json.load(f).get("plans") or {}
+                except Exception as e:
+                    log_warning(f"[Planner] кэш планов не прочитан: {e}")
+        return self._cache
+
+    def _cache_get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._load_cache().get(key)
+        return json.loads(json.dumps(entry["steps"])) if entry else None
+
+    def _cache_put(self, key: str, goal: str, steps: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            cache = self._load_cache()
+            cache[key] = {"goal": goal, "steps": steps, "at": time.time()}
+            if len(cache) > self.cache_size:
+                for old in sorted(cache, key=lambda k: cache[k].get("at", 0))[: len(cache) - self.cache_size]:
+                    del cache[old]
+            self._save_locked()
+
+    def _save_locked(self) -> None:
+        """Атомарно записать кэш на диск (вызывается под self._lock)."""
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            tmp = f"{self.cache_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"plans": self._load_cache()}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.cache_path)
+        except Exception as e:
+            log_warning(f"[Planner] кэш планов не сохранён: {e}")
+
+    def invalidate(self, goal: Optional[str] = None) -> None:
+        """Сбросить кэш планов (всё или по одной цели) — и в памяти, и на диске."""
+        with self._lock:
+            cache = self._load_cache()
+            stale = [k for k, v in cache.items() if goal is None or v.get("goal") == goal]
+            for key in stale:
+                del cache[key]
+            if stale:
+                self._save_locked()
+
+    # ---------- проверка плана ----------
+
+    def validate(self, steps: Any, manifests: Dict[str, Dict[str, Any]],
+                 known_ids: Tuple[str, ...] = ()) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Оставляет корректные шаги; возвращает (шаги, замечания)."""
+        issues: List[str] = []
+        if not isinstance(steps, list):
+            return [], ["steps — не список"]
+        out: List[Dict[str, Any]] = []
+        ids = set(known_ids)
+        for i, raw in enumerate(steps, 1):
+            if not isinstance(raw, dict):
+                issues.append(f"шаг {i}: не объект")
+                continue
+            skill = raw.get("skill")
+            man = manifests.get(skill) if isinstance(skill, str) else None
+            if man is None:
+                issues.append(f"шаг {i}: неизвестный навык {skill!r}")
+                continue
+            args = raw.get("args") or {}
+            if not isinstance(args, dict):
+                issues.append(f"шаг {i}: args — не объект")
+                continue
+            inputs: Dict[str, str] = man.get("inputs") or {}
+            bad = [k for k in args if inputs and k not in inputs]
+            bad += [k for k, v in args.items() if k in inputs and inputs[k] in _TYPES and v is not None
+                    and (not isinstance(v, _TYPES[inputs[k]]) or (inputs[k] != "bool" and isinstance(v, bool)))]
+            if bad:
+                issues.append(f"шаг {i}: некорректные args {sorted(set(bad))} для {skill}")
+                continue
+            sid = str(raw.get("id") or f"s{i}")
+            if sid in ids:
+                sid = f"{sid}_{i}"
+            needs = raw.get("needs") or []
+            needs = [str(n) for n in (needs if isinstance(needs, list) else [needs])]
+            unknown = [n for n in needs if n not in ids]
+            if unknown:
+                # ссылка на неизвестный или более поздний шаг: выполнять шаг без его зависимости нельзя
+                issues.append(f"шаг {i}: needs ссылается на неизвестные/последующие шаги {unknown}")
+                continue
+            step = {"id": sid, "skill": skill, "args": args, "needs": needs}
+            if raw.get("why"):
+                step["why"] = str(raw["why"])
+            ids.add(sid)
+            out.append(step)
+            if len(out) >= self.max_steps:
+                break
+        return out, issues
+
+    # ---------- планирование ----------
+
+    def _ask(self, goal: str, state: Dict[str, Any], manifests: Dict[str, Dict[str, Any]],
+             done: Optional[List[Dict[str, Any]]] = None, failed: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        skills_doc = [
+            {k: m.get(k) for k in ("name", "description", "inputs", "permissions") if m.get(k) is not None}
+            for m in manifests.values()
+        ]
+        caps = [c.get("name") for c in state.get("capabilities", []) if isinstance(c, dict) and c.get("present")]
+        user = f"Цель: {goal}\n\nНавыки:\n{json.dumps(skills_doc, ensure_ascii=False)}\n\nДоступно: {', '.join(caps) or '—'}"
+        if done is not None:
+            user += (
+                f"\n\nУже выполнено (не повторять; на их id можно ссылаться в needs):\n"
+                f"{json.dumps(done, ensure_ascii=False)}\n"
+                f"Не удалось:\n{json.dumps(failed or [], ensure_ascii=False)}\n"
+                "Спланируй только оставшиеся шаги, обходя причину сбоя."
+            )
+        messages = [
+            {"role": "system", "content": _SYSTEM_PROMPT.replace("{max_steps}", str(self.max_steps))},
+            {"role": "user", "content": user},
+        ]
+        data = _extract_json(self._llm(messages))
+        if data is None:
+            log_warning(f"[Planner] ответ модели не JSON — план для «{goal}» пуст")
+            return []
+        known = tuple(str(s["id"]) for s in done or [])
+        steps, issues = self.validate(data.get("steps"), manifests, known_ids=known)
+        for msg in issues:
+            log_warning(f"[Planner] {msg}")
+        return steps
+
+    def plan_goal(self, goal: str, state: Dict[str, Any]) -> List[Dict[str, Any]]:
+        goal = goal.strip()
+        if goal in RULE_PLANS:
+            return json.loads(json.dumps(RULE_PLANS[goal]))
+        key = self.cache_key(goal, state)
+        cached = self._cache_get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            log_info(f"[Planner] план из кэша: «{goal}» ({len(cached)} шаг.)")
+            return cached
+        manifests = self._manifests(state)
+        steps = self._ask(goal, state, manifests)
+        if steps:
+            self._cache_put(key, goal, steps)
+        log_info(f"[Planner] план для «{goal}»: {len(steps)} шаг.")
+        return steps
+
     def make_plan(self, goals: List[str], state: Dict[str, Any]) -> List[Dict[str, Any]]:
         steps: List[Dict[str, Any]] = []
-        for g in goals:
-            if g == "collect_project_context":
-                steps.append({"skill": "fs.read", "args": {"path": "README.md"}, "why": "получить контекст проекта"})
-            # добавляй другие правила
-        return steps
\ No newline at end of file
+        for n, g in enumerate(goals):
+            part = self.plan_goal(g, state)
+            if len(goals) > 1:
+                # id уникальны в пределах общего плана
+                prefix = f"g{n + 1}."
+                for s in part:
+                    s["id"] = prefix + str(s.get("id"))
+                    s["needs"] = [prefix + str(d) for d in s.get("needs") or []]
+            steps.extend(part)
+        return steps
+
+    def replan(self, goal: str, state: Dict[str, Any], plan: List[Dict[str, Any]],
+               results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Перепланирование после частичного сбоя: успешный префикс плана (шаги до первого неуспешного)
+        сохраняется, модель планирует только остаток. Возвращает новые шаги (без префикса);
+        в кэш под ключ цели кладётся префикс + новые шаги.
+        """
+        status = {str(r.get("id")): r.get("status") for r in results}
+        prefix: List[Dict[str, Any]] = []
+        for s in plan:
+            if status.get(str(s.get("id"))) != "ok":
+                break
+            prefix.append(s)
+        failed = [
+            {"id": r.get("id"), "skill": r.get("skill"), "status": r.get("status"),
+             "reason": r.get("error") or r.get("reason")}
+            for r in results if r.get("status") != "ok"
+        ]
+        if not failed:
+            return []
+        tail = self._ask(goal, state, self._manifests(state),
+                         done=[{"id": s["id"], "skill": s["skill"], "args": s.get("args", {})} for s in prefix],
+                         failed=failed)
+        if tail:
+            self._cache_put(self.cache_key(goal.strip(), state), goal.strip(), prefix + tail)
+        log_info(f"[Planner] перепланировано «{goal}»: префикс {len(prefix)} шаг., новых {len(tail)}")
+        return tail
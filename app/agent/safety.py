@@ -1,6 +1,133 @@
 from __future__ import annotations
-from typing import Dict, Any, Tuple, List
-from app.logger import log_info
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Tuple, List, Optional, Iterable
+from app.logger import log_info, log_warning
+
+# Биты разрешений навыка (manifest["permissions"])
+PERM_NET = 1 << 0        # net.*
+PERM_SHELL = 1 << 1      # proc.shell
+PERM_FS_WRITE = 1 << 2   # fs.write
+PERM_FS_READ = 1 << 3    # fs.read
+
+
+def permission_bits(perms: Iterable[str]) -> int:
+    bits = 0
+    for p in perms:
+        if p.startswith("net."):
+            bits |= PERM_NET
+        elif p == "proc.shell":
+            bits |= PERM_SHELL
+        elif p == "fs.write":
+            bits |= PERM_FS_WRITE
+        elif p == "fs.read":
+            bits |= PERM_FS_READ
+    return bits
+
+
+def _norm_path(path: str, cwd: str) -> str:
+    """Путь для сравнения с белым списком: без ./ и .., с '/', относительно cwd (если внутри него)."""
+    p = os.path.normpath(path).replace("\\", "/")
+    if os.path.isabs(p):
+        try:
+            rel = os.path.relpath(p, cwd).replace("\\", "/")
+        except ValueError:
+            return p
+        if not rel.startswith("../") and rel != "..":
+            return rel
+    return p
+
+
+def _outside(p: str) -> bool:
+    """Нормализованный путь остался абсолютным или выходит за cwd."""
+    return os.path.isabs(p) or p == ".." or p.startswith("../")
+
+
+def _glob_regex(pat: str) -> str:
+    """glob -> regex: '*' и '?' не пересекают '/', '**' — любое число каталогов."""
+    out: List[str] = []
+    i, n = 0, len(pat)
+    while i < n:
+        c = pat[i]
+        if pat.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pat.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            j = pat.find("]", i + 2 if pat.startswith("[!", i) or pat.startswith("[]", i) else i + 1)
+            if j < 0:
+                out.append(re.escape(c))
+                i += 1
+                continue
+            body = pat[i + 1:j]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append("(?!/)[" + body.replace("\\", "\\\\") + "]")
+            i = j + 1
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out) + r"\Z"
+
+
+class PathMatcher:
+    """
+    Белый список путей, скомпилированный один раз:
+      "README.md"       — точное совпадение;
+      "docs/" / "docs/**" — всё внутри каталога (префикс);
+      "app/**/*.md"     — glob ('*' не пересекает '/', '**' — любое число каталогов).
+    Проверяемый путь сначала разрешается через realpath (симлинки); пути вне cwd
+    отклоняются всегда. Пустой список — ограничений нет.
+    """
+    def __init__(self, patterns: Iterable[str], cwd: Optional[str] = None):
+        self.cwd = os.path.realpath(cwd or os.getcwd())
+        self.patterns = [str(p) for p in patterns if str(p).strip()]
+        self.exact = set()
+        prefixes: List[str] = []
+        globs: List[str] = []
+        for pat in self.patterns:
+            raw = pat.replace("\\", "/")
+            if raw.endswith("/**") and not any(c in raw[:-3] for c in "*?["):
+                prefixes.append(_norm_path(raw[:-3], self.cwd) + "/")
+            elif raw.endswith("/") and not any(c in raw for c in "*?["):
+                prefixes.append(_norm_path(raw, self.cwd) + "/")
+            elif any(c in raw for c in "*?["):
+                globs.append(_glob_regex(raw[2:] if raw.startswith("./") else raw))
+            else:
+                self.exact.add(_norm_path(raw, self.cwd))
+        self.prefixes: Tuple[str, ...] = tuple(prefixes)
+        self._glob = re.compile("|".join(f"(?:{g})" for g in globs)) if globs else None
+
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+
+    def resolve(self, path: str) -> str:
+        """Путь для сравнения: realpath относительно cwd, затем _norm_path."""
+        return _norm_path(os.path.realpath(os.path.join(self.cwd, path)), self.cwd)
+
+    def match(self, path: str) -> bool:
+        return self.match_resolved(self.resolve(path))
+
+    def match_resolved(self, p: str) -> bool:
+        """match() для пути, уже прошедшего resolve()."""
+        if _outside(p):
+            return False
+        if p in self.exact:
+            return True
+        if self.prefixes and p.startswith(self.prefixes):
+            return True
+        return bool(self._glob and self._glob.match(p))
+
 
 class SafetyGuardian:
     """
@@ -10,30 +137,86 @@ class SafetyGuardian:
         "profile": "restricted",
         "net_disabled": true,
         "allow_shell": false,
-        "fs_write_whitelist": ["README.md"]
+        "fs_write_whitelist": ["README.md", "docs/", "app/**/*.md"],
+        "fs_read_whitelist": [],          # пусто — читать можно всё
+        "decision_cache_size": 4096,
+        "log_sample_every": 1000          # INFO о разрешённых шагах — раз в N проверок
       }
+
+    Политика компилируется один раз (в __init__ / reload): запреты — битовая маска разрешений,
+    белые списки — PathMatcher. Решения кэшируются (LRU) по (навык, биты, путь после realpath).
+    Отказ логируется при первом вычислении решения, разрешения — выборочно.
     """
     def __init__(self, policy: Dict[str, Any]):
-        self.policy = policy or {}
+        self._lock = threading.Lock()
+        self.reload(policy)
 
-    def check(self, skill_manifest: Dict[str, Any], args: Dict[str, Any]) -> Tuple[bool, str]:
-        perms: List[str] = skill_manifest.get("permissions", [])
-        prof = self.policy.get("profile", "default")
+    def reload(self, policy: Optional[Dict[str, Any]]) -> None:
+        """Перекомпилировать политику (кэш решений сбрасывается)."""
+        self.policy = dict(policy or {})
+        self.profile = self.policy.get("profile", "default")
+        denied = 0
+        if self.policy.get("net_disabled"):
+            denied |= PERM_NET
+        if not self.policy.get("allow_shell", False):
+            denied |= PERM_SHELL
+        self.denied_bits = denied
+        self.write_matcher = PathMatcher(self.policy.get("fs_write_whitelist", []))
+        self.read_matcher = PathMatcher(self.policy.get("fs_read_whitelist", []))
+        self.cache_size = max(0, int(self.policy.get("decision_cache_size", 4096)))
+        self.log_every = max(1, int(self.policy.get("log_sample_every", 1000)))
+        with self._lock:
+            self._decisions: "OrderedDict[Tuple[Any, ...], Tuple[bool, str]]" = OrderedDict()
+            self._perm_cache: Dict[Tuple[str, ...], int] = {}
+            self.checks = 0
+            self.hits = 0
+
+    def _bits(self, perms: List[str]) -> int:
+        key = tuple(perms)
+        bits = self._perm_cache.get(key)
+        if bits is None:
+            bits = self._perm_cache[key] = permission_bits(perms)
+        return bits
 
+    def _decide(self, bits: int, path: str, resolved: str) -> Tuple[bool, str]:
         # запрет сети
-        if self.policy.get("net_disabled") and any(p.startswith("net.") for p in perms):
+        if bits & self.denied_bits & PERM_NET:
             return False, "Network disabled by policy"
-
         # контроль shell
-        if not self.policy.get("allow_shell", False) and any(p == "proc.shell" for p in perms):
+        if bits & self.denied_bits & PERM_SHELL:
             return False, "Shell execution disabled by policy"
+        # файловые записи / чтения
+        if bits & PERM_FS_WRITE and self.write_matcher and not self.write_matcher.match_resolved(resolved):
+            return False, f"Write denied for {path} (not in whitelist)"
+        if bits & PERM_FS_READ and self.read_matcher and not self.read_matcher.match_resolved(resolved):
+            return False, f"Read denied for {path} (not in whitelist)"
+        return True, ""
+
+    def check(self, skill_manifest: Dict[str, Any], args: Dict[str, Any]) -> Tuple[bool, str]:
+        bits = self._bits(skill_manifest.get("permissions", []))
+        path = str(args.get("path", "")) if bits & (PERM_FS_WRITE | PERM_FS_READ) else ""
+        # ключ — путь после realpath: смена цели симлинка не отдаст устаревшее решение
+        resolved = self.write_matcher.resolve(path) if path else ""
+        key = (skill_manifest.get("name"), bits, resolved)
 
-        # файловые записи
-        if any(p == "fs.write" for p in perms):
-            wl = set(self.policy.get("fs_write_whitelist", []))
-            path = str(args.get("path", ""))
-            if wl and path not in wl:
-                return False, f"Write denied for {path} (not in whitelist)"
+        with self._lock:
+            self.checks += 1
+            n = self.checks
+            decision = self._decisions.get(key)
+            if decision is not None:
+                self._decisions.move_to_end(key)
+                self.hits += 1
+        if decision is None:
+            decision = self._decide(bits, path, resolved)
+            if self.cache_size:
+                with self._lock:
+                    self._decisions[key] = decision
+                    if len(self._decisions) > self.cache_size:
+                        self._decisions.popitem(last=False)
+            if not decision[0]:
+                log_warning(f"[Safety] DENY skill={skill_manifest.get('name')} profile={self.profile}: {decision[1]}")
 
-        log_info(f"[Safety] OK skill={skill_manifest.get('name')} profile={prof}")
-        return True, ""
\ No newline at end of file
+        if decision[0] and (n == 1 or n % self.log_every == 0):
+            log_info(f"[Safety] OK skill={skill_manifest.get('name')} profile={self.profile} "
+                     f"(проверок: {n}, из кэша: {self.hits})")
+        return decision
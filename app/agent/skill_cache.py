@@ -0,0 +1,196 @@
+from __future__ import annotations
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from app.logger import log_info
+
+# Статусы обращения к кэшу (попадают в результат шага Executor)
+CACHE_HIT = "hit"                # отдано из кэша без вызова навыка
+CACHE_REVALIDATED = "revalidated"  # навык подтвердил, что данные не изменились (HTTP 304)
+CACHE_MISS = "miss"              # навык выполнен, результат сохранён
+CACHE_BYPASS = "bypass"          # результат не кэшируется (ошибка, нет валидатора)
+
+
+@dataclass
+class _Entry:
+    output: Any
+    validator: Any
+    stored_at: float
+
+
+class SkillCache:
+    """
+    Кэш результатов идемпотентных навыков (в памяти, LRU на max_entries записей).
+
+    Навык включает кэш в manifest.json:
+      "cache": {
+        "idempotent": true,
+        "key": ["path", "offset", "max_bytes"],  # аргументы, входящие в ключ (по умолчанию — все)
+        "validator": "file" | "http" | "ttl",
+        "path_arg": "path",                       # для validator=file
+        "ttl": 60                                 # секунды без перепроверки (для http/ttl)
+      }
+
+    Валидаторы:
+      - file — (mtime_ns, size) файла из path_arg; запись отдаётся, пока файл не изменился;
+      - http — ETag/Last-Modified из результата; после ttl навык вызывается с условными заголовками
+               (headers: If-None-Match / If-Modified-Since), ответ 304 продлевает запись;
+      - ttl  — только время жизни.
+
+    Кэш живёт, пока жив Executor, — т.е. и между run() одного агента.
+    """
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max(0, int(max_entries))
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    # ---------- политика навыка ----------
+
+    @staticmethod
+    def policy(manifest: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        pol = manifest.get("cache")
+        if not isinstance(pol, dict) or not pol.get("idempotent"):
+            return None
+        return pol
+
+    @staticmethod
+    def _key(skill: str, pol: Dict[str, Any], args: Dict[str, Any]) -> Tuple[str, str]:
+        names = pol.get("key")
+        picked = {k: args.get(k) for k in names} if names else dict(args)
+        path_arg = pol.get("path_arg")
+        if pol.get("validator") == "file" and path_arg and picked.get(path_arg) is not None:
+            picked[path_arg] = os.path.abspath(str(picked[path_arg]))
+        return skill, json.dumps(picked, sort_keys=True, default=str)
+
+    @staticmethod
+    def _file_validator(pol: Dict[str, Any], args: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+        path = args.get(pol.get("path_arg") or "path")
+        if not path:
+            return None
+        try:
+            st = os.stat(str(path))
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    @staticmethod
+    def _http_validator(output: Any) -> Optional[Dict[str, str]]:
+        if not isinstance(output, dict) or not output.get("ok") or output.get("status") != 200:
+            return None
+        v = {k: output[k] for k in ("etag", "last_modified") if output.get(k)}
+        return v
+
+    # ---------- вызов ----------
+
+    def call(
+        self,
+        skill: str,
+        manifest: Dict[str, Any],
+        args: Dict[str, Any],
+        fn: Callable[..., Any],
+    ) -> Tuple[Any, Optional[str]]:
+        """
+        Выполнить навык через кэш. Возвращает (результат, статус кэша);
+        статус None — навык не кэшируемый (или кэш выключен).
+        """
+        pol = self.policy(manifest)
+        if pol is None or self.max_entries == 0:
+            return fn(**args), None
+
+        key = self._key(skill, pol, args)
+        kind = pol.get("validator", "ttl")
+        ttl = float(pol.get("ttl", 0) or 0)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if kind == "file":
+            token = self._file_validator(pol, args)
+            if entry is not None and token is not None and entry.validator == token:
+                return self._hit(skill, entry, CACHE_HIT)
+            out = fn(**args)
+            # файл мог измениться во время чтения — кэшируем, только если stat совпадает до и после
+            if token is not None and token == self._file_validator(pol, args):
+                return self._store(skill, key, out, token, CACHE_MISS)
+            return self._bypass(skill, out)
+
+        fresh = entry is not None and ttl > 0 and now - entry.stored_at < ttl
+        if fresh:
+            return self._hit(skill, entry, CACHE_HIT)
+
+        if kind == "http":
+            cond_args = dict(args)
+            if entry is not None and entry.validator:
+                headers = dict(args.get("headers") or {})
+                if entry.validator.get("etag"):
+                    headers["If-None-Match"] = entry.validator["etag"]
+                if entry.validator.get("last_modified"):
+                    headers["If-Modified-Since"] = entry.validator["last_modified"]
+                cond_args["headers"] = headers
+            out = fn(**cond_args)
+            if entry is not None and isinstance(out, dict) and out.get("status") == 304:
+                entry.stored_at = time.monotonic()
+                return self._hit(skill, entry, CACHE_REVALIDATED)
+            validator = self._http_validator(out)
+            if validator is None or (not validator and ttl <= 0):
+                return self._bypass(skill, out)
+            return self._store(skill, key, out, validator, CACHE_MISS)
+
+        out = fn(**args)
+        if ttl <= 0:
+            return self._bypass(skill, out)
+        return self._store(skill, key, out, None, CACHE_MISS)
+
+    def _count(self, skill: str, status: str) -> None:
+        with self._lock:
+            st = self._stats.setdefault(skill, {CACHE_HIT: 0, CACHE_REVALIDATED: 0, CACHE_MISS: 0, CACHE_BYPASS: 0})
+            st[status] += 1
+
+    def _hit(self, skill: str, entry: _Entry, status: str) -> Tuple[Any, str]:
+        self._count(skill, status)
+        out = entry.output
+        return (out if isinstance(out, (str, bytes)) else copy.deepcopy(out)), status
+
+    def _bypass(self, skill: str, out: Any) -> Tuple[Any, str]:
+        self._count(skill, CACHE_BYPASS)
+        return out, CACHE_BYPASS
+
+    def _store(self, skill: str, key: Tuple[str, str], out: Any, validator: Any, status: str) -> Tuple[Any, str]:
+        stored = out if isinstance(out, (str, bytes)) else copy.deepcopy(out)
+        with self._lock:
+            self._entries[key] = _Entry(stored, validator, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        self._count(skill, status)
+        return out, status
+
+    # ---------- статистика / управление ----------
+
+    def stats(self, skill: Optional[str] = None) -> Dict[str, Any]:
+        """Счётчики по навыку (или суммарно) и доля попаданий (hit + revalidated)."""
+        with self._lock:
+            rows = [self._stats.get(skill, {})] if skill else list(self._stats.values())
+            total = {s: sum(r.get(s, 0) for r in rows) for s in (CACHE_HIT, CACHE_REVALIDATED, CACHE_MISS, CACHE_BYPASS)}
+            total["entries"] = len(self._entries)
+        calls = total[CACHE_HIT] + total[CACHE_REVALIDATED] + total[CACHE_MISS] + total[CACHE_BYPASS]
+        total["hit_rate"] = round((total[CACHE_HIT] + total[CACHE_REVALIDATED]) / calls, 3) if calls else 0.0
+        return total
+
+    def invalidate(self, skill: Optional[str] = None) -> None:
+        with self._lock:
+            if skill is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == skill]:
+                    del self._entries[key]
+        log_info(f"[SkillCache] сброшен кэш: {skill or 'все навыки'}")
@@ -0,0 +1,352 @@
+from __future__ import annotations
+import atexit
+import importlib
+import multiprocessing as mp
+import os
+import signal
+import threading
+import time
+import traceback
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import resource  # POSIX
+except Exception:  # Windows
+    resource = None  # type: ignore
+
+from app.logger import log_info
+
+MB = 1024 * 1024
+KILL_GRACE = 0.5  # секунд между SIGTERM воркеру (он убивает свои группы процессов) и SIGKILL
+
+
+class SkillWorkerError(RuntimeError):
+    """Навык упал в воркере, воркер умер (лимит CPU/памяти, сигнал) или не ответил."""
+
+
+class SkillWorkerTimeout(SkillWorkerError):
+    """Шаг превысил timeout — воркер убит и перезапущен."""
+
+
+def _child_pids(pid: int) -> List[int]:
+    """Прямые потомки процесса (Linux /proc; на других ОС — пусто)."""
+    out: List[int] = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                out.extend(int(x) for x in f.read().split())
+        return out
+    except OSError:
+        pass
+    # ядро без CONFIG_PROC_CHILDREN — по ppid из /proc/*/stat
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return out
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        fields = stat[stat.rfind(")") + 2:].split()
+        if len(fields) > 1 and int(fields[1]) == pid:
+            out.append(int(entry))
+    return out
+
+
+def _kill_children(pid: int) -> None:
+    """
+    SIGKILL группам процессов потомков pid: навык (shell.exec) запускает команды в своей сессии
+    (start_new_session), и kill воркера их не задевает — они остались бы сиротами.
+    """
+    own = os.getpgid(pid) if hasattr(os, "getpgid") else None
+    for cpid in _child_pids(pid):
+        try:
+            pgid = os.getpgid(cpid)
+            if pgid != own:
+                os.killpg(pgid, signal.SIGKILL)
+            else:
+                os.kill(cpid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+# -------------------- код воркера (исполняется в дочернем процессе) --------------------
+
+def _apply_limits(limits: Dict[str, Any]) -> None:
+    """
+    Лимиты на один шаг (мягкие, поверх жёстких лимитов процесса):
+      cpu_seconds — RLIMIT_CPU: уже потраченное воркером время + лимит; превышение — SIGXCPU (воркер умирает);
+      max_rss_mb  — RLIMIT_AS: RLIMIT_RSS в Linux не применяется, поэтому ограничиваем адресное пространство
+                    (аллокации сверх лимита дают MemoryError).
+    """
+    if resource is None:
+        return
+    cpu = limits.get("cpu_seconds")
+    if cpu:
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(used.ru_utime + used.ru_stime) + max(1, int(cpu))
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+    mem = limits.get("max_rss_mb")
+    if mem:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        soft = int(mem) * MB
+        resource.setrlimit(resource.RLIMIT_AS, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+
+
+def _reset_limits() -> None:
+    if resource is None:
+        return
+    for res in (resource.RLIMIT_CPU, resource.RLIMIT_AS):
+        _, hard = resource.getrlimit(res)
+        resource.setrlimit(res, (hard, hard))
+
+
+def _load(modules: Dict[str, Tuple[Any, Optional[int]]], name: str, path: str) -> Any:
+    """Импорт навыка в воркере; перезагрузка, если skill.py изменился после импорта."""
+    try:
+        mtime: Optional[int] = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    cached = modules.get(name)
+    if cached is not None and cached[1] == mtime:
+        return cached[0]
+    mod = importlib.import_module(name)
+    if cached is not None:
+        mod = importlib.reload(mod)
+    modules[name] = (mod, mtime)
+    return mod
+
+
+def _on_terminate(signum, frame) -> None:
+    # таймаут шага: сначала группы процессов, запущенные навыком, затем сам воркер
+    _kill_children(os.getpid())
+    os._exit(128 + signum)
+
+
+def _worker_main(conn, preload: List[Tuple[str, str]]) -> None:
+    """Цикл воркера: (module, path, args, limits) -> ("ok", результат) | ("error", текст)."""
+    if hasattr(signal, "SIGTERM") and os.name == "posix":
+        signal.signal(signal.SIGTERM, _on_terminate)
+    modules: Dict[str, Tuple[Any, Optional[int]]] = {}
+    for name, path in preload:
+        try:
+            _load(modules, name, path)
+        except Exception:
+            pass  # ошибка всплывёт при первом вызове навыка
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg is None:
+            break
+        name, path, args, limits = msg
+        try:
+            fn = getattr(_load(modules, name, path), "run")
+            _apply_limits(limits)
+            try:
+                out = fn(**args)
+            finally:
+                _reset_limits()
+            conn.send(("ok", out))
+        except MemoryError:
+            conn.send(("error", f"memory limit exceeded ({limits.get('max_rss_mb')} MB)"))
+        except BaseException as e:
+            try:
+                conn.send(("error", f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}"))
+            except Exception:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+# -------------------- сторона агента --------------------
+
+class _Worker:
+    def __init__(self, ctx, preload: List[Tuple[str, str]]):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child, preload), daemon=True, name="aideon-skill-worker")
+        self.proc.start()
+        child.close()
+        self.ready = False
+        self.steps = 0
+
+    def wait_ready(self, timeout: float) -> None:
+        if self.ready:
+            return
+        if not self.conn.poll(timeout):
+            raise SkillWorkerError("воркер не запустился")
+        self.conn.recv()
+        self.ready = True
+
+    def kill(self) -> None:
+        """
+        SIGTERM — воркер убивает группы процессов, запущенные навыком, и выходит; через KILL_GRACE
+        оставшихся потомков добиваем отсюда (пока воркер жив, они ещё его дети), затем SIGKILL.
+        """
+        try:
+            if self.proc.is_alive() and os.name == "posix":
+                self.proc.terminate()
+                self.proc.join(timeout=KILL_GRACE)
+                if self.proc.is_alive():
+                    _kill_children(self.proc.pid)
+            self.proc.kill()
+            self.proc.join(timeout=1.0)
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class SkillWorkerPool:
+    """
+    Пул заранее запущенных процессов для навыков: модули навыков импортируются в воркере один раз
+    (при старте), шаги передаются по Pipe. Зависший шаг (timeout) — воркер убивается вместе с группами
+    процессов, запущенными навыком (_Worker.kill), и сразу запускается замена; навык, упавший по лимиту CPU (SIGXCPU) или памяти, не роняет агента.
+
+    Процессы стартуют через forkserver (где есть): сервер держит импортированные модули навыков,
+    поэтому перезапуск воркера — fork уже прогретого интерпретатора, а не новый python.
+
+    Результаты и аргументы навыков должны сериализоваться pickle.
+    """
+    def __init__(
+        self,
+        size: int = 2,
+        preload: Optional[List[Tuple[str, str]]] = None,
+        *,
+        default_limits: Optional[Dict[str, Any]] = None,
+        start_method: Optional[str] = None,
+        start_timeout: float = 30.0,
+    ):
+        self.size = max(1, int(size))
+        self.preload: List[Tuple[str, str]] = list(preload or [])
+        self.default_limits: Dict[str, Any] = dict(default_limits or {})
+        self.start_timeout = float(start_timeout)
+        methods = mp.get_all_start_methods()
+        method = start_method or ("forkserver" if "forkserver" in methods else "spawn")
+        self.ctx = mp.get_context(method)
+        if method == "forkserver":
+            try:
+                self.ctx.set_forkserver_preload(["app.agent.skill_workers"] + [n for n, _ in self.preload])
+            except Exception:
+                pass
+        self._idle: List[_Worker] = []
+        self._all: List[_Worker] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self.restarts = 0
+        for _ in range(self.size):
+            self._spawn()
+        atexit.register(self.close)
+        log_info(f"[SkillWorkerPool] запущено воркеров: {self.size} ({method})")
+
+    def _spawn(self) -> _Worker:
+        w = _Worker(self.ctx, self.preload)
+        with self._cond:
+            self._all.append(w)
+            self._idle.append(w)
+            self._cond.notify()
+        return w
+
+    def _acquire(self, timeout: Optional[float]) -> _Worker:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._idle:
+                if self._closed:
+                    raise SkillWorkerError("пул воркеров закрыт")
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    raise SkillWorkerTimeout("нет свободного воркера")
+                self._cond.wait(left)
+            return self._idle.pop()
+
+    def _release(self, w: _Worker) -> None:
+        with self._cond:
+            self._idle.append(w)
+            self._cond.notify()
+
+    def _replace(self, w: _Worker) -> None:
+        w.kill()
+        with self._cond:
+            if w in self._all:
+                self._all.remove(w)
+            closed = self._closed
+        if not closed:
+            self.restarts += 1
+            self._spawn()
+
+    def call(
+        self,
+        module_name: str,
+        module_path: str,
+        args: Dict[str, Any],
+        *,
+        timeout: Optional[float] = None,
+        limits: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        """Выполнить run(**args) навыка в воркере. Исключения: SkillWorkerTimeout / SkillWorkerError."""
+        step_limits = dict(self.default_limits)
+        step_limits.update(limits or {})
+        w = self._acquire(timeout)
+        try:
+            w.wait_ready(self.start_timeout)
+            w.conn.send((module_name, module_path, args, step_limits))
+            if not w.conn.poll(timeout):
+                raise SkillWorkerTimeout(f"шаг не завершился за {timeout:g}s — воркер перезапущен")
+            status, payload = w.conn.recv()
+        except SkillWorkerTimeout:
+            self._replace(w)
+            raise
+        except (EOFError, OSError, BrokenPipeError) as e:
+            w.proc.join(timeout=1.0)
+            code = w.proc.exitcode
+            self._replace(w)
+            if code is not None and -code == getattr(signal, "SIGXCPU", 0):
+                raise SkillWorkerError(f"CPU limit exceeded ({step_limits.get('cpu_seconds')}s)")
+            raise SkillWorkerError(f"воркер умер (exitcode={code}): {e}")
+        except Exception:
+            self._replace(w)
+            raise
+        w.steps += 1
+        self._release(w)
+        if status != "ok":
+            raise SkillWorkerError(payload)
+        return payload
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "restarts": self.restarts,
+                "pids": [w.proc.pid for w in self._all],
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._all)
+            self._all.clear()
+            self._idle.clear()
+            self._cond.notify_all()
+        for w in workers:
+            try:
+                w.conn.send(None)
+            except Exception:
+                pass
+            w.proc.join(timeout=0.5)
+            if w.proc.is_alive():
+                w.kill()
+        try:
+            atexit.unregister(self.close)
+        except Exception:
+            pass
+        log_info("[SkillWorkerPool] пул остановлен")
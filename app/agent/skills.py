@@ -2,49 +2,178 @@ from __future__ import annotations
 import importlib
 import json
 import os
-from typing import Dict, Any, Callable, Optional, List
+import sys
+import threading
+from typing import Dict, Any, Callable, Optional, List, Tuple
 
 from app.logger import log_info, log_warning, log_error
 
+SKILL_INDEX_PATH = os.path.join("app", "data", "skill_index.json")
+
+# mtime skill.py, с которым модуль импортирован: общий для всех Skill/реестров процесса
+_MODULE_MTIMES: Dict[str, Optional[int]] = {}
+_IMPORT_LOCK = threading.Lock()
+
+
 class Skill:
-    def __init__(self, name: str, fn: Callable[..., Any], manifest: Dict[str, Any], module_path: str):
+    """
+    Навык. Модуль skill.py импортируется лениво — при первом обращении к fn
+    (т.е. при первом запуске из Executor), и перезагружается, если mtime skill.py изменился.
+    """
+    def __init__(
+        self,
+        name: str,
+        fn: Optional[Callable[..., Any]],
+        manifest: Dict[str, Any],
+        module_path: str,
+        module_name: Optional[str] = None,
+    ):
         self.name = name
-        self.fn = fn
         self.manifest = manifest
         self.module_path = module_path  # для дебага/обновлений
+        self.module_name = module_name
+        self._fn = fn
+        self._mtime: Optional[int] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._fn is not None
+
+    @property
+    def fn(self) -> Callable[..., Any]:
+        if self.module_name is None:
+            if self._fn is None:
+                raise AttributeError(f"skill {self.name} has no run()")
+            return self._fn
+        try:
+            mtime = os.stat(self.module_path).st_mtime_ns
+        except OSError:
+            mtime = self._mtime
+        if self._fn is None or mtime != self._mtime:
+            with _IMPORT_LOCK:
+                if self._fn is None or mtime != self._mtime:
+                    self._import(mtime)
+        return self._fn  # type: ignore[return-value]
+
+    def _import(self, mtime: Optional[int]) -> None:
+        name = self.module_name or ""
+        # модуль уже импортирован со старой версией файла — перечитываем
+        reload = name in sys.modules and name in _MODULE_MTIMES and _MODULE_MTIMES[name] != mtime
+        mod = importlib.import_module(name)
+        if reload:
+            mod = importlib.reload(mod)
+        _MODULE_MTIMES[name] = mtime
+        run = getattr(mod, "run", None)
+        if not callable(run):
+            raise AttributeError(f"в {self.module_path} нет функции run(**kwargs)")
+        self._fn = run
+        self._mtime = mtime
+        log_info(f"[SkillRegistry] {'перезагружен' if reload else 'импортирован'} навык: {self.name}")
+
 
 class SkillRegistry:
     """
-    Регистр навыков. Загружает скиллы из app/skills/<skill_name>/{manifest.json, skill.py}
+    Регистр навыков из app/skills/<skill_name>/{manifest.json, skill.py}.
+
+    load() не импортирует модули: строит индекс имя -> (манифест, модуль, mtime),
+    манифесты с неизменным mtime берутся из дискового индекса (SKILL_INDEX_PATH) без разбора JSON.
+    Модуль импортируется при первом запуске навыка (Skill.fn) и перезагружается при смене mtime.
     """
-    def __init__(self, root: str = "app/skills"):
+    def __init__(self, root: str = "app/skills", index_path: Optional[str] = SKILL_INDEX_PATH):
         self.root = root
+        self.index_path = index_path
         self.skills: Dict[str, Skill] = {}
 
+    # ---------- дисковый индекс манифестов ----------
+
+    def _read_index(self) -> Dict[str, Any]:
+        if not self.index_path or not os.path.isfile(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            log_warning(f"[SkillRegistry] индекс навыков не прочитан ({e}), пересобираю")
+            return {}
+        if data.get("root") != os.path.abspath(self.root):
+            return {}
+        return data.get("skills") or {}
+
+    def _write_index(self, entries: Dict[str, Any]) -> None:
+        if not self.index_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            tmp = f"{self.index_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"root": os.path.abspath(self.root), "skills": entries}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.index_path)
+        except Exception as e:
+            log_warning(f"[SkillRegistry] индекс навыков не сохранён: {e}")
+
+    # ---------- загрузка ----------
+
     def load(self) -> None:
         if not os.path.isdir(self.root):
             log_warning(f"[SkillRegistry] нет директории {self.root}")
             return
+        cached = self._read_index()
+        entries: Dict[str, Any] = {}
+        parsed = 0
         for d in sorted(os.listdir(self.root)):
             skill_dir = os.path.join(self.root, d)
             man = os.path.join(skill_dir, "manifest.json")
             imp = os.path.join(skill_dir, "skill.py")
-            if os.path.isfile(man) and os.path.isfile(imp):
-                try:
+            try:
+                man_mtime = os.stat(man).st_mtime_ns
+                os.stat(imp)
+            except OSError:
+                continue
+            try:
+                entry = cached.get(d)
+                if not entry or entry.get("manifest_mtime") != man_mtime:
                     with open(man, "r", encoding="utf-8") as f:
                         m = json.load(f)
-                    mod = importlib.import_module(f"app.skills.{d}.skill")
-                    if not hasattr(mod, "run"):
-                        log_warning(f"[SkillRegistry] в {imp} нет функции run(**kwargs)")
-                        continue
-                    name = m.get("name") or d
-                    self.skills[name] = Skill(name, getattr(mod, "run"), m, imp)
-                    log_info(f"[SkillRegistry] зарегистрирован навык: {name}")
-                except Exception as e:
-                    log_error(f"[SkillRegistry] ошибка загрузки {d}: {e}")
+                    entry = {"name": m.get("name") or d, "manifest": m, "manifest_mtime": man_mtime}
+                    parsed += 1
+                entries[d] = entry
+                name = entry["name"]
+                prev = self.skills.get(name)
+                if prev is not None and prev.module_path == imp and prev.manifest == entry["manifest"]:
+                    continue  # уже зарегистрирован (и, возможно, импортирован) — не сбрасываем
+                self.skills[name] = Skill(name, None, entry["manifest"], imp, module_name=f"app.skills.{d}.skill")
+                log_info(f"[SkillRegistry] зарегистрирован навык: {name}")
+            except Exception as e:
+                log_error(f"[SkillRegistry] ошибка загрузки {d}: {e}")
+        # навыки, чьи каталоги исчезли
+        alive = {e["name"] for e in entries.values()}
+        for name in [n for n in self.skills if n not in alive]:
+            del self.skills[name]
+        if parsed or set(entries) != set(cached):
+            self._write_index(entries)
+
+    def fingerprint(self) -> Tuple[Any, ...]:
+        """
+        Дешёвый отпечаток набора навыков: mtime каталога навыков и mtime каждого
+        manifest.json/skill.py (только stat, без чтения и импорта). Изменился — пора перезагрузить.
+        """
+        try:
+            root_mtime = os.stat(self.root).st_mtime_ns
+            names = sorted(os.listdir(self.root))
+        except OSError:
+            return ()
+        parts: List[Any] = [root_mtime]
+        for d in names:
+            skill_dir = os.path.join(self.root, d)
+            for fn in ("manifest.json", "skill.py"):
+                try:
+                    parts.append((d, fn, os.stat(os.path.join(skill_dir, fn)).st_mtime_ns))
+                except OSError:
+                    continue
+        return tuple(parts)
 
     def get(self, name: str) -> Optional[Skill]:
         return self.skills.get(name)
 
     def list(self) -> List[str]:
-        return list(self.skills.keys())
\ No newline at end of file
+        return list(self.skills.keys())
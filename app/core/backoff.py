@@ -0,0 +1,55 @@
+# app/core/backoff.py
+from __future__ import annotations
+
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class BackoffPolicy:
+    """
+    Общая политика пауз между повторами (экспоненциальный backoff + jitter).
+
+    Используется всеми местами, где есть ретраи к модели:
+    CodeAnalyzer._chat_call, AIBugFixer.iterative_fix_cycle и т.д.
+
+    delay(attempt) = min(max_delay, base_delay * factor ** (attempt - 1)) ± jitter
+    attempt считается с 1.
+    """
+    base_delay: float = 1.5
+    factor: float = 2.0
+    max_delay: float = 20.0
+    jitter: float = 0.1  # доля от задержки (0.1 = ±10%)
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None) -> "BackoffPolicy":
+        """
+        Ключи конфига: backoff_base_delay, backoff_factor, backoff_max_delay, backoff_jitter.
+        """
+        cfg = config or {}
+        dflt = cls()
+        return cls(
+            base_delay=float(cfg.get("backoff_base_delay", dflt.base_delay)),
+            factor=float(cfg.get("backoff_factor", dflt.factor)),
+            max_delay=float(cfg.get("backoff_max_delay", dflt.max_delay)),
+            jitter=float(cfg.get("backoff_jitter", dflt.jitter)),
+        )
+
+    def delay(self, attempt: int) -> float:
+        attempt = max(1, int(attempt))
+        d = min(self.max_delay, self.base_delay * (self.factor ** (attempt - 1)))
+        if self.jitter > 0 and d > 0:
+            d += d * random.uniform(-self.jitter, self.jitter)
+        return max(0.0, d)
+
+    def sleep(self, attempt: int) -> float:
+        """Спит delay(attempt) секунд и возвращает фактическую задержку."""
+        d = self.delay(attempt)
+        if d > 0:
+            time.sleep(d)
+        return d
+
+
+__all__ = ["BackoffPolicy"]
@@ -0,0 +1,360 @@
+# app/core/backup_store.py
+from __future__ import annotations
+
+import hashlib
+import lzma
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from app.logger import log_info, log_warning, log_error
+
+PathLike = Union[str, os.PathLike]
+
+CODECS = ("zlib", "lzma")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    id     INTEGER PRIMARY KEY AUTOINCREMENT,
+    path   TEXT NOT NULL,
+    ts     REAL NOT NULL,
+    hash   TEXT NOT NULL,
+    size   INTEGER NOT NULL,
+    codec  TEXT NOT NULL,
+    label  TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS ix_backups_path_ts ON backups(path, ts);
+CREATE INDEX IF NOT EXISTS ix_backups_hash ON backups(hash);
+CREATE TABLE IF NOT EXISTS pins (
+    hash   TEXT NOT NULL,
+    owner  TEXT NOT NULL,
+    PRIMARY KEY (hash, owner)
+);
+"""
+
+
+@dataclass
+class BackupRecord:
+    """Строка индекса: версия файла path на момент ts с содержимым hash (sha256)."""
+    id: int
+    path: str
+    ts: float
+    hash: str
+    size: int
+    codec: str
+    label: str = ""
+
+
+def _repo_root() -> Path:
+    return Path(__file__).resolve().parents[2]
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "lzma":
+        return lzma.compress(data, preset=6)
+    return zlib.compress(data, 6)
+
+
+def _decompress(blob: bytes, codec: str) -> bytes:
+    if codec == "lzma":
+        return lzma.decompress(blob)
+    return zlib.decompress(blob)
+
+
+class BackupStore:
+    """
+    Единое хранилище бэкапов с адресацией по содержимому.
+
+    - objects/<aa>/<sha256>.<codec> — сжатые блобы; одинаковое содержимое хранится один раз
+      (дедуп между версиями и между файлами);
+    - index.sqlite — индекс (path, ts, hash) для быстрого поиска/восстановления;
+    - повторный put той же версии файла новую запись не создаёт;
+    - gc(): ретеншн по числу версий на путь и по возрасту + удаление осиротевших блобов.
+    """
+
+    def __init__(
+        self,
+        root: PathLike,
+        *,
+        codec: str = "zlib",
+        keep_per_path: int = 20,
+        max_age_days: Optional[float] = 30,
+        auto_gc_every: int = 200,
+    ):
+        self.root = Path(root).expanduser().resolve()
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.codec = codec if codec in CODECS else "zlib"
+        self.keep_per_path = max(1, int(keep_per_path))
+        self.max_age_days = max_age_days
+        self.auto_gc_every = max(0, int(auto_gc_every))
+        self._puts = 0
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(self.root / "index.sqlite"), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    # ---------- запись ----------
+
+    def put(self, path: PathLike, data: Optional[bytes] = None, *, label: str = "") -> Optional[BackupRecord]:
+        """
+        Сохраняет версию файла. data=None — читаем текущее содержимое с диска
+        (если файла нет — None). Возвращает запись индекса.
+        """
+        key = self._key(path)
+        if data is None:
+            try:
+                data = Path(key).read_bytes()
+            except FileNotFoundError:
+                return None
+        digest = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            last = self.latest(key)
+            if last is not None and last.hash == digest:
+                return last  # та же версия уже в индексе (например, FileManager + CodePatcher)
+
+            codec = self._write_object(digest, data)
+            cur = self._db.execute(
+                "INSERT INTO backups(path, ts, hash, size, codec, label) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, time.time(), digest, len(data), codec, label or ""),
+            )
+            self._db.commit()
+            rec = self._get(int(cur.lastrowid))
+            self._puts += 1
+            if self.auto_gc_every and self._puts % self.auto_gc_every == 0:
+                self.gc()
+        log_info(f"[BackupStore] 🧯 {key} -> {digest[:12]} ({len(data)} B, {codec})")
+        return rec
+
+    def put_blob(self, data: bytes, *, pin: Optional[str] = None) -> str:
+        """
+        Кладёт блоб без записи в индекс путей (например, новая версия файла из набора патчей).
+        pin — владелец: пока закреплён, gc блоб не удалит. Возвращает sha256.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._write_object(digest, data)
+            if pin:
+                self.pin(digest, pin)
+        return digest
+
+    def pin(self, digest: str, owner: str) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO pins(hash, owner) VALUES (?, ?)", (digest, owner))
+            self._db.commit()
+
+    def unpin(self, owner: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM pins WHERE owner = ?", (owner,))
+            self._db.commit()
+
+    def _object_path(self, digest: str, codec: str) -> Path:
+        return self.objects_dir / digest[:2] / f"{digest}.{codec}"
+
+    def _find_object(self, digest: str) -> Optional[Path]:
+        for codec in CODECS:
+            p = self._object_path(digest, codec)
+            if p.exists():
+                return p
+        return None
+
+    def _write_object(self, digest: str, data: bytes) -> str:
+        existing = self._find_object(digest)
+        if existing is not None:
+            return existing.suffix.lstrip(".")
+        target = self._object_path(digest, self.codec)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=str(target.parent))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_compress(data, self.codec))
+            os.replace(tmp, target)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        return self.codec
+
+    # ---------- чтение ----------
+
+    def read(self, record_or_hash: Union[BackupRecord, str]) -> bytes:
+        digest = record_or_hash.hash if isinstance(record_or_hash, BackupRecord) else str(record_or_hash)
+        p = self._find_object(digest)
+        if p is None:
+            raise FileNotFoundError(f"backup object {digest} not found")
+        return _decompress(p.read_bytes(), p.suffix.lstrip("."))
+
+    def object_path(self, record: BackupRecord) -> Optional[str]:
+        p = self._find_object(record.hash)
+        return str(p) if p else None
+
+    def latest(self, path: PathLike) -> Optional[BackupRecord]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, path, ts, hash, size, codec, label FROM backups WHERE path = ? ORDER BY ts DESC, id DESC LIMIT 1",
+                (self._key(path),),
+            ).fetchone()
+        return BackupRecord(*row) if row else None
+
+    def find(self, path: PathLike, digest: str) -> Optional[BackupRecord]:
+        """Последняя запись для path с заданным содержимым (sha256)."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, path, ts, hash, size, codec, label FROM backups WHERE path = ? AND hash = ? "
+                "ORDER BY ts DESC, id DESC LIMIT 1",
+                (self._key(path), digest),
+            ).fetchone()
+        return BackupRecord(*row) if row else None
+
+    def history(self, path: PathLike, limit: int = 50) -> List[BackupRecord]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, path, ts, hash, size, codec, label FROM backups WHERE path = ? ORDER BY ts DESC, id DESC LIMIT ?",
+                (self._key(path), int(limit)),
+            ).fetchall()
+        return [BackupRecord(*r) for r in rows]
+
+    def _get(self, rec_id: int) -> Optional[BackupRecord]:
+        row = self._db.execute(
+            "SELECT id, path, ts, hash, size, codec, label FROM backups WHERE id = ?", (rec_id,)
+        ).fetchone()
+        return BackupRecord(*row) if row else None
+
+    # ---------- восстановление ----------
+
+    def restore(
+        self,
+        path: PathLike,
+        record: Optional[BackupRecord] = None,
+        *,
+        target: Optional[PathLike] = None,
+        backup_current: bool = True,
+    ) -> Optional[BackupRecord]:
+        """
+        Восстанавливает файл из бэкапа (по умолчанию — последняя версия path).
+        backup_current=True — текущее содержимое сначала сохраняется в хранилище,
+        так что откат тоже можно откатить. Возвращает восстановленную запись или None.
+        """
+        rec = record or self.latest(path)
+        if rec is None:
+            log_warning(f"[BackupStore] нет бэкапа для {path}")
+            return None
+        data = self.read(rec)
+        dst = Path(target) if target is not None else Path(self._key(path))
+        if backup_current and dst.exists():
+            self.put(dst, label="pre-restore")
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".aideon_tmp_", dir=str(dst.parent))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, dst)
+        except Exception as e:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            log_error(f"[BackupStore] restore failed for {dst}: {e}")
+            raise
+        log_info(f"[BackupStore] ↩️ {dst} <- {rec.hash[:12]} ({time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(rec.ts))})")
+        return rec
+
+    # ---------- ретеншн ----------
+
+    def gc(self, *, keep_per_path: Optional[int] = None, max_age_days: Optional[float] = None) -> Dict[str, int]:
+        """
+        Удаляет записи сверх keep_per_path на путь и старше max_age_days
+        (последняя версия каждого пути сохраняется всегда), затем — блобы,
+        на которые не ссылаются ни индекс, ни закрепления (pins).
+        """
+        keep = max(1, int(keep_per_path if keep_per_path is not None else self.keep_per_path))
+        age = self.max_age_days if max_age_days is None else max_age_days
+        with self._lock:
+            removed = self._db.execute(
+                "DELETE FROM backups WHERE id IN ("
+                " SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY path ORDER BY ts DESC, id DESC) AS rn"
+                " FROM backups) WHERE rn > ?)",
+                (keep,),
+            ).rowcount
+            if age is not None and age > 0:
+                cutoff = time.time() - float(age) * 86400
+                removed += self._db.execute(
+                    "DELETE FROM backups WHERE ts < ? AND id NOT IN (SELECT MAX(id) FROM backups GROUP BY path)",
+                    (cutoff,),
+                ).rowcount
+            self._db.commit()
+            live = {r[0] for r in self._db.execute("SELECT hash FROM backups UNION SELECT hash FROM pins")}
+
+            objects = 0
+            for sub in self.objects_dir.iterdir():
+                if not sub.is_dir():
+                    continue
+                for obj in sub.iterdir():
+                    if obj.name.startswith(".tmp_"):
+                        continue
+                    if obj.name.split(".", 1)[0] not in live:
+                        try:
+                            obj.unlink()
+                            objects += 1
+                        except OSError:
+                            pass
+        if removed or objects:
+            log_info(f"[BackupStore] gc: записей -{removed}, блобов -{objects}")
+        return {"records": removed, "objects": objects}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            records, paths, raw = self._db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT path), COALESCE(SUM(size), 0) FROM backups"
+            ).fetchone()
+        stored = sum(p.stat().st_size for p in self.objects_dir.glob("*/*") if p.is_file())
+        return {"records": records, "paths": paths, "raw_bytes": raw, "stored_bytes": stored}
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._db.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _key(path: PathLike) -> str:
+        return str(Path(path).expanduser().resolve())
+
+
+# ---------- общий экземпляр на корень ----------
+
+_STORES: Dict[str, BackupStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def default_backup_root() -> Path:
+    return _repo_root() / ".aideon_backups"
+
+
+def get_backup_store(root: Optional[PathLike] = None, **kwargs) -> BackupStore:
+    """
+    Один BackupStore на корень (по умолчанию <repo_root>/.aideon_backups):
+    FileManager, CodePatcher, CodeFixer и панели UI пишут в одно хранилище.
+    kwargs учитываются только при первом создании.
+    """
+    key = str(Path(root).expanduser().resolve()) if root is not None else str(default_backup_root())
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = BackupStore(key, **kwargs)
+            _STORES[key] = store
+        return store
+
+
+__all__ = ["BackupRecord", "BackupStore", "get_backup_store", "default_backup_root"]
@@ -0,0 +1,451 @@
+# app/core/code_index.py
+"""
+Триграммный индекс кода для поиска по проекту (навык fs.search).
+
+Индекс (sqlite в app/data/code_index/<sha1(root)>.sqlite — в проекте, а не в индексируемом дереве)
+хранит для каждого текстового файла множество триграмм (байтовых, в нижнем регистре) и
+(mtime_ns, size). Перед поиском индекс синхронизируется по mtime: переиндексируются только
+изменённые файлы, удалённые — вычищаются.
+
+Поиск:
+  1) из запроса (литерал или regex) извлекаются обязательные подстроки → их триграммы;
+  2) кандидаты — пересечение списков файлов по триграммам (для regex без обязательных
+     подстрок — все файлы);
+  3) проверка кандидатов — точным поиском по содержимому, для больших наборов —
+     в пуле процессов; совпадения отдаются по мере готовности (search_iter) до лимита.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+from array import array
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+try:  # разбор regex (3.11+: re._parser, раньше — sre_parse)
+    from re import _parser as _sre_parse  # type: ignore[attr-defined]
+    from re import _constants as _sre_const  # type: ignore[attr-defined]
+except Exception:  # pragma: no cover
+    import sre_parse as _sre_parse  # type: ignore[no-redef]
+    import sre_constants as _sre_const  # type: ignore[no-redef]
+
+from app.core.file_manager import TREE_IGNORE_DIRS
+from app.logger import log_info, log_warning
+
+PathLike = Union[str, os.PathLike]
+
+INDEX_DIR = "app/data/code_index"   # базы индексов всех корней (относительно проекта)
+INDEX_EXTS = (
+    ".py", ".pyi", ".md", ".txt", ".rst", ".json", ".toml", ".yml", ".yaml", ".cfg", ".ini",
+    ".js", ".ts", ".tsx", ".html", ".css", ".sh", ".sql",
+)
+INDEX_IGNORE_DIRS = TREE_IGNORE_DIRS
+MAX_FILE_BYTES = 1 << 20          # большие файлы (лог, дамп) не индексируем
+SYNC_INTERVAL = 2.0               # sync() без force: не чаще раза в N секунд (fs.search — всегда force)
+PARALLEL_MIN_FILES = 200          # меньше кандидатов — проверяем в текущем процессе
+VERIFY_BATCH = 64                 # файлов на задачу пула
+INDEX_BATCH = 1000                # файлов на транзакционную пачку вставок
+MAX_LINE_CHARS = 300
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id       INTEGER PRIMARY KEY,
+    path     TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL,
+    size     INTEGER NOT NULL,
+    tris     BLOB                  -- array('I') триграмм файла: точечное удаление постингов
+);
+CREATE TABLE IF NOT EXISTS trigrams (
+    tri      INTEGER NOT NULL,
+    file_id  INTEGER NOT NULL,
+    PRIMARY KEY (tri, file_id)
+) WITHOUT ROWID;
+"""
+
+
+@dataclass
+class SearchMatch:
+    path: str        # относительно корня индекса, через '/'
+    line: int        # 1-based
+    text: str
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"path": self.path, "line": self.line, "text": self.text}
+
+
+# -------------------- триграммы --------------------
+
+def _trigrams(data: bytes) -> Set[int]:
+    low = data.lower()
+    return {(a << 16) | (b << 8) | c for a, b, c in set(zip(low, low[1:], low[2:]))}
+
+
+def _file_trigrams(root: str, rel_paths: Sequence[str]) -> List[Tuple[str, Optional[bytes]]]:
+    """(rel, array('I') триграмм в байтах | None для нечитаемых/бинарных) — исполняется и в воркерах."""
+    out: List[Tuple[str, Optional[bytes]]] = []
+    for rel in rel_paths:
+        try:
+            with open(os.path.join(root, rel), "rb") as f:
+                data = f.read()
+        except OSError:
+            out.append((rel, None))
+            continue
+        if b"\0" in data[:8192]:
+            out.append((rel, None))  # бинарный
+            continue
+        out.append((rel, array("I", sorted(_trigrams(data))).tobytes()))
+    return out
+
+
+def _required_literals(pattern: str, flags: int = 0) -> Optional[List[str]]:
+    """
+    Подстроки, которые обязаны встретиться в любом совпадении regex (AND).
+    None — regex не разобран; [] — обязательных подстрок нет (нужен полный перебор).
+    Альтернативы, необязательные и повторяемые части разрывают подстроку.
+    """
+    try:
+        parsed = _sre_parse.parse(pattern, flags)
+    except Exception:
+        return None
+    out: List[str] = []
+
+    def walk(items) -> None:
+        run: List[str] = []
+
+        def flush() -> None:
+            if len(run) >= 3:
+                out.append("".join(run))
+            run.clear()
+
+        for op, av in items:
+            if op is _sre_const.LITERAL:
+                run.append(chr(av))
+            elif op is _sre_const.SUBPATTERN:
+                flush()
+                walk(av[-1])
+            elif op in (_sre_const.MAX_REPEAT, _sre_const.MIN_REPEAT) and av[0] >= 1:
+                flush()
+                walk(av[2])  # тело повторяется хотя бы раз
+            elif op in (_sre_const.AT,):
+                continue  # ^, $, \b — нулевой ширины, подстроку не разрывают
+            else:
+                flush()
+        flush()
+
+    walk(parsed)
+    if parsed.state.flags & re.IGNORECASE:
+        # триграммы индекса без учёта регистра только для ASCII
+        out = [lit for lit in out if lit.isascii()]
+    return out
+
+
+# -------------------- проверка кандидатов (в т.ч. в воркерах) --------------------
+
+def _verify_files(
+    root: str,
+    rel_paths: Sequence[str],
+    pattern: str,
+    regex: bool,
+    ignore_case: bool,
+    per_file: int,
+) -> List[Tuple[str, int, str]]:
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    rx = re.compile(pattern if regex else re.escape(pattern), flags)
+    found: List[Tuple[str, int, str]] = []
+    for rel in rel_paths:
+        try:
+            with open(os.path.join(root, rel), "rb") as f:
+                text = f.read().decode("utf-8", errors="replace")
+        except OSError:
+            continue
+        line_no, pos, n = 1, 0, 0
+        last_line = -1
+        for m in rx.finditer(text):
+            line_no += text.count("\n", pos, m.start())
+            pos = m.start()
+            if line_no == last_line:
+                continue
+            last_line = line_no
+            start = text.rfind("\n", 0, m.start()) + 1
+            end = text.find("\n", m.start())
+            line = text[start:end if end >= 0 else len(text)].rstrip("\r")
+            found.append((rel, line_no, line[:MAX_LINE_CHARS]))
+            n += 1
+            if n >= per_file:
+                break
+    return found
+
+
+# -------------------- индекс --------------------
+
+def default_db_path(root: PathLike) -> str:
+    """База индекса корня root — в INDEX_DIR проекта: в индексируемое дерево ничего не пишем."""
+    key = hashlib.sha1(str(Path(root).expanduser().resolve()).encode("utf-8")).hexdigest()[:16]
+    return os.path.abspath(os.path.join(INDEX_DIR, f"{key}.sqlite"))
+
+
+class CodeIndex:
+    """Постоянный триграммный индекс текстовых файлов под root (см. описание модуля)."""
+
+    def __init__(
+        self,
+        root: PathLike,
+        db_path: Optional[PathLike] = None,
+        *,
+        exts: Sequence[str] = INDEX_EXTS,
+        max_workers: Optional[int] = None,
+    ):
+        self.root = str(Path(root).expanduser().resolve())
+        self.db_path = str(db_path or default_db_path(self.root))
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.exts = tuple(exts)
+        self.max_workers = max(1, int(max_workers or min(4, os.cpu_count() or 2)))
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._synced_at = 0.0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    # ---------- синхронизация ----------
+
+    def _walk(self) -> Dict[str, Tuple[int, int]]:
+        """rel_path -> (mtime_ns, size) для индексируемых файлов (scandir, без resolve)."""
+        out: Dict[str, Tuple[int, int]] = {}
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                it = os.scandir(os.path.join(self.root, rel_dir) if rel_dir else self.root)
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in INDEX_IGNORE_DIRS:
+                                stack.append(rel)
+                        elif entry.name.endswith(self.exts) and entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            if st.st_size <= MAX_FILE_BYTES:
+                                out[rel] = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        continue
+        return out
+
+    def sync(self, force: bool = False) -> Dict[str, int]:
+        """Привести индекс к диску по mtime/size. Возвращает счётчики added/updated/removed."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._synced_at < SYNC_INTERVAL:
+                return {"added": 0, "updated": 0, "removed": 0}
+            on_disk = self._walk()
+            known = {p: (fid, m, sz) for fid, p, m, sz in self._conn.execute("SELECT id, path, mtime_ns, size FROM files")}
+            stats = {"added": 0, "updated": 0, "removed": 0}
+            removed = [known[rel][0] for rel in known.keys() - on_disk.keys()]
+            changed = [
+                rel for rel, (mtime, size) in on_disk.items()
+                if rel not in known or known[rel][1] != mtime or known[rel][2] != size
+            ]
+            with self._conn:
+                for fid in removed:
+                    self._drop_postings(fid)
+                    self._conn.execute("DELETE FROM files WHERE id=?", (fid,))
+                stats["removed"] = len(removed)
+            for i in range(0, len(changed), INDEX_BATCH):
+                batch = self._extract(changed[i:i + INDEX_BATCH])
+                pairs: List[Tuple[int, int]] = []
+                with self._conn:
+                    for rel, blob in batch:
+                        mtime, size = on_disk[rel]
+                        old = known.get(rel)
+                        if old is not None:
+                            self._drop_postings(old[0])
+                        if blob is None:
+                            if old is not None:
+                                self._conn.execute("DELETE FROM files WHERE id=?", (old[0],))
+                            continue
+                        if old is None:
+                            fid = self._conn.execute(
+                                "INSERT INTO files(path, mtime_ns, size, tris) VALUES (?,?,?,?)", (rel, mtime, size, blob)
+                            ).lastrowid
+                            stats["added"] += 1
+                        else:
+                            fid = old[0]
+                            self._conn.execute(
+                                "UPDATE files SET mtime_ns=?, size=?, tris=? WHERE id=?", (mtime, size, blob, fid)
+                            )
+                            stats["updated"] += 1
+                        pairs.extend((t, fid) for t in array("I", blob))
+                    # вставка в порядке первичного ключа — последовательная запись в B-дерево
+                    pairs.sort()
+                    self._conn.executemany("INSERT OR IGNORE INTO trigrams(tri, file_id) VALUES (?,?)", pairs)
+            self._synced_at = time.monotonic()
+            if any(stats.values()):
+                log_info(f"[CodeIndex] {self.root}: +{stats['added']} ~{stats['updated']} -{stats['removed']} "
+                         f"за {(self._synced_at - now) * 1000:.0f} ms")
+            return stats
+
+    def _drop_postings(self, fid: int) -> None:
+        row = self._conn.execute("SELECT tris FROM files WHERE id=?", (fid,)).fetchone()
+        if row and row[0]:
+            self._conn.executemany(
+                "DELETE FROM trigrams WHERE tri=? AND file_id=?", ((t, fid) for t in array("I", row[0]))
+            )
+
+    def _extract(self, rel_paths: List[str]) -> List[Tuple[str, Optional[bytes]]]:
+        """Триграммы файлов; большие пачки — параллельно в пуле процессов."""
+        pool = self._get_pool() if len(rel_paths) >= PARALLEL_MIN_FILES and self.max_workers > 1 else None
+        if pool is None:
+            return _file_trigrams(self.root, rel_paths)
+        chunk = max(VERIFY_BATCH, len(rel_paths) // (self.max_workers * 4))
+        futures = [pool.submit(_file_trigrams, self.root, rel_paths[i:i + chunk])
+                   for i in range(0, len(rel_paths), chunk)]
+        return [item for fut in futures for item in fut.result()]
+
+    # ---------- кандидаты ----------
+
+    def candidates(self, query: str, regex: bool = False, ignore_case: bool = False) -> Tuple[List[str], bool]:
+        """(пути-кандидаты, использован ли индекс). Без обязательных триграмм — все файлы."""
+        if regex:
+            literals = _required_literals(query, re.IGNORECASE if ignore_case else 0)
+        else:
+            literals = [query] if len(query) >= 3 and (query.isascii() or not ignore_case) else []
+        tris: Set[int] = set()
+        for lit in literals or []:
+            tris |= _trigrams(lit.encode("utf-8"))
+        with self._lock:
+            if not tris:
+                return [p for (p,) in self._conn.execute("SELECT path FROM files ORDER BY path")], False
+            # от самой редкой триграммы к частым: пересечение быстро становится маленьким
+            counts = []
+            for t in tris:
+                (n,) = self._conn.execute("SELECT COUNT(*) FROM trigrams WHERE tri=?", (t,)).fetchone()
+                if n == 0:
+                    return [], True
+                counts.append((n, t))
+            ids: Optional[Set[int]] = None
+            for _, t in sorted(counts):
+                rows = {fid for (fid,) in self._conn.execute("SELECT file_id FROM trigrams WHERE tri=?", (t,))}
+                ids = rows if ids is None else ids & rows
+                if not ids:
+                    return [], True
+            paths: List[str] = []
+            id_list = sorted(ids or ())
+            for i in range(0, len(id_list), 500):
+                chunk = id_list[i:i + 500]
+                paths += [p for (p,) in self._conn.execute(
+                    f"SELECT path FROM files WHERE id IN ({','.join('?' * len(chunk))})", chunk)]
+            return sorted(paths), True
+
+    # ---------- поиск ----------
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self._pool is None:
+            try:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            except Exception as e:
+                log_warning(f"[CodeIndex] Пул процессов недоступен ({e}), проверяю в текущем процессе")
+                self.max_workers = 1
+        return self._pool
+
+    def search_iter(
+        self,
+        query: str,
+        *,
+        regex: bool = False,
+        ignore_case: bool = False,
+        path_prefix: str = "",
+        max_results: int = 100,
+        per_file: int = 20,
+        stats: Optional[Dict[str, object]] = None,
+    ) -> Iterator[SearchMatch]:
+        """
+        Совпадения по мере готовности (порядок между файлами не гарантирован), не больше max_results.
+        stats (если передан) заполняется: candidates, files_total, indexed, elapsed_ms.
+        """
+        started = time.perf_counter()
+        if regex:
+            re.compile(query)  # ошибка в regex — сразу, до синхронизации и пула
+        self.sync()
+        paths, indexed = self.candidates(query, regex=regex, ignore_case=ignore_case)
+        prefix = path_prefix.strip("/")
+        if prefix and prefix != ".":
+            paths = [p for p in paths if p == prefix or p.startswith(prefix + "/")]
+        if stats is not None:
+            stats.update({"candidates": len(paths), "indexed": indexed})
+
+        emitted = 0
+        try:
+            pool = self._get_pool() if len(paths) >= PARALLEL_MIN_FILES and self.max_workers > 1 else None
+            if pool is None:
+                for i in range(0, len(paths), VERIFY_BATCH):
+                    for rel, line, text in _verify_files(self.root, paths[i:i + VERIFY_BATCH], query, regex,
+                                                         ignore_case, per_file):
+                        yield SearchMatch(rel, line, text)
+                        emitted += 1
+                        if emitted >= max_results:
+                            return
+                return
+            pending = {
+                pool.submit(_verify_files, self.root, paths[i:i + VERIFY_BATCH], query, regex, ignore_case, per_file)
+                for i in range(0, len(paths), VERIFY_BATCH)
+            }
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        for rel, line, text in fut.result():
+                            yield SearchMatch(rel, line, text)
+                            emitted += 1
+                            if emitted >= max_results:
+                                return
+            finally:
+                for fut in pending:
+                    fut.cancel()
+        finally:
+            if stats is not None:
+                stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def search(self, query: str, **kwargs) -> List[SearchMatch]:
+        return list(self.search_iter(query, **kwargs))
+
+    def file_count(self) -> int:
+        with self._lock:
+            (n,) = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()
+        return int(n)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            self._conn.close()
+
+
+# ---------- общий экземпляр на корень ----------
+
+_INDEXES: Dict[str, CodeIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_code_index(root: PathLike = ".", **kwargs) -> CodeIndex:
+    """Один CodeIndex на корень (kwargs учитываются только при первом создании)."""
+    key = str(Path(root).expanduser().resolve())
+    with _INDEXES_LOCK:
+        idx = _INDEXES.get(key)
+        if idx is None:
+            idx = CodeIndex(key, **kwargs)
+            _INDEXES[key] = idx
+        return idx
+
+
+__all__ = ["CodeIndex", "SearchMatch", "default_db_path", "get_code_index"]
@@ -3,13 +3,19 @@ from __future__ import annotations
 
 import hashlib
 import io
+import mmap
 import os
 import shutil
 import tempfile
-from dataclasses import dataclass
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, List, Optional, Union
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
+from app.core.backup_store import BackupRecord, get_backup_store
 from app.logger import log_info, log_warning, log_error
 
 
@@ -21,10 +27,70 @@ class FileManagerConfig:
     backups_dirname: str = ".aideon_backups"
     create_missing_dirs: bool = True
     atomic_write: bool = True
+    path_cache_size: int = 4096                         # LRU разрешённых путей (0 — без кэша)
+
+
+HASH_BUFFER_SIZE = 1 << 20      # 1 MiB: буфер readinto для хэширования без file_digest
+TAIL_DEFAULT_BYTES = 64 * 1024
+
+# дерево проекта: служебные каталоги не показываем модели
+TREE_IGNORE_DIRS = frozenset({
+    ".git", "__pycache__", ".aideon_backups", "venv", ".venv", "env", "node_modules",
+    ".mypy_cache", ".pytest_cache", ".idea", ".vscode",
+})
+TREE_IGNORE_SUFFIXES = (".pyc", ".pyo")
+TREE_CHECK_INTERVAL = 2.0       # не чаще раза в N секунд сверяем mtime каталогов
+TREE_RENDER_MAX_CHARS = 6000
 
 
 # ---------- вспомогательные ----------
 
+def _digest_fileobj(f: BinaryIO, algo: str = "sha256") -> str:
+    """hashlib.file_digest (3.11+, хэширует без копий в Python) или readinto в один большой буфер."""
+    if hasattr(hashlib, "file_digest"):
+        return hashlib.file_digest(f, algo).hexdigest()  # type: ignore[attr-defined]
+    h = hashlib.new(algo)
+    buf = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buf)
+    while True:
+        n = f.readinto(buf)  # type: ignore[attr-defined]
+        if not n:
+            break
+        h.update(view[:n])
+    return h.hexdigest()
+
+
+def file_digest(path: Union[str, os.PathLike], algo: str = "sha256") -> str:
+    """Хэш файла потоково (без чтения целиком и без 8 KB-цикла на Python)."""
+    with open(path, "rb", buffering=0) as f:
+        return _digest_fileobj(f, algo)
+
+
+def read_tail(
+    path: Union[str, os.PathLike],
+    max_bytes: int = TAIL_DEFAULT_BYTES,
+    *,
+    lines: Optional[int] = None,
+    encoding: str = "utf-8",
+) -> str:
+    """
+    Хвост файла: читаются только последние max_bytes (seek от конца), неполная первая
+    строка отбрасывается; lines — оставить не больше N последних строк.
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        start = max(0, size - max(0, int(max_bytes)))
+        f.seek(start)
+        data = f.read()
+    if start > 0:
+        nl = data.find(b"\n")
+        data = data[nl + 1:] if nl >= 0 else data
+    text = data.decode(encoding, errors="replace")
+    if lines is not None:
+        text = "".join(text.splitlines(keepends=True)[-max(0, int(lines)):]) if lines > 0 else ""
+    return text
+
+
 def _as_path_list(values: Optional[Iterable[Union[str, Path]]]) -> List[Path]:
     if not values:
         return []
@@ -34,6 +100,93 @@ def _as_path_list(values: Optional[Iterable[Union[str, Path]]]) -> List[Path]:
     return out
 
 
+class _RootMatcher:
+    """
+    Предкомпилированная проверка «путь лежит в одном из корней»:
+    точные совпадения — set, поддеревья — один str.startswith(tuple) вместо цикла по корням.
+    """
+
+    __slots__ = ("exact", "prefixes")
+
+    def __init__(self, roots: Iterable[Path]):
+        exact = set()
+        prefixes = set()
+        for r in roots:
+            rs = str(r)
+            exact.add(rs)
+            for sep in {os.sep, "/"}:
+                prefixes.add(rs if rs.endswith(sep) else rs + sep)
+        self.exact = frozenset(exact)
+        self.prefixes = tuple(sorted(prefixes))
+
+    def __call__(self, ps: str) -> bool:
+        return ps in self.exact or (bool(self.prefixes) and ps.startswith(self.prefixes))
+
+
+@dataclass
+class _TreeEntry:
+    """Кэш дерева одного корня: {папка: [файлы]} + mtime каталогов для проверки актуальности."""
+    tree: Dict[str, List[str]]
+    dir_mtimes: Dict[str, int]
+    checked_at: float
+    rendered: Dict[int, str] = field(default_factory=dict)
+
+
+# общий для всех экземпляров FileManager: запись через любой из них сбрасывает дерево
+_TREE_CACHE: Dict[str, _TreeEntry] = {}
+_TREE_LOCK = threading.Lock()
+
+
+def _scan_tree(root: str) -> _TreeEntry:
+    """Один проход os.scandir: {относительная папка ("." — корень): [имена файлов]}."""
+    tree: Dict[str, List[str]] = {}
+    mtimes: Dict[str, int] = {}
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+            mtimes[d] = os.stat(d).st_mtime_ns
+        except OSError:
+            continue
+        files: List[str] = []
+        subdirs: List[str] = []
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in TREE_IGNORE_DIRS:
+                            subdirs.append(entry.path)
+                    elif not entry.name.endswith(TREE_IGNORE_SUFFIXES):
+                        files.append(entry.name)
+                except OSError:
+                    continue
+        if files:
+            rel = os.path.relpath(d, root).replace(os.sep, "/")
+            tree[rel] = sorted(files)
+        stack.extend(sorted(subdirs, reverse=True))
+    ordered = {k: tree[k] for k in sorted(tree, key=lambda k: (k != ".", k))}
+    return _TreeEntry(tree=ordered, dir_mtimes=mtimes, checked_at=time.monotonic())
+
+
+def _tree_is_fresh(entry: _TreeEntry) -> bool:
+    """Файл добавлен/удалён/переименован — меняется mtime его каталога."""
+    for d, mt in entry.dir_mtimes.items():
+        try:
+            if os.stat(d).st_mtime_ns != mt:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def _drop_trees_under(path: str) -> None:
+    with _TREE_LOCK:
+        for root in [r for r in _TREE_CACHE if path == r or path.startswith(r.rstrip(os.sep) + os.sep)
+                     or r.startswith(path.rstrip(os.sep) + os.sep)]:
+            del _TREE_CACHE[root]
+
+
 def _project_root_from_here() -> Path:
     """
     Определяем корень репозитория по расположению этого файла:
@@ -50,8 +203,10 @@ class FileManager:
     Гарантии:
       - Нормализация путей.
       - Белый список allowed_roots (включая base_dir).
+      - LRU-кэш разрешённых путей: сбрасывается записями/переименованиями через FileManager;
+        внешние изменения симлинков — invalidate_path()/clear_path_cache().
       - Опциональная atomic_write (через временный файл + rename()).
-      - Бэкап старой версии файла перед записью.
+      - Бэкап старой версии файла перед записью (общий BackupStore в backups_dir).
 
     Обратная совместимость:
       - FileManager() без аргументов — берёт repo_root как base_dir.
@@ -70,6 +225,7 @@ class FileManager:
         backups_dirname: Optional[str] = None,
         create_missing_dirs: Optional[bool] = None,
         atomic_write: Optional[bool] = None,
+        path_cache_size: Optional[int] = None,
     ):
         # Собираем итоговый конфиг
         if config is None:
@@ -81,6 +237,7 @@ class FileManager:
                 backups_dirname=backups_dirname or ".aideon_backups",
                 create_missing_dirs=True if create_missing_dirs is None else bool(create_missing_dirs),
                 atomic_write=True if atomic_write is None else bool(atomic_write),
+                path_cache_size=4096 if path_cache_size is None else int(path_cache_size),
             )
         else:
             base = Path(config.base_dir).expanduser().resolve()
@@ -95,6 +252,7 @@ class FileManager:
                 backups_dirname=backups_dirname or config.backups_dirname,
                 create_missing_dirs=config.create_missing_dirs if create_missing_dirs is None else bool(create_missing_dirs),
                 atomic_write=config.atomic_write if atomic_write is None else bool(atomic_write),
+                path_cache_size=config.path_cache_size if path_cache_size is None else int(path_cache_size),
             )
 
         self.cfg = cfg
@@ -107,8 +265,16 @@ class FileManager:
             self.allowed_roots.append(self.base_dir)
 
         self.read_only_paths = [self._norm(p) for p in (cfg.read_only_paths or [])]
+        self._allowed_match = _RootMatcher(self.allowed_roots)
+        self._read_only_match = _RootMatcher(self.read_only_paths)
+
+        # LRU: исходный путь -> разрешённый (realpath). Сбрасывается записями/переименованиями.
+        self._path_cache: "OrderedDict[str, Path]" = OrderedDict()
+        self._path_cache_size = max(0, int(cfg.path_cache_size))
+        self._path_cache_lock = threading.Lock()
         self.backups_dir = self.base_dir / self.cfg.backups_dirname
         self.backups_dir.mkdir(parents=True, exist_ok=True)
+        self.backup_store = get_backup_store(self.backups_dir)
 
         log_info(f"[FileManager] base_dir={self.base_dir}")
         log_info(f"[FileManager] allowed_roots={self.allowed_roots}")
@@ -119,20 +285,66 @@ class FileManager:
         return Path(p).expanduser().resolve()
 
     def _in_allowed_roots(self, p: Path) -> bool:
-        ps = str(p)
-        for root in self.allowed_roots:
-            rs = str(root)
-            if ps == rs or ps.startswith(rs + os.sep) or ps.startswith(rs + "/"):
-                return True
-        return False
+        return self._allowed_match(str(p))
 
     def _is_read_only(self, p: Path) -> bool:
-        ps = str(p)
-        for rp in self.read_only_paths:
-            rs = str(rp)
-            if ps == rs or ps.startswith(rs + os.sep) or ps.startswith(rs + "/"):
-                return True
-        return False
+        return self._read_only_match(str(p))
+
+    def set_roots(
+        self,
+        allowed_roots: Optional[Iterable[Union[str, Path]]] = None,
+        read_only_paths: Optional[Iterable[Union[str, Path]]] = None,
+    ) -> None:
+        """Меняет allowed_roots/read_only_paths и перекомпилирует проверки (кэш путей сбрасывается)."""
+        if allowed_roots is not None:
+            self.allowed_roots = [self._norm(p) for p in allowed_roots]
+            self._allowed_match = _RootMatcher(self.allowed_roots)
+        if read_only_paths is not None:
+            self.read_only_paths = [self._norm(p) for p in read_only_paths]
+            self._read_only_match = _RootMatcher(self.read_only_paths)
+        self.clear_path_cache()
+
+    # ---------- path cache ----------
+
+    def _cached_norm(self, rel_or_abs: os.PathLike | str) -> Path:
+        """realpath с LRU-кэшем; относительные пути якорятся к base_dir."""
+        key = os.fspath(rel_or_abs)
+        if self._path_cache_size:
+            with self._path_cache_lock:
+                hit = self._path_cache.get(key)
+                if hit is not None:
+                    self._path_cache.move_to_end(key)
+                    return hit
+        raw = Path(key)
+        p = self._norm(raw if raw.is_absolute() else self.base_dir / raw)
+        if self._path_cache_size:
+            with self._path_cache_lock:
+                self._path_cache[key] = p
+                if len(self._path_cache) > self._path_cache_size:
+                    self._path_cache.popitem(last=False)
+        return p
+
+    def invalidate_path(self, path: os.PathLike | str) -> None:
+        """
+        Сбрасывает кэши для пути и всего под ним (запись, переименование, удаление:
+        симлинк/каталог на этом месте мог смениться, дерево проекта — тоже).
+        """
+        ps = str(path)
+        _drop_trees_under(ps)
+        if not self._path_cache_size:
+            return
+        prefix = ps if ps.endswith(os.sep) else ps + os.sep
+        with self._path_cache_lock:
+            stale = [
+                k for k, v in self._path_cache.items()
+                if k == ps or str(v) == ps or str(v).startswith(prefix) or k.startswith(prefix)
+            ]
+            for k in stale:
+                del self._path_cache[k]
+
+    def clear_path_cache(self) -> None:
+        with self._path_cache_lock:
+            self._path_cache.clear()
 
     def resolve(self, rel_or_abs: os.PathLike | str) -> Path:
         """
@@ -143,13 +355,9 @@ class FileManager:
           - Абсолютные пути разрешаем, если они лежат в allowed_roots.
           - Иначе — PermissionError.
         """
-        raw = Path(rel_or_abs)
-        if not raw.is_absolute():
-            p = self._norm(self.base_dir / raw)
-        else:
-            p = self._norm(raw)
+        p = self._cached_norm(rel_or_abs)
 
-        if not self._in_allowed_roots(p):
+        if not self._allowed_match(str(p)):
             raise PermissionError(f"Path {p} is outside allowed roots")
 
         return p
@@ -169,19 +377,124 @@ class FileManager:
         return self.resolve(path).is_dir()
 
     def list_files(self, root: os.PathLike | str, patterns: Optional[Iterable[str]] = None) -> List[Path]:
+        """
+        Файлы под root (рекурсивно), только внутри allowed_roots.
+        root разрешается один раз; без patterns обход идёт через os.scandir, и realpath
+        делается только для симлинков (остальные пути под разрешённым root уже канонические).
+        """
         root_p = self.resolve(root)
         if not root_p.exists():
             return []
-        files: List[Path] = []
         if patterns:
+            out: List[Path] = []
             for pat in patterns:
-                files.extend(root_p.rglob(pat))
-        else:
-            files = [p for p in root_p.rglob("*") if p.is_file()]
-        return [self._norm(p) for p in files if self._in_allowed_roots(self._norm(p))]
+                for p in root_p.rglob(pat):
+                    rp = self._norm(p)
+                    if self._allowed_match(str(rp)):
+                        out.append(rp)
+            return out
+
+        files: List[Path] = []
+        for path_s, is_link in self._scan_files(str(root_p)):
+            if is_link:
+                rp = self._norm(path_s)
+                if rp.is_file() and self._allowed_match(str(rp)):
+                    files.append(rp)
+            else:
+                files.append(Path(path_s))
+        return files
+
+    @staticmethod
+    def _scan_files(root: str) -> Iterator[Tuple[str, bool]]:
+        """(путь, это_симлинк) для файлов под root; в симлинки на каталоги не спускаемся (как rglob)."""
+        stack = [root]
+        while stack:
+            d = stack.pop()
+            try:
+                it = os.scandir(d)
+            except OSError:
+                continue
+            with it:
+                subdirs = []
+                for entry in it:
+                    try:
+                        if entry.is_symlink():
+                            if not entry.is_dir():
+                                yield entry.path, True
+                        elif entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry.path, False
+                    except OSError:
+                        continue
+            stack.extend(reversed(subdirs))
+
+    # ---------- дерево проекта ----------
+
+    def get_project_tree(self, root: os.PathLike | str = ".", *, refresh: bool = False) -> Dict[str, List[str]]:
+        """
+        {относительная папка ("." — сам root): [файлы]} для root, без служебных каталогов.
+        Строится один раз (os.scandir) и кэшируется; сбрасывается записями через FileManager
+        и проверкой mtime каталогов (не чаще TREE_CHECK_INTERVAL). Возвращается копия:
+        кэш общий для всех вызывающих.
+        """
+        root_p = self.resolve(root)
+        key = str(root_p)
+        now = time.monotonic()
+        with _TREE_LOCK:
+            entry = None if refresh else _TREE_CACHE.get(key)
+        if entry is not None and now - entry.checked_at >= TREE_CHECK_INTERVAL:
+            if _tree_is_fresh(entry):
+                entry.checked_at = now
+            else:
+                entry = None
+        if entry is None:
+            if not root_p.is_dir():
+                return {}
+            entry = _scan_tree(key)
+            with _TREE_LOCK:
+                _TREE_CACHE[key] = entry
+        return {folder: list(files) for folder, files in entry.tree.items()}
+
+    def render_project_tree(
+        self, root: os.PathLike | str = ".", *, max_chars: int = TREE_RENDER_MAX_CHARS,
+    ) -> str:
+        """
+        Дерево для промпта: строка на папку ("папка/: a.py, b.py"), не длиннее max_chars;
+        не поместившееся сворачивается в «… ещё N папок / M файлов».
+        """
+        tree = self.get_project_tree(root)
+        with _TREE_LOCK:
+            entry = _TREE_CACHE.get(str(self.resolve(root)))
+        if entry is not None and entry.tree is tree and max_chars in entry.rendered:
+            return entry.rendered[max_chars]
+
+        lines: List[str] = []
+        used = 0
+        items = list(tree.items())
+        for i, (folder, files) in enumerate(items):
+            line = f"{folder}/: {', '.join(files)}"
+            if used + len(line) + 1 > max_chars:
+                rest_files = sum(len(f) for _, f in items[i:])
+                lines.append(f"… ещё {len(items) - i} папок / {rest_files} файлов")
+                break
+            lines.append(line)
+            used += len(line) + 1
+        text = "\n".join(lines)
+        if entry is not None and entry.tree is tree:
+            entry.rendered[max_chars] = text
+        return text
 
     # ---------- IO ----------
 
+    def read_file(self, path: os.PathLike | str, encoding: str = "utf-8") -> Optional[str]:
+        """read_text без исключений: None, если путь вне allowed_roots, файла нет или он не читается."""
+        try:
+            return self.read_text(path, encoding=encoding)
+        except Exception as e:
+            log_warning(f"[FileManager] read_file failed for {path}: {e}")
+            return None
+
     def read_text(self, path: os.PathLike | str, encoding: str = "utf-8") -> str:
         p = self.resolve(path)
         with p.open("r", encoding=encoding, newline="") as f:
@@ -192,6 +505,75 @@ class FileManager:
         with p.open("rb") as f:
             return f.read()
 
+    @contextmanager
+    def read_view(self, path: os.PathLike | str) -> Iterator[memoryview]:
+        """
+        Файл целиком как memoryview поверх mmap (без копии в память процесса):
+
+            with fm.read_view("big.log") as mv:
+                header = bytes(mv[:16])
+
+        memoryview действителен только внутри with; срезы — тоже view (копирует лишь bytes()).
+        """
+        p = self.resolve(path)
+        with p.open("rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield memoryview(b"")
+                return
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            mv = memoryview(mm)
+            try:
+                yield mv
+            finally:
+                mv.release()
+                mm.close()
+
+    def read_range(self, path: os.PathLike | str, offset: int = 0, size: Optional[int] = None) -> bytes:
+        """
+        Кусок файла [offset, offset+size): аллоцируется только он. offset < 0 — от конца файла,
+        size=None — до конца.
+        """
+        p = self.resolve(path)
+        with p.open("rb") as f:
+            if offset < 0:
+                f.seek(max(0, f.seek(0, os.SEEK_END) + offset))
+            else:
+                f.seek(offset)
+            return f.read(-1 if size is None else max(0, int(size)))
+
+    def iter_chunks(
+        self,
+        path: os.PathLike | str,
+        chunk_size: int = HASH_BUFFER_SIZE,
+        *,
+        offset: int = 0,
+        size: Optional[int] = None,
+    ) -> Iterator[bytes]:
+        """Потоковое чтение диапазона кусками по chunk_size (для передачи дальше без полной копии)."""
+        p = self.resolve(path)
+        left = size
+        with p.open("rb") as f:
+            f.seek(offset)
+            while left is None or left > 0:
+                n = chunk_size if left is None else min(chunk_size, left)
+                chunk = f.read(n)
+                if not chunk:
+                    break
+                if left is not None:
+                    left -= len(chunk)
+                yield chunk
+
+    def tail(
+        self,
+        path: os.PathLike | str,
+        max_bytes: int = TAIL_DEFAULT_BYTES,
+        *,
+        lines: Optional[int] = None,
+        encoding: str = "utf-8",
+    ) -> str:
+        """Хвост текстового файла (логи): читаются только последние max_bytes."""
+        return read_tail(self.resolve(path), max_bytes, lines=lines, encoding=encoding)
+
     def write_text(self, path: os.PathLike | str, data: str, encoding: str = "utf-8") -> Path:
         p = self.resolve(path)
         if self._is_read_only(p):
@@ -222,6 +604,7 @@ class FileManager:
             with p.open("w", encoding=encoding, newline="") as f:
                 f.write(data)
 
+        self.invalidate_path(p)
         log_info(f"[FileManager] wrote {p}")
         return p
 
@@ -254,14 +637,33 @@ class FileManager:
             with p.open("wb") as f:
                 f.write(data)
 
+        self.invalidate_path(p)
         log_info(f"[FileManager] wrote (bytes) {p}")
         return p
 
+    def restore_content(self, path: os.PathLike | str, text: str, encoding: str = "utf-8") -> Path:
+        """
+        Возвращает файлу содержимое text (откат правки): если эта версия уже есть в BackupStore —
+        восстанавливается оттуда, иначе пишется через write_text. В обоих случаях текущая
+        версия сохраняется в хранилище.
+        """
+        p = self.resolve(path)
+        if self._is_read_only(p):
+            raise PermissionError(f"Path {p} is read-only")
+        rec = self.backup_store.find(p, hashlib.sha256(text.encode(encoding)).hexdigest())
+        if rec is None:
+            return self.write_text(p, text, encoding=encoding)
+        self.backup_store.restore(p, rec)
+        self.invalidate_path(p)
+        log_info(f"[FileManager] restored {p} @ {rec.hash[:12]}")
+        return p
+
     # ---------- utils ----------
 
     def ensure_dir(self, path: os.PathLike | str) -> Path:
         p = self.resolve(path)
         p.mkdir(parents=True, exist_ok=True)
+        self.invalidate_path(p)
         return p
 
     def copy(self, src: os.PathLike | str, dst: os.PathLike | str) -> None:
@@ -272,31 +674,37 @@ class FileManager:
         else:
             dp.parent.mkdir(parents=True, exist_ok=True)
             shutil.copy2(sp, dp)
+        self.invalidate_path(dp)
+
+    def rename(self, src: os.PathLike | str, dst: os.PathLike | str) -> Path:
+        """Переименование/перемещение внутри allowed_roots (os.replace); кэш путей обеих сторон сбрасывается."""
+        sp = self.resolve(src)
+        dp = self.resolve(dst)
+        if self._is_read_only(sp) or self._is_read_only(dp):
+            raise PermissionError(f"Path {sp} -> {dp} touches a read-only path")
+        if self.cfg.create_missing_dirs:
+            dp.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(sp, dp)
+        self.invalidate_path(sp)
+        self.invalidate_path(dp)
+        log_info(f"[FileManager] renamed {sp} -> {dp}")
+        return dp
 
     def compute_hash(self, path: os.PathLike | str, algo: str = "sha256") -> str:
-        p = self.resolve(path)
-        h = hashlib.new(algo)
-        with p.open("rb") as f:
-            for chunk in iter(lambda: f.read(8192), b""):
-                h.update(chunk)
-        return h.hexdigest()
+        return file_digest(self.resolve(path), algo)
 
-    def _backup_file(self, path: Path) -> Optional[Path]:
-        # Пытаемся хранить иерархию бэкапов относительно base_dir
+    def _backup_file(self, path: Path) -> Optional[BackupRecord]:
+        """
+        Версия файла перед перезаписью уходит в общий BackupStore (сжато, с дедупом по хэшу).
+        """
         try:
-            rel = path.relative_to(self.base_dir)
-        except ValueError:
-            rel = Path("_external_") / path.name
-
-        backup_target = self.backups_dir / rel
-        backup_target.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(path, backup_target)
-        log_info(f"[FileManager] backup -> {backup_target}")
-        return backup_target
-
+            return self.backup_store.put(path, label="file_manager")
+        except Exception as e:
+            log_warning(f"[FileManager] backup failed for {path}: {e}")
+            return None
 
 # ============================
 # ✅ Совместимые алиасы/экспорт (строго в конце)
 # ============================
 CoreFileManager = FileManager
-__all__ = ["FileManager", "CoreFileManager", "FileManagerConfig"]
\ No newline at end of file
+__all__ = ["FileManager", "CoreFileManager", "FileManagerConfig", "file_digest", "read_tail"]
\ No newline at end of file
@@ -2,9 +2,11 @@
 from __future__ import annotations
 
 import json
+import threading
 import time
 from typing import Optional, List, Dict, Any
 
+from app.core.backoff import BackoffPolicy
 from app.core.file_manager import FileManager
 from app.modules.utils import load_api_key, load_model_name, load_temperature
 
@@ -40,6 +42,12 @@ class CodeAnalyzer:
         self.max_context_tokens = int(self.config.get("max_context_tokens", 8192))
         self.request_timeout = int(self.config.get("request_timeout", 60))
         self.max_retries = int(self.config.get("max_retries", 2))
+        # Общая политика пауз между повторами (её же используют AIBugFixer и др.)
+        self.backoff = BackoffPolicy.from_config(self.config)
+        # Латентность вызовов модели (для индекса патчей): последний вызов и накопительно
+        self.last_latency_ms: float = 0.0
+        self.total_latency_ms: float = 0.0
+        self._latency_lock = threading.Lock()
 
         # Клиент нового SDK (если доступен)
         self._client: Optional["OpenAI"] = None
@@ -84,7 +92,7 @@ class CodeAnalyzer:
     # ---------- Внутренние методы ----------
 
     def _analyze_single_chunk(self, code_chunk: str, file_path: Optional[str] = None) -> str:
-        project_tree = self.file_manager.get_project_tree("app")
+        project_tree = self.file_manager.render_project_tree("app")
         context_prompt = (
             "Ты — Aideon, AI-ассистент по анализу кода.\n"
             f"Структура проекта:\n{project_tree}\n\n"
@@ -125,6 +133,16 @@ class CodeAnalyzer:
         Стабильный путь: только chat.completions (новый SDK) + фолбэк на старый SDK.
         Убрали Responses API, чтобы не ловить 400 'messages[...].content[0].type'.
         """
+        started = time.perf_counter()
+        try:
+            return self._chat_call_once(messages)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000.0
+            with self._latency_lock:
+                self.last_latency_ms = elapsed
+                self.total_latency_ms += elapsed
+
+    def _chat_call_once(self, messages: List[Dict[str, str]]) -> str:
         last_err: Optional[Exception] = None
 
         for attempt in range(self.max_retries + 1):
@@ -166,6 +184,6 @@ class CodeAnalyzer:
                     )
 
                 if attempt < self.max_retries:
-                    time.sleep(1.5 * (attempt + 1))
+                    self.backoff.sleep(attempt + 1)
 
         return f"Ошибка при обращении к OpenAI: {last_err}"
\ No newline at end of file
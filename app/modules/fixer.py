@@ -5,20 +5,22 @@
 Совместим с новым SDK OpenAI (>=1.x) и имеет фолбэк на старый.
 
 Актуализации:
-- Переведён на новый интерфейс CodePatcher (apply_patch_no_prompt без save_only/interactive_confirm).
+- Применение — транзакционным набором CodePatcher.apply_patch_set (журнал, откат набором).
 - Добавлены безопасные вызовы агентских событий (emit_*), если доступны в app.logger.
 """
 
 from __future__ import annotations
 
-import difflib
 import json
 import os
+import time
 from typing import Any, Dict, Optional
 
 from app.core.file_manager import FileManager
 from app.modules.runner import CodeRunner
 from app.modules.improver.patcher import CodePatcher
+from app.modules.improver.patch_classifier import PATCH_SEMANTIC
+from app.modules.improver.diff_engine import unified_diff
 from app.modules.utils import load_api_key, load_model_name, load_temperature
 from app.logger import log_info, log_warning, log_error
 
@@ -70,7 +72,10 @@ class CodeFixer:
         self.file_manager = FileManager()
         self.runner = CodeRunner()
         # единая точка бэкапа/диффа/записи (совместимо с актуальной версией)
-        self.patcher = CodePatcher()
+        self.patcher = CodePatcher(skip_cosmetic=True, diff_algorithm=str(self.config.get("diff_algorithm", "myers")))
+        self._patch_sets: Dict[str, str] = {}  # abs path -> set_id последнего применённого набора
+        self._change_ids: Dict[str, str] = {}  # abs path -> change_id в индексе патчей
+        self._last_latency_ms: Optional[float] = None
 
         # История
         self.history_path = os.path.join("app", "logs", "history.json")
@@ -151,7 +156,7 @@ class CodeFixer:
         Запрос к GPT, чтобы предложить исправления/рефакторинг кода.
         Возвращает СЫРОЙ текст (ожидается JSON по протоколу подсказки).
         """
-        project_tree = self.file_manager.get_project_tree("app")
+        project_tree = self.file_manager.render_project_tree("app")
 
         system_prompt = (
             "Ты — Aideon, AI-ассистент по исправлению кода.\n"
@@ -181,7 +186,9 @@ class CodeFixer:
 
         log_info("[CodeFixer] 🤖 Запрос AI на предложение исправлений…")
         emit_event("fixer_suggest_start", file=file_path or "unknown")
+        started = time.perf_counter()
         result = self._chat(messages)
+        self._last_latency_ms = round((time.perf_counter() - started) * 1000.0, 1)
         emit_event("fixer_suggest_done", file=file_path or "unknown", length=len(result or ""))
         log_info(f"[CodeFixer] 📨 Ответ от AI получен ({len(result)} симв.)")
         return result
@@ -189,19 +196,29 @@ class CodeFixer:
     def apply_fixes(self, original_code: str, fixed_code: str, file_path: str) -> str:
         """
         Применяет исправления:
-        - бэкап/дифф/запись — через CodePatcher.apply_patch_no_prompt(...)
+        - бэкап/дифф/запись — через CodePatcher.apply_patch_set(...) (журнал + откат набором)
         - затем запускает тесты; при ошибке — откат бэкапа выполняется тут же вручную
+        - identical/cosmetic патчи не пишутся и не тестируются
         """
+        kind = self.patcher.classify(file_path, original_code, fixed_code)
+        if kind != PATCH_SEMANTIC:
+            log_info(f"[CodeFixer] ♻️ Патч без смысловых изменений ({kind}) — запись и тесты пропущены: {file_path}")
+            emit_event("fixer_patch_noop", file=file_path, kind=kind)
+            return f"Исправления не меняют код по существу ({kind}) — применение и проверка пропущены."
+
+        self.patcher.patch_context = {"model": self.model, "latency_ms": self._last_latency_ms}
         try:
-            # Новый актуальный интерфейс: создаём бэкап, сохраняем diff и перезаписываем файл
-            self.patcher.apply_patch_no_prompt(
-                file_path=file_path,
-                old_code=original_code,
-                new_code=fixed_code,
-                save_backup=True,   # делаем бэкап
-                save_diff=True,     # сохраняем diff
+            # Транзакционный набор из одного файла: журнал + бэкап, откат одной операцией
+            ps = self.patcher.apply_patch_set(
+                [(file_path, original_code, fixed_code)],
+                save_diff=True,
+                label="fixer",
             )
-            emit_tool_call("patcher", "apply_patch_no_prompt", file=file_path, mode="write")
+            if ps is not None:
+                self._patch_sets[os.path.abspath(file_path)] = ps.set_id
+            if self.patcher.last_change_ids:
+                self._change_ids[os.path.abspath(file_path)] = self.patcher.last_change_ids[-1]
+            emit_tool_call("patcher", "apply_patch_set", file=file_path, mode="write")
             log_info(f"[CodeFixer] ✅ Патч применён: {file_path}")
         except Exception as e:
             log_error(f"[CodeFixer] ❌ Ошибка при применении патча: {e}")
@@ -221,8 +238,9 @@ class CodeFixer:
         original_lines = original_code.splitlines(keepends=True)
         fixed_lines = fixed_code.splitlines(keepends=True)
 
-        diff = difflib.unified_diff(
-            original_lines, fixed_lines, fromfile="original", tofile="fixed", lineterm=""
+        diff = unified_diff(
+            original_lines, fixed_lines, fromfile="original", tofile="fixed", lineterm="",
+            algorithm=self.patcher.diff_algorithm,
         )
         return "\n".join(diff)
 
@@ -238,6 +256,13 @@ class CodeFixer:
 
         stdout, stderr, return_code = self.runner.run_code(file_name)
 
+        change_id = self._change_ids.pop(os.path.abspath(file_path), None)
+        if change_id:
+            try:
+                self.patcher.index.set_test_result(change_id, return_code == 0, return_code)
+            except Exception as e:
+                log_warning(f"[CodeFixer] Индекс патчей: результат теста не записан: {e}")
+
         history_entry = {
             "file": file_name,
             "diff": diff,
@@ -253,26 +278,27 @@ class CodeFixer:
             log_info("[CodeFixer] ✅ Исправления применены и проверка прошла успешно")
             return f"Исправления успешно применены и протестированы:\n{diff}\nВывод:\n{stdout}"
 
-        # Ошибка — попробуем откатиться (бэкап создавал патчер)
+        # Ошибка — откатываем набор патча (или последний бэкап файла, если набора нет)
         log_warning("[CodeFixer] ❌ Ошибка при проверке — попытка отката к бэкапу")
         emit_action(step="fixer_run", status="done", file=file_name, result="error")
 
-        backup_dir = self.patcher.backup_dir
-        base = os.path.basename(file_path)
         try:
-            cand = [
-                f for f in os.listdir(backup_dir)
-                if f.startswith(base + ".") and f.endswith(".bak")
-            ]
-            cand.sort(reverse=True)
-            if cand:
-                latest = os.path.join(backup_dir, cand[0])
-                with open(latest, "r", encoding="utf-8") as bf, open(file_path, "w", encoding="utf-8") as wf:
-                    wf.write(bf.read())
+            set_id = self._patch_sets.pop(os.path.abspath(file_path), None)
+            if set_id is None:
+                # набор из прошлого запуска/другого экземпляра — ищем в индексе патчей
+                entry = self.patcher.index.latest_for_file(file_path)
+                set_id = entry.set_id if entry is not None else None
+            if set_id is not None:
+                self.patcher.rollback_patch_set(set_id)
+                restored = set_id
+            else:
+                rec = self.patcher.backup_store.restore(file_path)
+                restored = rec.hash[:12] if rec is not None else None
+            if restored is not None:
                 history_entry["status"] = "Откат к предыдущей версии"
                 self._save_to_history(history_entry)
-                log_warning(f"[CodeFixer] ↩️ Откат выполнен из бэкапа: {latest}")
-                emit_event("fixer_rollback_done", file=file_name, backup=latest)
+                log_warning(f"[CodeFixer] ↩️ Откат выполнен: {restored}")
+                emit_event("fixer_rollback_done", file=file_name, backup=restored)
                 return f"Ошибка во время проверки! Код откатился к предыдущей версии.\n{stderr}"
             else:
                 log_error("[CodeFixer] Бэкап не найден — откат невозможен")
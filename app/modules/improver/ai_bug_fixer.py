@@ -1,9 +1,12 @@
 # app/modules/improver/ai_bug_fixer.py
 from __future__ import annotations
 
-from typing import Optional, Any, Callable
-import time
+from dataclasses import dataclass, field
+from typing import Optional, Any, Callable, Dict, List
+import json
+import re
 
+from app.core.backoff import BackoffPolicy
 from app.modules.analyzer import CodeAnalyzer
 from app.logger import log_info, log_warning, log_error
 
@@ -48,21 +51,108 @@ def _strip_fences(text: str) -> str:
     return s
 
 
+VERDICT_FIXED = "fixed"
+VERDICT_NO_ISSUES = "no_issues"
+VERDICT_ERROR = "error"
+
+
+@dataclass
+class BugfixResult:
+    """
+    Результат единого bugfix-запроса:
+      - verdict: "fixed" | "no_issues" | "error"
+      - findings: список найденных проблем (для логов/истории)
+      - code: полный исправленный файл (только при verdict == "fixed")
+    """
+    verdict: str
+    findings: List[str] = field(default_factory=list)
+    code: Optional[str] = None
+    error: Optional[str] = None
+
+
+def _parse_bugfix_response(raw: str) -> BugfixResult:
+    """
+    Разбирает структурированный ответ модели:
+      {"verdict": "fixed"|"no_issues", "findings": [...], "code": "..."}
+    Терпимо к ```json``` ограждениям и тексту вокруг JSON.
+    """
+    if not raw or not raw.strip():
+        return BugfixResult(VERDICT_ERROR, error="пустой ответ модели")
+
+    text = raw.strip()
+    m = re.match(r"^```(?:json)?\s*([\s\S]*?)\s*```$", text, re.IGNORECASE)
+    if m:
+        text = m.group(1).strip()
+
+    data: Optional[Dict[str, Any]] = None
+    for candidate in (text, text[text.find("{"): text.rfind("}") + 1] if "{" in text else ""):
+        if not candidate:
+            continue
+        try:
+            obj = json.loads(candidate)
+        except Exception:
+            continue
+        if isinstance(obj, dict):
+            data = obj
+            break
+
+    if data is None:
+        return BugfixResult(VERDICT_ERROR, error="ответ модели не является JSON")
+
+    findings_raw = data.get("findings") or []
+    if isinstance(findings_raw, str):
+        findings_raw = [findings_raw]
+    findings = [str(f).strip() for f in findings_raw if str(f).strip()]
+
+    verdict = str(data.get("verdict", "")).strip().lower()
+    code = data.get("code")
+    if not isinstance(code, str):
+        code = None
+    elif code.lstrip().startswith("```"):
+        code = _strip_fences(code)
+
+    if verdict == VERDICT_NO_ISSUES:
+        return BugfixResult(VERDICT_NO_ISSUES, findings=findings)
+    if verdict == VERDICT_FIXED or code:
+        if not code or not code.strip():
+            return BugfixResult(VERDICT_ERROR, findings=findings, error="verdict=fixed, но код пуст")
+        return BugfixResult(VERDICT_FIXED, findings=findings, code=code)
+    return BugfixResult(VERDICT_ERROR, findings=findings, error=f"неизвестный verdict: {verdict!r}")
+
+
 class AIBugFixer:
     """
     Мини-модуль «AI-Assisted Bug Fixer».
 
     Задачи:
-      1) На основе summary + кода попросить у GPT выявить вероятные баги и дать краткий план фикса.
-      2) Запросить у GPT «новую версию файла» (полный текст), вернуть как строку без Markdown-ограждений.
-      3) При ошибке применения — сделать до N повторов (итеративный цикл).
+      1) Одним запросом получить у GPT список проблем И полную исправленную версию файла
+         (или вердикт «нет проблем») — структурированный JSON, см. fix_in_one_call().
+      2) Опционально (propose_first=True) — предварительно запросить краткий план фикса
+         (propose_fixes); план подмешивается в основной запрос, а не просто логируется.
+      3) При ошибке применения — сделать до N повторов с паузами по общей BackoffPolicy.
 
     Модуль НЕ работает с файловой системой напрямую — все действия записи выполняются внешними колбэками.
     """
 
-    def __init__(self, analyzer: CodeAnalyzer, max_fix_cycles: int = 2):
+    SYSTEM_MSG = (
+        "Ты — строгий ревьюер и опытный Python-разработчик. "
+        "Отвечай строго JSON-объектом без Markdown и без текста вне JSON."
+    )
+
+    def __init__(
+        self,
+        analyzer: CodeAnalyzer,
+        max_fix_cycles: int = 2,
+        *,
+        propose_first: bool = False,
+        backoff: Optional[BackoffPolicy] = None,
+    ):
         self.analyzer = analyzer
         self.max_fix_cycles = int(max_fix_cycles)
+        self.propose_first = bool(propose_first)
+        # по умолчанию — та же политика, что и у анализатора (общая для всех ретраев)
+        self.backoff: BackoffPolicy = backoff or getattr(analyzer, "backoff", None) or BackoffPolicy()
+        self.last_result: Optional[BugfixResult] = None
 
     # ---------- Промпты ----------
 
@@ -70,6 +160,7 @@ class AIBugFixer:
         """
         Просим у модели кратко описать потенциальные ошибки и план исправления (3–7 пунктов).
         Возвращает человекочитаемый текст (для логов/истории).
+        Опциональный шаг: вызывается из iterative_fix_cycle только при propose_first=True.
         """
         system_msg = "Ты — строгий и практичный ревьюер кода. Отвечай кратко и по делу."
         user_prompt = (
@@ -96,6 +187,7 @@ class AIBugFixer:
         """
         Просим у модели вернуть ПОЛНУЮ обновлённую версию файла (единым текстом),
         без Markdown-разметки и комментариев вне кода.
+        Оставлено для совместимости — iterative_fix_cycle использует fix_in_one_call().
         """
         system_msg = "Ты — опытный Python-разработчик. Верни только код файла, без Markdown."
         user_prompt = (
@@ -124,6 +216,52 @@ class AIBugFixer:
             emit_agent_error("bugfixer_generate_error", file=file_path, error=str(e))
             return None
 
+    def fix_in_one_call(
+        self,
+        file_path: str,
+        summary: Any,
+        code: str,
+        *,
+        hints: Optional[str] = None,
+    ) -> BugfixResult:
+        """
+        Единый bugfix-протокол: один запрос → findings + исправленный код (или «нет проблем»).
+        hints — дополнительный контекст (план propose_fixes, находки статанализа и т.п.).
+        """
+        user_prompt = (
+            "Найди ошибки в файле и сразу исправь их.\n\n"
+            f"Файл: {file_path}\n"
+            f"Summary:\n{summary}\n\n"
+            + (f"Подсказки:\n{hints}\n\n" if hints else "")
+            + "Код:\n"
+            f"{code}\n\n"
+            "Ответь строго JSON-объектом одного из видов:\n"
+            '{"verdict": "no_issues", "findings": []}\n'
+            '{"verdict": "fixed", "findings": ["кратко: проблема → исправление", ...], '
+            '"code": "ПОЛНЫЙ исправленный файл"}\n\n'
+            "Требования к code:\n"
+            "- Полный текст файла, без Markdown.\n"
+            "- Сохрани публичные API и совместимость с текущей логикой.\n"
+            "- Не ломай зависимости проекта.\n"
+            "- При сомнениях оставь краткий TODO-комментарий в коде.\n"
+            "Если критичных ошибок нет — verdict=no_issues и НЕ присылай code."
+        )
+        try:
+            emit_action(step="bugfixer_fix", status="started", file=file_path)
+            raw = self.analyzer.chat(user_prompt, system_msg=self.SYSTEM_MSG)
+            result = _parse_bugfix_response(raw or "")
+            emit_action(
+                step="bugfixer_fix", status="done", file=file_path,
+                verdict=result.verdict, findings=len(result.findings),
+                chars=len(result.code or ""),
+            )
+        except Exception as e:
+            log_error(f"[BugFixer] Ошибка при запросе фикса: {e}")
+            emit_agent_error("bugfixer_fix_error", file=file_path, error=str(e))
+            result = BugfixResult(VERDICT_ERROR, error=str(e))
+        self.last_result = result
+        return result
+
     # ---------- Итеративный цикл ----------
 
     def iterative_fix_cycle(
@@ -133,31 +271,47 @@ class AIBugFixer:
         old_code: str,
         apply_callback: Callable[[str], None],   # обязан применить патч/сохранить diff/и т.п. (может бросить исключение)
         on_error_callback: Callable[[Exception, int], None],  # уведомление о фейле применения
+        *,
+        hints: Optional[str] = None,
     ) -> Optional[str]:
         """
-        Делает до N попыток получить и применить исправленный код.
-        Возвращает применённый код (str) на успехе или None на неудаче.
+        Делает до N попыток получить и применить исправленный код (по одному запросу к модели на попытку).
+        Возвращает применённый код (str) на успехе или None на неудаче / при вердикте «нет проблем».
         """
         for attempt in range(1, self.max_fix_cycles + 1):
             emit_event("bugfixer_attempt", file=file_path, attempt=attempt, total=self.max_fix_cycles)
 
-            plan = self.propose_fixes(file_path, summary, old_code)
-            log_info(f"[BugFixer] План фиксов (попытка {attempt}/{self.max_fix_cycles}):\n{plan}")
+            attempt_hints = hints
+            if self.propose_first:
+                plan = self.propose_fixes(file_path, summary, old_code)
+                log_info(f"[BugFixer] План фиксов (попытка {attempt}/{self.max_fix_cycles}):\n{plan}")
+                attempt_hints = "\n\n".join(h for h in (hints, f"План фиксов:\n{plan}") if h)
 
-            new_code = self.generate_fixed_code(file_path, summary, old_code)
-            if not new_code:
-                log_warning("[BugFixer] Модель не вернула новую версию кода.")
-                on_error_callback(RuntimeError("Модель не вернула код"), attempt)
-                time.sleep(1.0 * attempt)
+            result = self.fix_in_one_call(file_path, summary, old_code, hints=attempt_hints)
+            if result.findings:
+                log_info(
+                    f"[BugFixer] Находки (попытка {attempt}/{self.max_fix_cycles}):\n"
+                    + "\n".join(f"- {f}" for f in result.findings)
+                )
+
+            if result.verdict == VERDICT_NO_ISSUES:
+                log_info(f"[BugFixer] Модель не нашла проблем: {file_path}")
+                return None
+
+            if result.verdict != VERDICT_FIXED or not result.code:
+                log_warning(f"[BugFixer] Модель не вернула новую версию кода: {result.error}")
+                on_error_callback(RuntimeError(result.error or "Модель не вернула код"), attempt)
+                if attempt < self.max_fix_cycles:
+                    self.backoff.sleep(attempt)
                 continue
 
             try:
-                apply_callback(new_code)  # внешний код решает: применить или только diff
-                return new_code
+                apply_callback(result.code)  # внешний код решает: применить или только diff
+                return result.code
             except Exception as e:
                 on_error_callback(e, attempt)
                 emit_agent_error("bugfixer_apply_error", file=file_path, error=str(e), attempt=attempt)
-                # Небольшая экспоненциальная пауза между попытками
-                time.sleep(1.0 * attempt)
+                if attempt < self.max_fix_cycles:
+                    self.backoff.sleep(attempt)
 
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,520 @@
+# app/modules/improver/approval_queue.py
+from __future__ import annotations
+
+import fnmatch
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.backup_store import BackupStore
+from app.logger import log_info, log_warning, log_error
+
+QUEUE_FILENAME = "approvals.sqlite"
+
+# статусы заявки
+STATUS_PENDING = "pending"      # ждёт решения ревьюера
+STATUS_APPROVED = "approved"    # одобрена, ждёт фонового применения
+STATUS_REJECTED = "rejected"    # отклонена (ревьюер или политика)
+STATUS_APPLIED = "applied"      # применена набором патчей
+STATUS_STALE = "stale"          # файл изменился после постановки в очередь — применять нельзя
+STATUS_FAILED = "failed"        # ошибка применения (валидация, запись, ...)
+
+STATUSES = (STATUS_PENDING, STATUS_APPROVED, STATUS_REJECTED, STATUS_APPLIED, STATUS_STALE, STATUS_FAILED)
+_FINAL = (STATUS_REJECTED, STATUS_APPLIED, STATUS_STALE, STATUS_FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS approvals (
+    id          TEXT PRIMARY KEY,
+    file        TEXT NOT NULL,
+    created     REAL NOT NULL,
+    status      TEXT NOT NULL,
+    old_hash    TEXT,
+    new_hash    TEXT NOT NULL,
+    diff        BLOB,
+    diff_ref    TEXT,
+    added_lines INTEGER NOT NULL DEFAULT 0,
+    removed_lines INTEGER NOT NULL DEFAULT 0,
+    context     TEXT,
+    decided     REAL,
+    reviewer    TEXT,
+    reason      TEXT,
+    set_id      TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_approvals_status ON approvals(status, created);
+CREATE INDEX IF NOT EXISTS ix_approvals_file ON approvals(file, created);
+"""
+
+_COLS = (
+    "id, file, created, status, old_hash, new_hash, diff, diff_ref, added_lines, removed_lines, "
+    "context, decided, reviewer, reason, set_id"
+)
+
+
+@dataclass
+class ApprovalItem:
+    """Заявка на применение патча. Содержимое old/new — блобы BackupStore (закреплены за id)."""
+    id: str
+    file: str
+    created: float
+    status: str
+    old_hash: Optional[str]
+    new_hash: str
+    diff: str
+    diff_ref: Optional[str]
+    added_lines: int = 0
+    removed_lines: int = 0
+    context: Dict[str, Any] = field(default_factory=dict)
+    decided: Optional[float] = None
+    reviewer: Optional[str] = None
+    reason: Optional[str] = None
+    set_id: Optional[str] = None
+
+    @property
+    def changed_lines(self) -> int:
+        return self.added_lines + self.removed_lines
+
+    @property
+    def when(self) -> str:
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.created))
+
+
+def _count_changes(diff_text: str) -> tuple[int, int]:
+    added = removed = 0
+    for line in (diff_text or "").splitlines():
+        if line.startswith("+") and not line.startswith("+++"):
+            added += 1
+        elif line.startswith("-") and not line.startswith("---"):
+            removed += 1
+    return added, removed
+
+
+class ApprovalPolicy:
+    """
+    Правила автоматического решения по заявке (config["approval_policy"]):
+
+        {"rules": [
+            {"action": "reject",  "path": "app/core/*"},
+            {"action": "approve", "path": "app/modules/*", "max_changed_lines": 20},
+            {"action": "approve", "kind": "cosmetic"}
+        ]}
+
+    Первое совпавшее правило решает; ни одно не совпало — заявка ждёт ревьюера.
+    Условия правила (все необязательные): path (glob по пути относительно project_root
+    или по абсолютному), max_changed_lines, kind (identical | cosmetic | semantic).
+    """
+
+    ACTIONS = ("approve", "reject")
+
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None, project_root: Optional[str] = None):
+        self.rules: List[Dict[str, Any]] = []
+        for r in rules or []:
+            if not isinstance(r, dict) or r.get("action") not in self.ACTIONS:
+                log_warning(f"[ApprovalPolicy] правило пропущено: {r!r}")
+                continue
+            self.rules.append(dict(r))
+        self.project_root = Path(project_root or os.getcwd()).resolve()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], project_root: Optional[str] = None) -> "ApprovalPolicy":
+        raw = (config or {}).get("approval_policy") or {}
+        rules = raw.get("rules") if isinstance(raw, dict) else raw
+        return cls(rules if isinstance(rules, list) else [], project_root=project_root)
+
+    def _rel(self, file: str) -> str:
+        try:
+            return Path(file).resolve().relative_to(self.project_root).as_posix()
+        except ValueError:
+            return Path(file).as_posix()
+
+    def decide(self, item: ApprovalItem, kind: Optional[str] = None) -> Optional[str]:
+        """approve | reject | None (решение за ревьюером)."""
+        rel = self._rel(item.file)
+        for rule in self.rules:
+            pat = rule.get("path")
+            if pat and not (fnmatch.fnmatch(rel, pat) or fnmatch.fnmatch(item.file, pat)):
+                continue
+            limit = rule.get("max_changed_lines")
+            if limit is not None and item.changed_lines > int(limit):
+                continue
+            if rule.get("kind") and rule["kind"] != kind:
+                continue
+            return rule["action"]
+        return None
+
+
+class ApprovalQueue:
+    """
+    Очередь подтверждения патчей (sqlite рядом с архивом диффов).
+
+    Конвейер ставит патч в очередь (enqueue) и идёт дальше; решение принимают
+    ревьюер из CLI/UI (approve/reject) или политика. Одобренные заявки применяет
+    фоновый ApprovalWorker. Очередь общая для процессов: CLI пишет решение
+    в тот же файл, воркер GUI подхватывает его при опросе.
+    """
+
+    def __init__(self, path: os.PathLike | str, store: BackupStore):
+        p = Path(path).expanduser().resolve()
+        if p.suffix != ".sqlite":
+            p = p / QUEUE_FILENAME
+        p.parent.mkdir(parents=True, exist_ok=True)
+        self.path = p
+        self.store = store
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(p), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._listeners: List[Callable[[ApprovalItem], None]] = []
+        self.wakeup = threading.Event()  # будит воркер при одобрении в этом процессе
+        self.apply_lock = threading.Lock()  # drain() в процессе — по одному (воркер, CLI drain)
+        self.worker: Optional["ApprovalWorker"] = None  # фоновый воркер очереди (один на процесс)
+
+    # ---------- подписки (UI) ----------
+
+    def subscribe(self, callback: Callable[[ApprovalItem], None]) -> None:
+        """callback(item) на каждое изменение статуса. Вызывается из потока, сменившего статус."""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback: Callable[[ApprovalItem], None]) -> None:
+        try:
+            self._listeners.remove(callback)
+        except ValueError:
+            pass
+
+    def _notify(self, item_id: str) -> None:
+        item = self.get(item_id)
+        if item is None:
+            return
+        if item.status == STATUS_APPROVED:
+            self.wakeup.set()
+        for cb in list(self._listeners):
+            try:
+                cb(item)
+            except Exception as e:
+                log_warning(f"[ApprovalQueue] listener: {e}")
+
+    # ---------- запись ----------
+
+    def enqueue(
+        self,
+        file: str,
+        old_code: Optional[str],
+        new_code: str,
+        diff_text: str,
+        *,
+        diff_ref: Optional[str] = None,
+        context: Optional[Dict[str, Any]] = None,
+    ) -> ApprovalItem:
+        item_id = "apr_" + time.strftime("%Y%m%d_%H%M%S") + "_" + uuid.uuid4().hex[:8]
+        old_hash = self.store.put_blob(old_code.encode("utf-8"), pin=item_id) if old_code is not None else None
+        new_hash = self.store.put_blob(new_code.encode("utf-8"), pin=item_id)
+        added, removed = _count_changes(diff_text)
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO approvals({_COLS}) VALUES ({', '.join('?' for _ in range(15))})",
+                (item_id, str(Path(file).resolve()), time.time(), STATUS_PENDING, old_hash, new_hash,
+                 zlib.compress((diff_text or "").encode("utf-8"), 6), diff_ref, added, removed,
+                 json.dumps(context or {}, ensure_ascii=False), None, None, None, None),
+            )
+            self._db.commit()
+        log_info(f"[ApprovalQueue] ⏳ {item_id}: {file} (+{added}/-{removed}) ждёт подтверждения")
+        self._notify(item_id)
+        return self.get(item_id)  # type: ignore[return-value]
+
+    def _set_status(
+        self,
+        item_id: str,
+        status: str,
+        *,
+        expect: tuple = (),
+        reviewer: Optional[str] = None,
+        reason: Optional[str] = None,
+        set_id: Optional[str] = None,
+    ) -> bool:
+        with self._lock:
+            sql = "UPDATE approvals SET status = ?, decided = ?, reviewer = COALESCE(?, reviewer), " \
+                  "reason = COALESCE(?, reason), set_id = COALESCE(?, set_id) WHERE id = ?"
+            args: List[Any] = [status, time.time(), reviewer, reason, set_id, item_id]
+            if expect:
+                sql += f" AND status IN ({', '.join('?' for _ in expect)})"
+                args.extend(expect)
+            cur = self._db.execute(sql, args)
+            self._db.commit()
+        if cur.rowcount <= 0:
+            return False
+        if status in _FINAL:
+            self.store.unpin(item_id)
+        self._notify(item_id)
+        if status in _FINAL and status != STATUS_APPLIED:
+            self._stale_dependents(item_id, status)
+        return True
+
+    def _stale_dependents(self, item_id: str, status: str) -> None:
+        """Заявки, сделанные поверх item_id (context.after), без неё применить нельзя."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, context FROM approvals WHERE status IN (?, ?) AND context LIKE ?",
+                (STATUS_PENDING, STATUS_APPROVED, f"%{item_id}%"),
+            ).fetchall()
+        for dep_id, context in rows:
+            if json.loads(context or "{}").get("after") == item_id:
+                self.mark_stale(dep_id, f"базовая заявка {item_id}: {status}")
+
+    def approve(self, item_id: str, reviewer: str = "user", reason: str = "") -> bool:
+        """pending -> approved. False — заявки нет или решение уже принято."""
+        ok = self._set_status(item_id, STATUS_APPROVED, expect=(STATUS_PENDING,),
+                              reviewer=reviewer, reason=reason or None)
+        if ok:
+            log_info(f"[ApprovalQueue] ✅ {item_id} одобрен ({reviewer})")
+        return ok
+
+    def reject(self, item_id: str, reviewer: str = "user", reason: str = "") -> bool:
+        """pending/approved -> rejected (одобренную, но ещё не применённую заявку можно отозвать)."""
+        ok = self._set_status(item_id, STATUS_REJECTED, expect=(STATUS_PENDING, STATUS_APPROVED),
+                              reviewer=reviewer, reason=reason or None)
+        if ok:
+            log_info(f"[ApprovalQueue] ❌ {item_id} отклонён ({reviewer})")
+        return ok
+
+    def mark_applied(self, item_id: str, set_id: Optional[str]) -> bool:
+        return self._set_status(item_id, STATUS_APPLIED, expect=(STATUS_APPROVED,), set_id=set_id or "")
+
+    def mark_stale(self, item_id: str, reason: str) -> bool:
+        return self._set_status(item_id, STATUS_STALE, expect=(STATUS_PENDING, STATUS_APPROVED), reason=reason)
+
+    def mark_failed(self, item_id: str, reason: str) -> bool:
+        return self._set_status(item_id, STATUS_FAILED, expect=(STATUS_APPROVED,), reason=reason)
+
+    # ---------- чтение ----------
+
+    @staticmethod
+    def _row(row) -> ApprovalItem:
+        (item_id, file, created, status, old_hash, new_hash, diff, diff_ref, added, removed,
+         context, decided, reviewer, reason, set_id) = row
+        return ApprovalItem(
+            id=item_id, file=file, created=created, status=status,
+            old_hash=old_hash, new_hash=new_hash,
+            diff=zlib.decompress(diff).decode("utf-8") if diff is not None else "",
+            diff_ref=diff_ref, added_lines=added, removed_lines=removed,
+            context=json.loads(context) if context else {},
+            decided=decided, reviewer=reviewer, reason=reason, set_id=set_id or None,
+        )
+
+    def get(self, item_id: str) -> Optional[ApprovalItem]:
+        with self._lock:
+            row = self._db.execute(f"SELECT {_COLS} FROM approvals WHERE id = ?", (item_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, status: Optional[str] = None, *, limit: int = 100, offset: int = 0) -> List[ApprovalItem]:
+        with self._lock:
+            if status:
+                rows = self._db.execute(
+                    f"SELECT {_COLS} FROM approvals WHERE status = ? ORDER BY created LIMIT ? OFFSET ?",
+                    (status, int(limit), int(offset)),
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    f"SELECT {_COLS} FROM approvals ORDER BY created DESC LIMIT ? OFFSET ?",
+                    (int(limit), int(offset)),
+                ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def pending(self, limit: int = 100) -> List[ApprovalItem]:
+        return self.list(STATUS_PENDING, limit=limit)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM approvals GROUP BY status").fetchall()
+        out = {s: 0 for s in STATUSES}
+        out.update({s: int(n) for s, n in rows})
+        return out
+
+    def code(self, item: ApprovalItem) -> tuple[Optional[str], str]:
+        """(old_code | None, new_code) заявки из BackupStore."""
+        old = self.store.read(item.old_hash).decode("utf-8") if item.old_hash else None
+        return old, self.store.read(item.new_hash).decode("utf-8")
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._db.close()
+            except Exception as e:
+                log_warning(f"[ApprovalQueue] close: {e}")
+
+
+class ApprovalWorker:
+    """
+    Фоновый поток: забирает одобренные заявки и применяет их через apply_fn(item) -> set_id.
+    apply_fn бросает PatchSetError, если файл изменился (заявка -> stale), прочие ошибки -> failed.
+    Одобрение в этом процессе будит поток сразу, из другого процесса (CLI) — при опросе.
+    """
+
+    def __init__(self, queue: ApprovalQueue, apply_fn: Callable[[ApprovalItem], Optional[str]],
+                 *, poll_interval: float = 2.0):
+        self.queue = queue
+        self.apply_fn = apply_fn
+        self.poll_interval = max(0.1, float(poll_interval))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "ApprovalWorker":
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="approval-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self.queue.wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self.queue.wakeup.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                log_error(f"[ApprovalWorker] цикл: {e}")
+            self.queue.wakeup.wait(self.poll_interval)
+
+    def drain(self) -> int:
+        """Применяет все одобренные заявки (в порядке постановки). Возвращает число применённых."""
+        with self.queue.apply_lock:
+            return self._drain()
+
+    def _drain(self) -> int:
+        from app.modules.improver.patch_set import PatchSetError
+
+        applied = 0
+        for item in self.queue.list(STATUS_APPROVED):
+            if self._stop.is_set():
+                break
+            after = item.context.get("after")
+            if after:
+                base = self.queue.get(after)
+                if base is not None and base.status in (STATUS_PENDING, STATUS_APPROVED):
+                    continue  # ждёт базовую заявку
+                if base is not None and base.status != STATUS_APPLIED:
+                    self.queue.mark_stale(item.id, f"базовая заявка {after}: {base.status}")
+                    continue
+            try:
+                set_id = self.apply_fn(item)
+            except PatchSetError as e:
+                self.queue.mark_stale(item.id, str(e))
+                log_warning(f"[ApprovalWorker] ⚠️ {item.id} устарел: {e}")
+                continue
+            except Exception as e:
+                self.queue.mark_failed(item.id, str(e))
+                log_error(f"[ApprovalWorker] ❌ {item.id} не применён: {e}")
+                continue
+            if self.queue.mark_applied(item.id, set_id):
+                applied += 1
+                log_info(f"[ApprovalWorker] ✅ {item.id} применён ({set_id or 'без изменений'})")
+        return applied
+
+
+_QUEUES: Dict[str, ApprovalQueue] = {}
+_QUEUES_LOCK = threading.Lock()
+
+
+def get_approval_queue(diff_dir: os.PathLike | str, store: BackupStore) -> ApprovalQueue:
+    """Одна очередь на каталог диффов в процессе."""
+    key = str(Path(diff_dir).expanduser().resolve())
+    with _QUEUES_LOCK:
+        q = _QUEUES.get(key)
+        if q is None:
+            q = ApprovalQueue(key, store)
+            _QUEUES[key] = q
+        return q
+
+
+__all__ = [
+    "STATUS_PENDING", "STATUS_APPROVED", "STATUS_REJECTED", "STATUS_APPLIED", "STATUS_STALE",
+    "STATUS_FAILED", "STATUSES", "ApprovalItem", "ApprovalPolicy", "ApprovalQueue", "ApprovalWorker",
+    "get_approval_queue",
+]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """python -m app.modules.improver.approval_queue {list,show,approve,reject,drain} ..."""
+    import argparse
+
+    from app.core.backup_store import get_backup_store
+
+    ap = argparse.ArgumentParser(prog="approval_queue", description="Очередь подтверждения патчей")
+    ap.add_argument("--diff-dir", default="app/patches")
+    ap.add_argument("--backups", default=None, help="корень BackupStore (по умолчанию — общий)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ls = sub.add_parser("list", help="заявки (по умолчанию — ожидающие)")
+    ls.add_argument("--status", default=STATUS_PENDING, help="|".join(STATUSES) + "|all")
+    sh = sub.add_parser("show", help="diff заявки")
+    sh.add_argument("id")
+    for name in ("approve", "reject"):
+        sp = sub.add_parser(name)
+        sp.add_argument("ids", nargs="+")
+        sp.add_argument("--reason", default="")
+        sp.add_argument("--reviewer", default=os.environ.get("USER") or "cli")
+        if name == "approve":
+            sp.add_argument("--apply", action="store_true", help="сразу применить одобренные (как drain)")
+    sub.add_parser("drain", help="применить все одобренные заявки сейчас")
+    args = ap.parse_args(argv)
+
+    queue = ApprovalQueue(args.diff_dir, get_backup_store(args.backups))
+    if args.cmd == "drain":
+        return _drain_cli(args)
+    if args.cmd == "list":
+        for it in queue.list(None if args.status == "all" else args.status):
+            after = f"\tafter={it.context['after']}" if it.context.get("after") else ""
+            print(f"{it.id}\t{it.status}\t{it.when}\t+{it.added_lines}/-{it.removed_lines}\t{it.file}{after}")
+        return 0
+    if args.cmd == "show":
+        it = queue.get(args.id)
+        if it is None:
+            print(f"unknown id: {args.id}")
+            return 1
+        print(f"# {it.id} [{it.status}] {it.file}")
+        print(it.diff)
+        return 0
+    rc = 0
+    for item_id in args.ids:
+        fn = queue.approve if args.cmd == "approve" else queue.reject
+        ok = fn(item_id, reviewer=args.reviewer, reason=args.reason)
+        print(f"{item_id}: {'ok' if ok else 'skipped'}")
+        rc |= 0 if ok else 1
+    if args.cmd == "approve" and args.apply:
+        rc |= _drain_cli(args)
+    return rc
+
+
+def _drain_cli(args) -> int:
+    """
+    Применяет одобренные заявки в этом процессе: воркер процесса, поставившего патч
+    в очередь, мог уже завершиться (CLI-запуск SelfImprover).
+    """
+    from app.core.backup_store import get_backup_store
+    from app.modules.improver.patcher import CodePatcher
+
+    patcher = CodePatcher(diff_dir=args.diff_dir, backup_store=get_backup_store(args.backups))
+    applied = patcher.drain_approvals()
+    counts = patcher.approvals.counts()
+    print(f"applied: {applied}  (stale={counts[STATUS_STALE]}, failed={counts[STATUS_FAILED]})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,328 @@
+# app/modules/improver/diff_engine.py
+"""
+Быстрый построчный diff для CodePatcher/CodeFixer.
+
+- строки интернируются в целые числа (сравнение int вместо str);
+- общий префикс/суффикс срезается на каждом уровне;
+- строки, которых нет в другой последовательности, выбрасываются до поиска
+  (они не могут совпасть) — главный выигрыш на «переписанных» файлах;
+- алгоритмы: myers (линейная память, middle snake), patience, histogram;
+- вывод unified_diff совместим по формату с difflib.unified_diff.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+
+ALGORITHMS = ("myers", "patience", "histogram")
+
+Opcode = Tuple[str, int, int, int, int]
+
+_HISTOGRAM_MAX_CHAIN = 64  # как в git: слишком частые строки не годятся в якоря
+
+
+def _intern(a: Sequence[str], b: Sequence[str]) -> Tuple[List[int], List[int]]:
+    table: Dict[str, int] = {}
+    ia = [table.setdefault(x, len(table)) for x in a]
+    ib = [table.setdefault(x, len(table)) for x in b]
+    return ia, ib
+
+
+# ───────────────────────── myers (linear space) ─────────────────────────
+
+def _middle_split(a: List[int], alo: int, ahi: int, b: List[int], blo: int, bhi: int) -> Tuple[int, int]:
+    """
+    Точка на оптимальном пути редактирования (средняя «змея» Майерса, O((N+M)·D) времени,
+    O(N+M) памяти). Возвращает (x, y) — смещения внутри области, по которым область делится.
+    """
+    n = ahi - alo
+    m = bhi - blo
+    delta = n - m
+    odd = delta & 1
+    max_d = (n + m + 1) // 2
+    off = max_d + 1
+    size = 2 * off + 1
+    vf = [-1] * size
+    vb = [-1] * size
+    vf[off + 1] = 0
+    vb[off + 1] = 0
+
+    for d in range(max_d + 1):
+        # прямой проход
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[off + k - 1] < vf[off + k + 1]):
+                x = vf[off + k + 1]
+            else:
+                x = vf[off + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            vf[off + k] = x
+            if odd:
+                kb = delta - k
+                if -(d - 1) <= kb <= d - 1 and vb[off + kb] != -1 and x + vb[off + kb] >= n:
+                    return x, y
+        # обратный проход (по развёрнутым последовательностям)
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vb[off + k - 1] < vb[off + k + 1]):
+                x = vb[off + k + 1]
+            else:
+                x = vb[off + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                x += 1
+                y += 1
+            vb[off + k] = x
+            if not odd:
+                kf = delta - k
+                if -d <= kf <= d and vf[off + kf] != -1 and vf[off + kf] + x >= n:
+                    return n - x, m - y
+    return n, m  # недостижимо для корректных входов
+
+
+# ───────────────────────── patience / histogram ─────────────────────────
+
+def _patience_anchors(a: List[int], alo: int, ahi: int, b: List[int], blo: int, bhi: int) -> List[Tuple[int, int]]:
+    """Строки, уникальные в обеих областях, упорядоченные по наибольшей возрастающей подпоследовательности."""
+    count_a: Dict[int, int] = {}
+    pos_a: Dict[int, int] = {}
+    for i in range(alo, ahi):
+        v = a[i]
+        count_a[v] = count_a.get(v, 0) + 1
+        pos_a[v] = i
+    count_b: Dict[int, int] = {}
+    pos_b: Dict[int, int] = {}
+    for j in range(blo, bhi):
+        v = b[j]
+        if count_a.get(v) == 1:
+            count_b[v] = count_b.get(v, 0) + 1
+            pos_b[v] = j
+    pairs = sorted((pos_a[v], pos_b[v]) for v, c in count_b.items() if c == 1)
+    if not pairs:
+        return []
+
+    # LIS по j (patience sorting)
+    tails: List[int] = []
+    tails_idx: List[int] = []
+    prev = [-1] * len(pairs)
+    for idx, (_, j) in enumerate(pairs):
+        p = bisect_left(tails, j)
+        if p == len(tails):
+            tails.append(j)
+            tails_idx.append(idx)
+        else:
+            tails[p] = j
+            tails_idx[p] = idx
+        prev[idx] = tails_idx[p - 1] if p > 0 else -1
+    out: List[Tuple[int, int]] = []
+    idx = tails_idx[-1]
+    while idx != -1:
+        out.append(pairs[idx])
+        idx = prev[idx]
+    out.reverse()
+    return out
+
+
+def _histogram_anchor(a: List[int], alo: int, ahi: int, b: List[int], blo: int, bhi: int) -> Tuple[int, int, int]:
+    """
+    Самый длинный общий отрезок вокруг наименее частой в a строки (histogram diff, как в git).
+    Возвращает (i, j, size); size=0 — якоря нет.
+    """
+    occ: Dict[int, List[int]] = {}
+    for i in range(alo, ahi):
+        occ.setdefault(a[i], []).append(i)
+
+    best = (0, 0, 0)
+    best_count = _HISTOGRAM_MAX_CHAIN + 1
+    j = blo
+    while j < bhi:
+        positions = occ.get(b[j])
+        if not positions or len(positions) > best_count:
+            j += 1
+            continue
+        next_j = j + 1
+        for i in positions:
+            s_i, s_j = i, j
+            while s_i > alo and s_j > blo and a[s_i - 1] == b[s_j - 1]:
+                s_i -= 1
+                s_j -= 1
+            e_i, e_j = i + 1, j + 1
+            while e_i < ahi and e_j < bhi and a[e_i] == b[e_j]:
+                e_i += 1
+                e_j += 1
+            size = e_i - s_i
+            cnt = min(len(occ[a[k]]) for k in range(s_i, e_i))
+            if cnt < best_count or (cnt == best_count and size > best[2]):
+                best = (s_i, s_j, size)
+                best_count = cnt
+            next_j = max(next_j, e_j)
+        j = next_j
+    return best
+
+
+# ───────────────────────── ядро ─────────────────────────
+
+def _matches(a: List[int], b: List[int], algorithm: str) -> List[Tuple[int, int]]:
+    """Пары совпавших строк (i, j), строго возрастающие по обоим индексам."""
+    pairs: List[Tuple[int, int]] = []
+    stack: List[Tuple[int, int, int, int]] = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        # общий префикс/суффикс
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            pairs.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            pairs.append((ahi, bhi))
+        if alo >= ahi or blo >= bhi:
+            continue
+
+        if algorithm == "patience":
+            anchors = _patience_anchors(a, alo, ahi, b, blo, bhi)
+            if anchors:
+                pi, pj = alo, blo
+                for i, j in anchors:
+                    pairs.append((i, j))
+                    stack.append((pi, i, pj, j))
+                    pi, pj = i + 1, j + 1
+                stack.append((pi, ahi, pj, bhi))
+                continue
+        elif algorithm == "histogram":
+            i, j, size = _histogram_anchor(a, alo, ahi, b, blo, bhi)
+            if size:
+                pairs.extend((i + k, j + k) for k in range(size))
+                stack.append((alo, i, blo, j))
+                stack.append((i + size, ahi, j + size, bhi))
+                continue
+
+        x, y = _middle_split(a, alo, ahi, b, blo, bhi)
+        if (x, y) in ((0, 0), (ahi - alo, bhi - blo)):
+            continue  # страховка от зацикливания: область целиком — замена
+        stack.append((alo, alo + x, blo, blo + y))
+        stack.append((alo + x, ahi, blo + y, bhi))
+    pairs.sort()
+    return pairs
+
+
+def _reduced(a: List[int], b: List[int], algorithm: str) -> List[Tuple[int, int]]:
+    """Выкидывает строки, которых нет в другой последовательности, и переводит индексы обратно."""
+    in_b = set(b)
+    in_a = set(a)
+    ka = [i for i, v in enumerate(a) if v in in_b]
+    kb = [j for j, v in enumerate(b) if v in in_a]
+    if len(ka) == len(a) and len(kb) == len(b):
+        return _matches(a, b, algorithm)
+    ra = [a[i] for i in ka]
+    rb = [b[j] for j in kb]
+    return [(ka[i], kb[j]) for i, j in _matches(ra, rb, algorithm)]
+
+
+def get_opcodes(a: Sequence[str], b: Sequence[str], algorithm: str = "myers") -> List[Opcode]:
+    """Опкоды в формате difflib.SequenceMatcher.get_opcodes()."""
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"unknown diff algorithm: {algorithm}")
+    ia, ib = _intern(a, b)
+
+    # пары → блоки совпадений (i, j, size)
+    blocks: List[Tuple[int, int, int]] = []
+    for mi, mj in _reduced(ia, ib, algorithm):
+        if blocks:
+            bi, bj, bs = blocks[-1]
+            if mi == bi + bs and mj == bj + bs:
+                blocks[-1] = (bi, bj, bs + 1)
+                continue
+        blocks.append((mi, mj, 1))
+    blocks.append((len(a), len(b), 0))
+
+    codes: List[Opcode] = []
+    i = j = 0
+    for bi, bj, size in blocks:
+        if i < bi and j < bj:
+            codes.append(("replace", i, bi, j, bj))
+        elif i < bi:
+            codes.append(("delete", i, bi, j, bj))
+        elif j < bj:
+            codes.append(("insert", i, bi, j, bj))
+        if size:
+            codes.append(("equal", bi, bi + size, bj, bj + size))
+        i, j = bi + size, bj + size
+    return codes
+
+
+def get_grouped_opcodes(codes: List[Opcode], n: int = 3) -> Iterator[List[Opcode]]:
+    """Группы изменений с n строками контекста (как SequenceMatcher.get_grouped_opcodes)."""
+    codes = list(codes) or [("equal", 0, 1, 0, 1)]
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    nn = n + n
+    group: List[Opcode] = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal" and i2 - i1 > nn:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+
+def _format_range(start: int, stop: int) -> str:
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def unified_diff(
+    a: Sequence[str],
+    b: Sequence[str],
+    fromfile: str = "",
+    tofile: str = "",
+    fromfiledate: str = "",
+    tofiledate: str = "",
+    n: int = 3,
+    lineterm: str = "\n",
+    *,
+    algorithm: str = "myers",
+) -> Iterator[str]:
+    """Замена difflib.unified_diff с той же сигнатурой и форматом вывода."""
+    started = False
+    for group in get_grouped_opcodes(get_opcodes(a, b, algorithm), n):
+        if not started:
+            started = True
+            fromdate = f"\t{fromfiledate}" if fromfiledate else ""
+            todate = f"\t{tofiledate}" if tofiledate else ""
+            yield f"--- {fromfile}{fromdate}{lineterm}"
+            yield f"+++ {tofile}{todate}{lineterm}"
+
+        first, last = group[0], group[-1]
+        yield f"@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@{lineterm}"
+
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield " " + line
+                continue
+            if tag in ("replace", "delete"):
+                for line in a[i1:i2]:
+                    yield "-" + line
+            if tag in ("replace", "insert"):
+                for line in b[j1:j2]:
+                    yield "+" + line
+
+
+__all__ = ["ALGORITHMS", "get_opcodes", "get_grouped_opcodes", "unified_diff"]
@@ -1,6 +1,6 @@
-import json
 from typing import Optional
 from app.logger import log_info, log_error
+from app.modules.improver.patch_requester import PatchRequester
 
 
 class ErrorDebugger:
@@ -36,10 +36,14 @@ class ErrorDebugger:
 
     def request_fix(self, file_path: str, original_code: str, error_message: str) -> Optional[str]:
         try:
-            messages = self.build_prompt(file_path, original_code, error_message)
-            response = self.chatgpt.chat(messages)
+            system_msg, user_msg = (m["content"] for m in self.build_prompt(file_path, original_code, error_message))
+            # CodeAnalyzer.chat принимает строку-промпт + system_msg, а не список messages
+            response = self.chatgpt.chat(user_msg, system_msg=system_msg)
+            code = PatchRequester.extract_code(response)
+            if not code:
+                return None
             log_info(f"[ErrorDebugger] ✅ Получен исправленный код для {file_path}.")
-            return response
+            return code
         except Exception as e:
             log_error(f"[ErrorDebugger] ❌ Ошибка при запросе исправления: {e}")
             return None
\ No newline at end of file
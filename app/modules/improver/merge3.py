@@ -0,0 +1,159 @@
+# app/modules/improver/merge3.py
+"""
+Трёхсторонний построчный merge (diff3) для сохранённых диффов.
+
+base    — код, против которого модель сгенерировала патч;
+current — файл сейчас (после чужих патчей/правок);
+patched — код из патча (base + изменения модели).
+
+Области, совпадающие с base в обеих версиях, — точки синхронизации; между ними
+каждый кусок либо менялся только в одной версии (берём её), либо одинаково в обеих,
+либо по-разному — конфликт с точными диапазонами строк во всех трёх версиях.
+Сопоставление строк — diff_engine (тот же алгоритм, что и для диффов).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import List, Sequence, Tuple
+
+from app.modules.improver.diff_engine import get_opcodes
+
+MARK_CURRENT = "<<<<<<< current"
+MARK_BASE = "||||||| base"
+MARK_SEP = "======="
+MARK_PATCH = ">>>>>>> patch"
+
+
+@dataclass
+class MergeConflict:
+    """Конфликтующий кусок. Диапазоны — [start, end) в строках (0-based) каждой версии."""
+    base: Tuple[int, int]
+    current: Tuple[int, int]
+    patched: Tuple[int, int]
+    base_lines: List[str] = field(default_factory=list)
+    current_lines: List[str] = field(default_factory=list)
+    patched_lines: List[str] = field(default_factory=list)
+
+    def describe(self) -> str:
+        def rng(r: Tuple[int, int]) -> str:
+            return f"{r[0] + 1}-{r[1]}" if r[1] > r[0] else f"{r[0]}+0"
+        return f"base L{rng(self.base)}, current L{rng(self.current)}, patch L{rng(self.patched)}"
+
+
+@dataclass
+class MergeResult:
+    lines: List[str]                    # результат; в местах конфликтов — версия current
+    conflicts: List[MergeConflict]
+    marked: List[str]                   # результат с маркерами конфликтов (как git merge-file --diff3)
+    taken_from_patch: int = 0           # кусков патча перенесено без конфликта
+
+    @property
+    def ok(self) -> bool:
+        return not self.conflicts
+
+    @property
+    def text(self) -> str:
+        return "".join(self.lines)
+
+    @property
+    def marked_text(self) -> str:
+        return "".join(self.marked)
+
+
+def _matching_blocks(a: Sequence[str], b: Sequence[str], algorithm: str) -> List[Tuple[int, int, int]]:
+    return [(i1, j1, i2 - i1) for tag, i1, i2, j1, _ in get_opcodes(a, b, algorithm) if tag == "equal"]
+
+
+def _sync_regions(
+    base: Sequence[str], cur: Sequence[str], new: Sequence[str], algorithm: str,
+) -> List[Tuple[int, int, int, int, int, int]]:
+    """
+    Области, где base совпадает одновременно с current и patched:
+    (base_lo, base_hi, cur_lo, cur_hi, new_lo, new_hi). Последняя — пустая, в конце всех трёх.
+    """
+    ma = _matching_blocks(base, cur, algorithm)
+    mb = _matching_blocks(base, new, algorithm)
+    out: List[Tuple[int, int, int, int, int, int]] = []
+    ia = ib = 0
+    while ia < len(ma) and ib < len(mb):
+        i, ai, alen = ma[ia]
+        j, bj, blen = mb[ib]
+        lo = max(i, j)
+        hi = min(i + alen, j + blen)
+        if lo < hi:
+            a_lo = ai + (lo - i)
+            b_lo = bj + (lo - j)
+            out.append((lo, hi, a_lo, a_lo + (hi - lo), b_lo, b_lo + (hi - lo)))
+        if i + alen < j + blen:
+            ia += 1
+        else:
+            ib += 1
+    out.append((len(base), len(base), len(cur), len(cur), len(new), len(new)))
+    return out
+
+
+def merge3(
+    base: Sequence[str],
+    current: Sequence[str],
+    patched: Sequence[str],
+    *,
+    algorithm: str = "myers",
+) -> MergeResult:
+    """Трёхсторонний merge списков строк (с окончаниями строк, как splitlines(keepends=True))."""
+    lines: List[str] = []
+    marked: List[str] = []
+    conflicts: List[MergeConflict] = []
+    taken = 0
+    iz = ic = ip = 0
+    for zlo, zhi, clo, chi, plo, phi in _sync_regions(base, current, patched, algorithm):
+        b_chunk = list(base[iz:zlo])
+        c_chunk = list(current[ic:clo])
+        p_chunk = list(patched[ip:plo])
+        if b_chunk or c_chunk or p_chunk:
+            if c_chunk == b_chunk or c_chunk == p_chunk:
+                # менялся только патч (или обе стороны одинаково)
+                if p_chunk != b_chunk and c_chunk != p_chunk:
+                    taken += 1
+                lines.extend(p_chunk)
+                marked.extend(p_chunk)
+            elif p_chunk == b_chunk:
+                # менялся только файл
+                lines.extend(c_chunk)
+                marked.extend(c_chunk)
+            else:
+                conflicts.append(MergeConflict(
+                    base=(iz, zlo), current=(ic, clo), patched=(ip, plo),
+                    base_lines=b_chunk, current_lines=c_chunk, patched_lines=p_chunk,
+                ))
+                lines.extend(c_chunk)
+                marked.append(MARK_CURRENT + "\n")
+                marked.extend(_terminated(c_chunk))
+                marked.append(MARK_BASE + "\n")
+                marked.extend(_terminated(b_chunk))
+                marked.append(MARK_SEP + "\n")
+                marked.extend(_terminated(p_chunk))
+                marked.append(MARK_PATCH + "\n")
+        same = list(current[clo:chi])
+        lines.extend(same)
+        marked.extend(same)
+        iz, ic, ip = zhi, chi, phi
+    return MergeResult(lines=lines, conflicts=conflicts, marked=marked, taken_from_patch=taken)
+
+
+def _terminated(chunk: List[str]) -> List[str]:
+    """Последняя строка куска без перевода строки не должна склеиться с маркером."""
+    if chunk and not chunk[-1].endswith(("\n", "\r")):
+        return chunk[:-1] + [chunk[-1] + "\n"]
+    return chunk
+
+
+def merge3_text(base: str, current: str, patched: str, *, algorithm: str = "myers") -> MergeResult:
+    return merge3(
+        base.splitlines(keepends=True),
+        current.splitlines(keepends=True),
+        patched.splitlines(keepends=True),
+        algorithm=algorithm,
+    )
+
+
+__all__ = ["MergeConflict", "MergeResult", "merge3", "merge3_text"]
@@ -0,0 +1,299 @@
+# app/modules/improver/patch_archive.py
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.logger import log_info, log_warning
+
+ARCHIVE_FILENAME = "archive.sqlite"
+ARCHIVE_REF_SEP = "#"  # ссылка на запись: "<archive.sqlite>#<change_id>"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id   TEXT PRIMARY KEY,
+    started  REAL NOT NULL,
+    label    TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS patches (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    change_id  TEXT NOT NULL UNIQUE,
+    run_id     TEXT NOT NULL,
+    file       TEXT NOT NULL,
+    rel        TEXT NOT NULL DEFAULT '',
+    ts         REAL NOT NULL,
+    diff       BLOB,
+    meta       TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_patches_file ON patches(file, ts);
+CREATE INDEX IF NOT EXISTS ix_patches_run ON patches(run_id, ts);
+"""
+
+
+@dataclass
+class ArchivedPatch:
+    change_id: str
+    run_id: str
+    file: str
+    rel: str
+    ts: float
+    diff: Optional[str]
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+def new_change_id() -> str:
+    """Уникальный id изменения: время + случайный хвост (раньше было int(time()) и коллизии в одну секунду)."""
+    return datetime.now().strftime("%Y%m%d_%H%M%S") + "_" + uuid.uuid4().hex[:8]
+
+
+def split_ref(ref: Optional[str]) -> Optional[str]:
+    """change_id из ссылки "<archive>#<change_id>" или None, если это обычный путь."""
+    if not ref or ARCHIVE_REF_SEP not in ref:
+        return None
+    head, _, change_id = ref.rpartition(ARCHIVE_REF_SEP)
+    return change_id if head.endswith(ARCHIVE_FILENAME) else None
+
+
+class PatchArchive:
+    """
+    Архив диффов и метаданных в одном sqlite-файле вместо тысяч .diff.txt/.meta.json.
+
+    - runs: один запуск (SelfImprover, CodeFixer, …) — run_id;
+    - patches: дифф (zlib) + метаданные (JSON) на изменение, доступ по change_id,
+      по файлу и по run_id;
+    - export_legacy(): выгрузка в прежнюю раскладку <rel>.<ts>.diff.txt / .meta.json.
+    """
+
+    def __init__(self, path: os.PathLike | str):
+        p = Path(path).expanduser().resolve()
+        if p.suffix != ".sqlite":
+            p = p / ARCHIVE_FILENAME
+        p.parent.mkdir(parents=True, exist_ok=True)
+        self.path = p
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(p), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    # ---------- запись ----------
+
+    def begin_run(self, label: str = "", run_id: Optional[str] = None) -> str:
+        run_id = run_id or ("run_" + new_change_id())
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO runs(run_id, started, label) VALUES (?, ?, ?)",
+                (run_id, time.time(), label or ""),
+            )
+            self._db.commit()
+        return run_id
+
+    def add(
+        self,
+        file: str,
+        diff_text: Optional[str],
+        *,
+        run_id: str,
+        change_id: Optional[str] = None,
+        rel: str = "",
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Добавляет изменение; возвращает change_id."""
+        change_id = change_id or new_change_id()
+        blob = zlib.compress(diff_text.encode("utf-8"), 6) if diff_text is not None else None
+        with self._lock:
+            self.begin_run(run_id=run_id)
+            self._db.execute(
+                "INSERT INTO patches(change_id, run_id, file, rel, ts, diff, meta) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (change_id, run_id, file, rel, time.time(), blob,
+                 json.dumps(meta, ensure_ascii=False) if meta is not None else None),
+            )
+            self._db.commit()
+        return change_id
+
+    def set_meta(self, change_id: str, meta: Dict[str, Any]) -> bool:
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE patches SET meta = ? WHERE change_id = ?",
+                (json.dumps(meta, ensure_ascii=False), change_id),
+            )
+            self._db.commit()
+        return cur.rowcount > 0
+
+    def ref(self, change_id: str) -> str:
+        return f"{self.path}{ARCHIVE_REF_SEP}{change_id}"
+
+    # ---------- чтение ----------
+
+    _COLS = "change_id, run_id, file, rel, ts, diff, meta"
+
+    @staticmethod
+    def _row(row) -> ArchivedPatch:
+        change_id, run_id, file, rel, ts, diff, meta = row
+        return ArchivedPatch(
+            change_id=change_id,
+            run_id=run_id,
+            file=file,
+            rel=rel,
+            ts=ts,
+            diff=zlib.decompress(diff).decode("utf-8") if diff is not None else None,
+            meta=json.loads(meta) if meta else {},
+        )
+
+    def get(self, change_id: str) -> Optional[ArchivedPatch]:
+        with self._lock:
+            row = self._db.execute(f"SELECT {self._COLS} FROM patches WHERE change_id = ?", (change_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def by_file(self, file: str, limit: int = 50, offset: int = 0) -> List[ArchivedPatch]:
+        file = str(Path(file).expanduser().resolve())
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {self._COLS} FROM patches WHERE file = ? ORDER BY ts DESC, id DESC LIMIT ? OFFSET ?",
+                (file, int(limit), int(offset)),
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def by_run(self, run_id: str) -> List[ArchivedPatch]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {self._COLS} FROM patches WHERE run_id = ? ORDER BY ts, id", (run_id,)
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def runs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT r.run_id, r.started, r.label, COUNT(p.id) FROM runs r "
+                "LEFT JOIN patches p ON p.run_id = r.run_id GROUP BY r.run_id ORDER BY r.started DESC LIMIT ?",
+                (int(limit),),
+            ).fetchall()
+        return [{"run_id": r[0], "started": r[1], "label": r[2], "patches": r[3]} for r in rows]
+
+    # ---------- экспорт ----------
+
+    def export_legacy(self, out_dir: os.PathLike | str, *, run_id: Optional[str] = None) -> int:
+        """
+        Пишет прежнюю раскладку: <out_dir>/<rel>.<ts>.diff.txt и .meta.json.
+        run_id=None — весь архив. Возвращает число выгруженных изменений.
+        """
+        out = Path(out_dir)
+        with self._lock:
+            if run_id:
+                rows = self._db.execute(
+                    f"SELECT {self._COLS} FROM patches WHERE run_id = ? ORDER BY ts, id", (run_id,)
+                ).fetchall()
+            else:
+                rows = self._db.execute(f"SELECT {self._COLS} FROM patches ORDER BY ts, id").fetchall()
+        n = 0
+        for row in rows:
+            rec = self._row(row)
+            ts = datetime.fromtimestamp(rec.ts).strftime("%Y%m%d_%H%M%S")
+            base = out / (rec.rel or Path(rec.file).name)
+            base.parent.mkdir(parents=True, exist_ok=True)
+            # в одну секунду может попасть несколько изменений одного файла — добавляем хвост change_id
+            stem = f"{base.name}.{ts}"
+            if (base.parent / f"{stem}.diff.txt").exists() or (base.parent / f"{stem}.meta.json").exists():
+                stem = f"{stem}_{rec.change_id[-8:]}"
+            if rec.diff is not None:
+                (base.parent / f"{stem}.diff.txt").write_text(rec.diff, encoding="utf-8")
+            if rec.meta:
+                (base.parent / f"{stem}.meta.json").write_text(
+                    json.dumps(rec.meta, ensure_ascii=False, indent=2), encoding="utf-8"
+                )
+            n += 1
+        log_info(f"[PatchArchive] экспортировано изменений: {n} -> {out}")
+        return n
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._db.close()
+            except Exception as e:
+                log_warning(f"[PatchArchive] close: {e}")
+
+
+_ARCHIVES: Dict[str, PatchArchive] = {}
+_ARCHIVES_LOCK = threading.Lock()
+
+
+def get_patch_archive(diff_dir: os.PathLike | str) -> PatchArchive:
+    """Один архив на каталог диффов (несколько CodePatcher в процессе пишут в одно соединение)."""
+    key = str(Path(diff_dir).expanduser().resolve())
+    with _ARCHIVES_LOCK:
+        arc = _ARCHIVES.get(key)
+        if arc is None:
+            arc = PatchArchive(key)
+            _ARCHIVES[key] = arc
+        return arc
+
+
+__all__ = [
+    "ARCHIVE_FILENAME", "ArchivedPatch", "PatchArchive",
+    "new_change_id", "split_ref", "get_patch_archive",
+]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    python -m app.modules.improver.patch_archive export <diff_dir> <out_dir> [--run RUN_ID]
+    python -m app.modules.improver.patch_archive apply <diff_dir> <change_id> [--marked OUT]
+    """
+    import argparse
+
+    ap = argparse.ArgumentParser(prog="patch_archive", description="Архив патчей: просмотр и экспорт")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export", help="выгрузить в прежнюю раскладку .diff.txt/.meta.json")
+    ex.add_argument("diff_dir")
+    ex.add_argument("out_dir")
+    ex.add_argument("--run", default=None)
+    ls = sub.add_parser("runs", help="последние запуски")
+    ls.add_argument("diff_dir")
+    apl = sub.add_parser("apply", help="применить сохранённый дифф (3-way merge против базы)")
+    apl.add_argument("diff_dir")
+    apl.add_argument("change_id")
+    apl.add_argument("--backups", default=None, help="корень BackupStore (по умолчанию — общий)")
+    apl.add_argument("--marked", default=None, help="при конфликте записать сюда файл с маркерами")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "apply":
+        return _apply_cmd(args)
+
+    arc = PatchArchive(args.diff_dir)
+    if args.cmd == "export":
+        print(arc.export_legacy(args.out_dir, run_id=args.run))
+    else:
+        for r in arc.runs():
+            started = datetime.fromtimestamp(r["started"]).isoformat(timespec="seconds")
+            print(f"{r['run_id']}\t{started}\t{r['patches']}\t{r['label']}")
+    return 0
+
+
+def _apply_cmd(args) -> int:
+    from app.core.backup_store import get_backup_store
+    from app.modules.improver.patcher import CodePatcher
+
+    patcher = CodePatcher(diff_dir=args.diff_dir, backup_store=get_backup_store(args.backups))
+    res = patcher.apply_saved_diff(args.change_id)
+    print(f"{res.change_id}\t{res.status}\t{res.file}" + (f"\t{res.set_id}" if res.set_id else ""))
+    if res.merge is not None and res.merge.conflicts:
+        for c in res.merge.conflicts:
+            print(f"conflict: {c.describe()}")
+        if args.marked:
+            Path(args.marked).write_text(res.merge.marked_text, encoding="utf-8")
+            print(f"marked: {args.marked}")
+    return 0 if res.ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
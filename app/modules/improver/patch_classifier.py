@@ -0,0 +1,136 @@
+# app/modules/improver/patch_classifier.py
+from __future__ import annotations
+
+import ast
+import re
+from typing import List, Optional
+
+try:
+    import black  # опционально: нормализация форматирования
+except Exception:
+    black = None  # type: ignore
+
+PATCH_IDENTICAL = "identical"   # тот же текст (с точностью до концов строк/хвостовых пробелов)
+PATCH_COSMETIC = "cosmetic"     # отличия только в форматировании/комментариях/докстрингах/порядке импортов
+PATCH_SEMANTIC = "semantic"     # реальное изменение кода
+
+_TRAILING_WS = re.compile(r"[ \t]+$", re.MULTILINE)
+
+
+def _normalize_text(code: str, *, format_code: bool = False) -> str:
+    text = (code or "").replace("\r\n", "\n").replace("\r", "\n")
+    if format_code and black is not None:
+        try:
+            text = black.format_str(text, mode=black.Mode())
+        except Exception:
+            pass
+    return _TRAILING_WS.sub("", text).strip("\n")
+
+
+def _strip_docstring(body: List[ast.stmt]) -> List[ast.stmt]:
+    if body and isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], "value", None), ast.Constant) \
+            and isinstance(body[0].value.value, str):
+        return body[1:] or [ast.Pass()]
+    return body
+
+
+def _import_key(node: ast.stmt) -> str:
+    return ast.dump(node, annotate_fields=False)
+
+
+def _bound_names(node: ast.stmt) -> Optional[List[str]]:
+    """Имена, которые связывает импорт; None — `from m import *` (набор имён неизвестен)."""
+    names: List[str] = []
+    for alias in node.names:  # type: ignore[attr-defined]
+        if alias.name == "*":
+            return None
+        if alias.asname:
+            names.append(alias.asname)
+        elif isinstance(node, ast.Import):
+            names.append(alias.name.split(".")[0])
+        else:
+            names.append(alias.name)
+    return names
+
+
+def _sorted_run(run: List[ast.stmt]) -> List[ast.stmt]:
+    """
+    Блок импортов в каноническом порядке — только если имена, связываемые импортами, не пересекаются:
+    `from a import x` / `from b import x` в другом порядке меняет, какой x останется.
+    """
+    seen = set()
+    for node in run:
+        names = _bound_names(node)
+        if names is None or seen.intersection(names):
+            return run
+        seen.update(names)
+    return sorted(run, key=_import_key)
+
+
+def _sort_import_runs(body: List[ast.stmt]) -> List[ast.stmt]:
+    """Сортирует подряд идущие блоки import/from-import (порядок внутри блока семантики не несёт)."""
+    out: List[ast.stmt] = []
+    run: List[ast.stmt] = []
+    for node in body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)) and not (
+            isinstance(node, ast.ImportFrom) and node.module == "__future__"
+        ):
+            run.append(node)
+            continue
+        if run:
+            out.extend(_sorted_run(run))
+            run = []
+        out.append(node)
+    if run:
+        out.extend(_sorted_run(run))
+    return out
+
+
+def normalized_ast(code: str) -> Optional[str]:
+    """
+    Нормализованный дамп AST: без докстрингов и комментариев, с отсортированными
+    блоками импортов. None — если код не парсится.
+    """
+    try:
+        tree = ast.parse(code or "")
+    except (SyntaxError, ValueError):
+        return None
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            node.body = _strip_docstring(node.body)
+            node.body = _sort_import_runs(node.body)
+    return ast.dump(tree, annotate_fields=False, include_attributes=False)
+
+
+def classify_patch(old_code: str, new_code: str, *, python: bool = True, format_code: bool = False) -> str:
+    """
+    identical | cosmetic | semantic.
+
+    python=False — для не-Python файлов сравнивается только текст (identical/semantic).
+    format_code=True дополнительно нормализует форматирование через black (если установлен).
+    Если какая-либо из версий не парсится — патч считается семантическим (пусть решает валидатор).
+    """
+    if _normalize_text(old_code) == _normalize_text(new_code):
+        return PATCH_IDENTICAL
+    if not python:
+        return PATCH_SEMANTIC
+    if format_code and _normalize_text(old_code, format_code=True) == _normalize_text(new_code, format_code=True):
+        return PATCH_COSMETIC
+    old_ast = normalized_ast(old_code)
+    if old_ast is None:
+        return PATCH_SEMANTIC
+    new_ast = normalized_ast(new_code)
+    if new_ast is not None and old_ast == new_ast:
+        return PATCH_COSMETIC
+    return PATCH_SEMANTIC
+
+
+def is_noop_patch(old_code: str, new_code: str, *, python: bool = True, format_code: bool = False) -> bool:
+    """True, если патч не меняет поведение кода (identical/cosmetic)."""
+    return classify_patch(old_code, new_code, python=python, format_code=format_code) != PATCH_SEMANTIC
+
+
+__all__ = [
+    "PATCH_IDENTICAL", "PATCH_COSMETIC", "PATCH_SEMANTIC",
+    "normalized_ast", "classify_patch", "is_noop_patch",
+]
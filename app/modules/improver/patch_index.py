@@ -0,0 +1,234 @@
+# app/modules/improver/patch_index.py
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+INDEX_FILENAME = "index.sqlite"
+
+TEST_PASSED = "passed"
+TEST_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patch_index (
+    change_id    TEXT PRIMARY KEY,
+    run_id       TEXT,
+    set_id       TEXT,
+    file         TEXT NOT NULL,
+    ts           REAL NOT NULL,
+    mode         TEXT,
+    old_len      INTEGER,
+    new_len      INTEGER,
+    old_hash     TEXT,
+    new_hash     TEXT,
+    diff_ref     TEXT,
+    model        TEXT,
+    latency_ms   REAL,
+    test_status  TEXT,
+    test_rc      INTEGER,
+    rolled_back  INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_pi_file_ts ON patch_index(file, ts);
+CREATE INDEX IF NOT EXISTS ix_pi_ts ON patch_index(ts);
+CREATE INDEX IF NOT EXISTS ix_pi_run ON patch_index(run_id);
+CREATE INDEX IF NOT EXISTS ix_pi_set ON patch_index(set_id);
+"""
+
+_COLUMNS = (
+    "change_id", "run_id", "set_id", "file", "ts", "mode", "old_len", "new_len",
+    "old_hash", "new_hash", "diff_ref", "model", "latency_ms", "test_status", "test_rc", "rolled_back",
+)
+
+
+@dataclass
+class PatchEntry:
+    change_id: str
+    run_id: Optional[str]
+    set_id: Optional[str]
+    file: str
+    ts: float
+    mode: Optional[str]
+    old_len: Optional[int]
+    new_len: Optional[int]
+    old_hash: Optional[str]
+    new_hash: Optional[str]
+    diff_ref: Optional[str]
+    model: Optional[str]
+    latency_ms: Optional[float]
+    test_status: Optional[str]
+    test_rc: Optional[int]
+    rolled_back: int = 0
+
+    @property
+    def when(self) -> str:
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.ts))
+
+
+class PatchIndex:
+    """
+    Индекс метаданных применённых патчей (sqlite): файл, change_id, run_id, set_id,
+    размеры, хэши, модель, латентность, результат теста, факт отката.
+
+    Обновляется CodePatcher при сохранении метаданных, CodeFixer — результатом теста,
+    откаты набора помечают записи rolled_back. Запросы — с фильтрами и пагинацией.
+    """
+
+    def __init__(self, path: os.PathLike | str):
+        p = Path(path).expanduser().resolve()
+        if p.suffix != ".sqlite":
+            p = p / INDEX_FILENAME
+        p.parent.mkdir(parents=True, exist_ok=True)
+        self.path = p
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(p), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    # ---------- запись ----------
+
+    def record(self, meta: Dict[str, Any], **extra: Any) -> str:
+        """Upsert по change_id из метаданных патча (+ extra: model, latency_ms, diff_ref, ...)."""
+        row = {k: meta.get(k) for k in _COLUMNS if k in meta}
+        row.update({k: v for k, v in extra.items() if k in _COLUMNS and v is not None})
+        row["file"] = str(Path(row.get("file") or "").expanduser().resolve())
+        row.setdefault("ts", time.time())
+        row.setdefault("rolled_back", 0)
+        if not row.get("change_id"):
+            raise ValueError("meta без change_id")
+        cols = [c for c in _COLUMNS if c in row]
+        sql = (
+            f"INSERT INTO patch_index({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)}) "
+            f"ON CONFLICT(change_id) DO UPDATE SET "
+            + ", ".join(f"{c}=excluded.{c}" for c in cols if c != "change_id")
+        )
+        with self._lock:
+            self._db.execute(sql, [row[c] for c in cols])
+            self._db.commit()
+        return row["change_id"]
+
+    def set_test_result(self, change_id: str, passed: bool, return_code: Optional[int] = None) -> bool:
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE patch_index SET test_status = ?, test_rc = ? WHERE change_id = ?",
+                (TEST_PASSED if passed else TEST_FAILED, return_code, change_id),
+            )
+            self._db.commit()
+        return cur.rowcount > 0
+
+    def mark_rolled_back(self, *, change_id: Optional[str] = None, set_id: Optional[str] = None) -> int:
+        if not change_id and not set_id:
+            return 0
+        with self._lock:
+            if set_id:
+                cur = self._db.execute("UPDATE patch_index SET rolled_back = 1 WHERE set_id = ?", (set_id,))
+            else:
+                cur = self._db.execute("UPDATE patch_index SET rolled_back = 1 WHERE change_id = ?", (change_id,))
+            self._db.commit()
+        return cur.rowcount
+
+    # ---------- запросы ----------
+
+    @staticmethod
+    def _where(
+        file: Optional[str] = None,
+        file_like: Optional[str] = None,
+        run_id: Optional[str] = None,
+        set_id: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        test_status: Optional[str] = None,
+        model: Optional[str] = None,
+        include_rolled_back: bool = True,
+    ) -> Tuple[str, List[Any]]:
+        cond: List[str] = []
+        args: List[Any] = []
+        if file:
+            cond.append("file = ?")
+            args.append(str(Path(file).expanduser().resolve()))
+        if file_like:
+            cond.append("file LIKE ?")
+            args.append(f"%{file_like}%")
+        if run_id:
+            cond.append("run_id = ?")
+            args.append(run_id)
+        if set_id:
+            cond.append("set_id = ?")
+            args.append(set_id)
+        if since is not None:
+            cond.append("ts >= ?")
+            args.append(float(since))
+        if until is not None:
+            cond.append("ts < ?")
+            args.append(float(until))
+        if test_status == "none":
+            cond.append("test_status IS NULL")
+        elif test_status:
+            cond.append("test_status = ?")
+            args.append(test_status)
+        if model:
+            cond.append("model = ?")
+            args.append(model)
+        if not include_rolled_back:
+            cond.append("rolled_back = 0")
+        return (" WHERE " + " AND ".join(cond)) if cond else "", args
+
+    def query(self, *, limit: int = 50, offset: int = 0, **filters: Any) -> List[PatchEntry]:
+        """
+        Фильтры: file, file_like, run_id, set_id, since/until (epoch), test_status
+        ("passed" | "failed" | "none"), model, include_rolled_back. Сортировка — новые первыми.
+        """
+        where, args = self._where(**filters)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM patch_index{where} ORDER BY ts DESC LIMIT ? OFFSET ?",
+                args + [int(limit), int(offset)],
+            ).fetchall()
+        return [PatchEntry(*r) for r in rows]
+
+    def count(self, **filters: Any) -> int:
+        where, args = self._where(**filters)
+        with self._lock:
+            return int(self._db.execute(f"SELECT COUNT(*) FROM patch_index{where}", args).fetchone()[0])
+
+    def get(self, change_id: str) -> Optional[PatchEntry]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM patch_index WHERE change_id = ?", (change_id,)
+            ).fetchone()
+        return PatchEntry(*row) if row else None
+
+    def latest_for_file(self, file: str, *, include_rolled_back: bool = False) -> Optional[PatchEntry]:
+        rows = self.query(file=file, include_rolled_back=include_rolled_back, limit=1)
+        return rows[0] if rows else None
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._db.close()
+            except Exception:
+                pass
+
+
+_INDEXES: Dict[str, PatchIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_patch_index(diff_dir: os.PathLike | str = "app/patches") -> PatchIndex:
+    """Один индекс на каталог диффов (CodePatcher, CodeFixer и PanelHistory читают одно и то же)."""
+    key = str(Path(diff_dir).expanduser().resolve())
+    with _INDEXES_LOCK:
+        idx = _INDEXES.get(key)
+        if idx is None:
+            idx = PatchIndex(key)
+            _INDEXES[key] = idx
+        return idx
+
+
+__all__ = ["TEST_PASSED", "TEST_FAILED", "PatchEntry", "PatchIndex", "get_patch_index"]
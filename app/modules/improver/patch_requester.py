@@ -44,6 +44,46 @@ class PatchRequester:
             "----- КОНЕЦ ИСХОДНИКА -----\n"
         )
 
+    NO_CHANGES = "NO_CHANGES"
+
+    UNIT_SYSTEM_MSG = (
+        "Ты — помощник-программист. Тебе дают ОДНУ функцию или класс из большого файла "
+        "и минимальный контекст (импорты, сигнатуры соседей). Обновляй только этот фрагмент "
+        "строго по плану, не меняй его имя и внешний контракт. Возвращай ПОЛНЫЙ ТЕКСТ ФРАГМЕНТА "
+        "без Markdown и пояснений, либо ровно NO_CHANGES, если менять нечего."
+    )
+
+    def build_unit_prompt(
+        self,
+        file_path: str,
+        unit_name: str,
+        unit_source: str,
+        context: str,
+        plan_data: Dict
+    ) -> str:
+        """
+        Промпт для режима декомпозиции больших файлов: модель видит только один юнит
+        (функцию/класс) и нужный ему контекст, а возвращает только новую версию юнита.
+        """
+        plan = plan_data.get("plan", "").strip()
+        comment = plan_data.get("comment", "").strip()
+
+        return (
+            f"Путь к файлу: {file_path}\n"
+            f"Фрагмент: {unit_name}\n\n"
+            f"Комментарий:\n{comment}\n\n"
+            f"ПЛАН ИЗМЕНЕНИЙ:\n{plan}\n\n"
+            "Контекст (только для справки, НЕ возвращай его):\n"
+            "----- НАЧАЛО КОНТЕКСТА -----\n"
+            f"{context}\n"
+            "----- КОНЕЦ КОНТЕКСТА -----\n\n"
+            f"Верни ПОЛНЫЙ обновлённый текст '{unit_name}' (с декораторами), без Markdown. "
+            f"Если изменения не нужны — верни ровно {self.NO_CHANGES}.\n\n"
+            "----- НАЧАЛО ФРАГМЕНТА -----\n"
+            f"{unit_source}\n"
+            "----- КОНЕЦ ФРАГМЕНТА -----\n"
+        )
+
     # Опционально (для UI/логов): если нужно отрисовывать messages
     def build_messages(self, file_path: str, file_content: str, summary: str, plan_data: Dict) -> list[dict]:
         return [
@@ -0,0 +1,385 @@
+# app/modules/improver/patch_set.py
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl  # POSIX: межпроцессная блокировка журнала
+except Exception:  # Windows
+    fcntl = None  # type: ignore
+
+from app.core.backup_store import BackupStore
+from app.logger import log_info, log_warning, log_error
+
+# состояния журнала
+STATE_PREPARED = "prepared"        # журнал и бэкапы записаны, файлы ещё не тронуты
+STATE_APPLYING = "applying"        # идёт замена файлов
+STATE_COMMITTED = "committed"      # все файлы записаны
+STATE_ROLLED_BACK = "rolled_back"  # набор откатан (вручную или при восстановлении)
+
+_PENDING = (STATE_PREPARED, STATE_APPLYING)
+LOCK_FILENAME = ".lock"
+
+
+class PatchSetError(RuntimeError):
+    """Набор нельзя применить/откатить (устаревший old_code, конфликт, неизвестный set_id)."""
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _fsync_dir(path: Path) -> None:
+    """fsync каталога — чтобы rename() пережил падение. На Windows недоступно — молча пропускаем."""
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # процесс есть, но чужой
+    except OSError:
+        return False
+    return True
+
+
+@dataclass
+class FileEdit:
+    """Одна правка набора. old_hash=None — файла до применения не было."""
+    path: str
+    old_hash: Optional[str]
+    new_hash: str
+    new_size: int = 0
+
+
+@dataclass
+class PatchSet:
+    set_id: str
+    edits: List[FileEdit]
+    state: str = STATE_PREPARED
+    created_at: float = field(default_factory=time.time)
+    label: str = ""
+    owner_pid: Optional[int] = None  # процесс, применяющий набор (восстановление не трогает живых)
+    owner_host: str = ""
+
+    @property
+    def paths(self) -> List[str]:
+        return [e.path for e in self.edits]
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PatchSet":
+        edits = [FileEdit(**e) for e in data.get("edits", [])]
+        return cls(
+            set_id=data["set_id"],
+            edits=edits,
+            state=data.get("state", STATE_PREPARED),
+            created_at=float(data.get("created_at", 0.0)),
+            label=data.get("label", ""),
+            owner_pid=data.get("owner_pid"),
+            owner_host=data.get("owner_host", ""),
+        )
+
+    def owner_alive(self) -> bool:
+        """Владелец набора ещё работает. Журналы без владельца (старый формат) — считаются брошенными."""
+        if self.owner_pid is None:
+            return False
+        if self.owner_host and self.owner_host != socket.gethostname():
+            return True  # процесс другой машины (общий каталог) проверить нельзя — не трогаем
+        return _pid_alive(int(self.owner_pid))
+
+
+class PatchJournal:
+    """
+    Журнал наборов патчей (write-ahead).
+
+    Порядок применения:
+      1) старые и новые версии всех файлов кладутся в BackupStore;
+      2) журнал <set_id>.json пишется и fsync'ится (state=prepared);
+      3) новые версии пишутся во временные файлы рядом с целями, затем один проход fsync;
+      4) state=applying, os.replace() для всех файлов, fsync каталогов (группой);
+      5) state=committed.
+    Незавершённые наборы (prepared/applying) при следующем старте откатываются по журналу —
+    только если процесс-владелец набора мёртв.
+
+    Каталог журнала общий для процессов (GUI и CLI): применение, откат и восстановление
+    выполняются под эксклюзивной блокировкой файла <journal_dir>/.lock (flock; без fcntl —
+    только блокировка внутри процесса).
+    """
+
+    def __init__(self, journal_dir: os.PathLike | str, store: BackupStore):
+        self.dir = Path(journal_dir).expanduser().resolve()
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.store = store
+        self._lock = threading.RLock()
+        self._depth = 0  # вложенность _exclusive() в потоке, держащем _lock
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """_lock внутри процесса + flock между процессами (flock берётся один раз на внешнем уровне)."""
+        with self._lock:
+            if self._depth or fcntl is None:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            fd = os.open(str(self.dir / LOCK_FILENAME), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+
+    # ---------- журнал ----------
+
+    def _journal_path(self, set_id: str) -> Path:
+        return self.dir / f"{set_id}.json"
+
+    def _write_journal(self, ps: PatchSet) -> None:
+        path = self._journal_path(ps.set_id)
+        fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=str(self.dir))
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(ps.to_dict(), f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _fsync_dir(self.dir)
+
+    def load(self, set_id: str) -> PatchSet:
+        path = self._journal_path(set_id)
+        if not path.exists():
+            raise PatchSetError(f"unknown patch set: {set_id}")
+        with open(path, "r", encoding="utf-8") as f:
+            return PatchSet.from_dict(json.load(f))
+
+    def list_sets(self, state: Optional[str] = None) -> List[PatchSet]:
+        out: List[PatchSet] = []
+        for p in sorted(self.dir.glob("*.json")):
+            try:
+                with open(p, "r", encoding="utf-8") as f:
+                    ps = PatchSet.from_dict(json.load(f))
+            except Exception as e:
+                log_warning(f"[PatchJournal] битый журнал {p.name}: {e}")
+                continue
+            if state is None or ps.state == state:
+                out.append(ps)
+        out.sort(key=lambda s: s.created_at)
+        return out
+
+    # ---------- применение ----------
+
+    def apply(self, edits: Iterable[Tuple[str, Optional[str], str]], *, label: str = "") -> PatchSet:
+        """
+        edits: (path, old_code | None, new_code). old_code=None — не проверять текущее содержимое.
+        Если файл на диске не совпадает с old_code — PatchSetError до любой записи.
+        """
+        staged: List[Tuple[Path, bytes, Optional[bytes]]] = []
+        with self._exclusive():
+            for path, old_code, new_code in edits:
+                p = Path(path).expanduser().resolve()
+                current = p.read_bytes() if p.exists() else None
+                if old_code is not None and current is not None and current != old_code.encode("utf-8"):
+                    raise PatchSetError(f"file changed on disk since old_code was read: {p}")
+                new_bytes = new_code.encode("utf-8")
+                staged.append((p, new_bytes, current))
+
+            if not staged:
+                raise PatchSetError("empty patch set")
+
+            # обе версии каждого файла — в хранилище и закреплены за набором (gc их не тронет)
+            set_id = self._new_id()
+            file_edits: List[FileEdit] = []
+            for p, new_bytes, current in staged:
+                old_hash = None
+                if current is not None:
+                    self.store.put(p, current, label=f"patch_set:{set_id}")
+                    old_hash = self.store.put_blob(current, pin=set_id)
+                new_hash = self.store.put_blob(new_bytes, pin=set_id)
+                file_edits.append(FileEdit(str(p), old_hash, new_hash, len(new_bytes)))
+
+            ps = PatchSet(
+                set_id=set_id, edits=file_edits, label=label,
+                owner_pid=os.getpid(), owner_host=socket.gethostname(),
+            )
+            self._write_journal(ps)
+
+            tmp_files: List[Tuple[str, Path]] = []
+            try:
+                # временные файлы + групповой fsync
+                for p, data, _ in staged:
+                    p.parent.mkdir(parents=True, exist_ok=True)
+                    fd, tmp = tempfile.mkstemp(prefix=".aideon_tmp_", dir=str(p.parent))
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(data)
+                    tmp_files.append((tmp, p))
+                for tmp, _ in tmp_files:
+                    fd = os.open(tmp, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+
+                ps.state = STATE_APPLYING
+                self._write_journal(ps)
+                for tmp, p in tmp_files:
+                    os.replace(tmp, p)
+                for d in {p.parent for _, p in tmp_files}:
+                    _fsync_dir(d)
+            except Exception as e:
+                log_error(f"[PatchJournal] ❌ apply {ps.set_id} failed: {e} — откатываю набор")
+                for tmp, _ in tmp_files:
+                    try:
+                        os.remove(tmp)
+                    except OSError:
+                        pass
+                self._revert(ps, force=True)
+                raise
+
+            ps.state = STATE_COMMITTED
+            self._write_journal(ps)
+        log_info(f"[PatchJournal] ✅ набор {ps.set_id} применён ({len(ps.edits)} файлов)")
+        return ps
+
+    # ---------- откат ----------
+
+    def rollback(self, set_id: str, *, force: bool = False) -> PatchSet:
+        """
+        Откатывает весь набор. Без force — отказ, если какой-то файл менялся после набора.
+        """
+        with self._exclusive():
+            ps = self.load(set_id)
+            if ps.state == STATE_ROLLED_BACK:
+                return ps
+            self._revert(ps, force=force)
+        log_info(f"[PatchJournal] ↩️ набор {set_id} откатан ({len(ps.edits)} файлов)")
+        return ps
+
+    def _revert(self, ps: PatchSet, *, force: bool) -> None:
+        if not force:
+            conflicts = []
+            for e in ps.edits:
+                p = Path(e.path)
+                cur = _sha256(p.read_bytes()) if p.exists() else None
+                if cur not in (e.new_hash, e.old_hash):
+                    conflicts.append(e.path)
+            if conflicts:
+                raise PatchSetError(f"files changed after patch set {ps.set_id}: {', '.join(conflicts)}")
+
+        for e in ps.edits:
+            p = Path(e.path)
+            if e.old_hash is None:
+                # файла не было — удаляем, только если там наша версия
+                if p.exists() and (force or _sha256(p.read_bytes()) == e.new_hash):
+                    p.unlink()
+                continue
+            if p.exists() and _sha256(p.read_bytes()) == e.old_hash:
+                continue
+            data = self.store.read(e.old_hash)
+            p.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=".aideon_tmp_", dir=str(p.parent))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, p)
+        for d in {Path(e.path).parent for e in ps.edits}:
+            _fsync_dir(d)
+        ps.state = STATE_ROLLED_BACK
+        self._write_journal(ps)
+
+    # ---------- восстановление ----------
+
+    def recover(self) -> List[str]:
+        """
+        Откатывает наборы, прерванные посреди применения (владелец мёртв). Возвращает их set_id.
+        Набор живого процесса не трогаем: он может ещё дописывать файлы.
+        """
+        recovered: List[str] = []
+        with self._exclusive():
+            for ps in self.list_sets():
+                if ps.state not in _PENDING:
+                    continue
+                if ps.owner_alive():
+                    log_info(f"[PatchJournal] набор {ps.set_id} ({ps.state}) принадлежит живому процессу "
+                             f"{ps.owner_pid} — пропуск")
+                    continue
+                state = ps.state
+                try:
+                    self._revert(ps, force=True)
+                    recovered.append(ps.set_id)
+                    log_warning(f"[PatchJournal] ♻️ прерванный набор {ps.set_id} ({state}) откатан")
+                except Exception as e:
+                    log_error(f"[PatchJournal] не удалось восстановить {ps.set_id}: {e}")
+        return recovered
+
+    def prune(self, keep: int = 100) -> int:
+        """Удаляет журналы завершённых наборов сверх keep последних и снимает их закрепления в хранилище."""
+        removed = 0
+        with self._exclusive():
+            done = [ps for ps in self.list_sets() if ps.state not in _PENDING]
+            for ps in done[: max(0, len(done) - max(0, int(keep)))]:
+                try:
+                    self._journal_path(ps.set_id).unlink()
+                    self.store.unpin(ps.set_id)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    @staticmethod
+    def _new_id() -> str:
+        return time.strftime("%Y%m%d_%H%M%S") + "_" + uuid.uuid4().hex[:8]
+
+
+_RECOVERED: set = set()
+_RECOVERED_LOCK = threading.Lock()
+
+
+def recover_once(journal: PatchJournal) -> List[str]:
+    """recover() + prune() один раз на каталог журнала за процесс (первый CodePatcher при старте)."""
+    key = str(journal.dir)
+    with _RECOVERED_LOCK:
+        if key in _RECOVERED:
+            return []
+        _RECOVERED.add(key)
+    recovered = journal.recover()
+    journal.prune()
+    return recovered
+
+
+__all__ = [
+    "STATE_PREPARED", "STATE_APPLYING", "STATE_COMMITTED", "STATE_ROLLED_BACK",
+    "PatchSetError", "FileEdit", "PatchSet", "PatchJournal", "recover_once",
+]
@@ -0,0 +1,422 @@
+# app/modules/improver/patch_validator.py
+from __future__ import annotations
+
+import ast
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.logger import log_info, log_warning
+
+CHECK_PARSE = "parse"
+CHECK_COMPILE = "compile"
+CHECK_IMPORTS = "imports"
+CHECK_SYMBOLS = "symbols"
+CHECK_SMOKE = "smoke_import"
+
+# Исполняется в отдельном интерпретаторе: код модуля приходит через stdin
+_SMOKE_SCRIPT = r"""
+import sys, types
+name, path = sys.argv[1], sys.argv[2]
+src = sys.stdin.read()
+mod = types.ModuleType(name)
+mod.__file__ = path
+mod.__package__ = name.rpartition(".")[0]
+sys.modules[name] = mod
+exec(compile(src, path, "exec"), mod.__dict__)
+"""
+
+
+@dataclass
+class CheckResult:
+    name: str
+    ok: bool
+    ms: float
+    detail: str = ""
+
+
+@dataclass
+class ValidationReport:
+    """
+    Итог валидации кандидата-патча: общий флаг + результаты и тайминги по каждой проверке.
+    """
+    file_path: str
+    ok: bool = True
+    checks: List[CheckResult] = field(default_factory=list)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(c.ms for c in self.checks)
+
+    def errors(self) -> List[str]:
+        return [f"{c.name}: {c.detail}" for c in self.checks if not c.ok]
+
+    def summary(self) -> str:
+        parts = [f"{c.name} {'✓' if c.ok else '✗'} {c.ms:.1f}ms" for c in self.checks]
+        return " | ".join(parts) + f" | total {self.total_ms:.1f}ms"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "file": self.file_path,
+            "ok": self.ok,
+            "total_ms": round(self.total_ms, 2),
+            "checks": [c.__dict__ for c in self.checks],
+        }
+
+
+class PatchValidationError(ValueError):
+    """Патч не прошёл валидацию — запись на диск отменена."""
+
+    def __init__(self, report: ValidationReport):
+        self.report = report
+        super().__init__(f"Патч для {report.file_path} не прошёл валидацию: " + "; ".join(report.errors()))
+
+
+# -------------------- проверки (исполняются в воркере) --------------------
+
+def _guarded_import_nodes(tree: ast.AST) -> Set[int]:
+    """id() импортов внутри try с перехватом ImportError/Exception — это опциональные зависимости."""
+    guarded: Set[int] = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Try):
+            continue
+        catches = False
+        for h in node.handlers:
+            if h.type is None:
+                catches = True
+            else:
+                names = [h.type] if not isinstance(h.type, ast.Tuple) else list(h.type.elts)
+                if any(isinstance(n, ast.Name) and n.id in ("ImportError", "ModuleNotFoundError", "Exception")
+                       for n in names):
+                    catches = True
+        if catches:
+            for stmt in node.body:
+                for sub in ast.walk(stmt):
+                    if isinstance(sub, (ast.Import, ast.ImportFrom)):
+                        guarded.add(id(sub))
+    return guarded
+
+
+def _import_keys(tree: ast.AST) -> Dict[Tuple[int, str, str], int]:
+    """
+    Множество импортов модуля: (level, module, name) → lineno.
+    Для `import a.b` name == "", для `from a import b` name == "b".
+    """
+    guarded = _guarded_import_nodes(tree)
+    keys: Dict[Tuple[int, str, str], int] = {}
+    for node in ast.walk(tree):
+        if id(node) in guarded:
+            continue
+        if isinstance(node, ast.Import):
+            for a in node.names:
+                keys.setdefault((0, a.name, ""), node.lineno)
+        elif isinstance(node, ast.ImportFrom):
+            if node.module == "__future__":
+                continue
+            for a in node.names:
+                keys.setdefault((node.level, node.module or "", a.name), node.lineno)
+    return keys
+
+
+def _module_top_names(path: str) -> Optional[Set[str]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+    except Exception:
+        return None
+    names: Set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            names.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for a in node.names:
+                names.add(a.asname or a.name.split(".")[0])
+    return names
+
+
+def _project_module_path(base_dir: str, dotted: str) -> Optional[str]:
+    """Файл/пакет модуля внутри проекта или None."""
+    parts = [p for p in dotted.split(".") if p]
+    cand = os.path.join(base_dir, *parts) if parts else base_dir
+    if os.path.isfile(cand + ".py"):
+        return cand + ".py"
+    if os.path.isdir(cand):
+        init = os.path.join(cand, "__init__.py")
+        return init if os.path.isfile(init) else cand
+    return None
+
+
+def _resolve_import(
+    level: int, module: str, name: str, file_path: str, project_root: str
+) -> Optional[str]:
+    """None — импорт разрешим; иначе текст ошибки."""
+    if level > 0:
+        base = os.path.dirname(os.path.abspath(file_path))
+        for _ in range(level - 1):
+            base = os.path.dirname(base)
+        target = _project_module_path(base, module)
+        label = "." * level + module
+    else:
+        top = module.split(".")[0]
+        if _project_module_path(project_root, top) is None:
+            # не проектный модуль: stdlib / установленная зависимость
+            try:
+                if top in sys.builtin_module_names or importlib.util.find_spec(top) is not None:
+                    return None
+            except Exception:
+                pass
+            return f"модуль '{top}' не найден"
+        target = _project_module_path(project_root, module)
+        label = module
+
+    if target is None:
+        return f"модуль '{label}' не найден в проекте"
+    if not name or name == "*":
+        return None
+    # from pkg import sub — подмодуль или атрибут
+    if os.path.isdir(target) or target.endswith("__init__.py"):
+        pkg_dir = target if os.path.isdir(target) else os.path.dirname(target)
+        if _project_module_path(pkg_dir, name) is not None:
+            return None
+    if target.endswith(".py"):
+        names = _module_top_names(target)
+        if names is not None and name not in names:
+            return f"'{name}' не определён в '{label}'"
+    return None
+
+
+def _public_symbols(tree: ast.Module) -> Set[str]:
+    out: Set[str] = set()
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and not node.name.startswith("_"):
+            out.add(node.name)
+        elif isinstance(node, ast.ClassDef) and not node.name.startswith("_"):
+            out.add(node.name)
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and not item.name.startswith("_"):
+                    out.add(f"{node.name}.{item.name}")
+    return out
+
+
+def _run_static_checks(
+    file_path: str,
+    old_code: str,
+    new_code: str,
+    project_root: str,
+    check_imports: bool,
+    check_symbols: bool,
+    allow_removed: Tuple[str, ...],
+) -> List[Dict[str, Any]]:
+    """
+    parse → compile → imports → symbols. Выполняется в воркер-процессе (или локально при фолбэке).
+    После провала parse остальные проверки не имеют смысла.
+    """
+    out: List[Dict[str, Any]] = []
+
+    t0 = time.perf_counter()
+    try:
+        new_tree = ast.parse(new_code, filename=file_path)
+        out.append({"name": CHECK_PARSE, "ok": True, "ms": (time.perf_counter() - t0) * 1000})
+    except SyntaxError as e:
+        out.append({"name": CHECK_PARSE, "ok": False, "ms": (time.perf_counter() - t0) * 1000,
+                    "detail": f"L{e.lineno}: {e.msg}"})
+        return out
+
+    t0 = time.perf_counter()
+    try:
+        compile(new_tree, file_path, "exec")
+        out.append({"name": CHECK_COMPILE, "ok": True, "ms": (time.perf_counter() - t0) * 1000})
+    except (SyntaxError, ValueError) as e:
+        out.append({"name": CHECK_COMPILE, "ok": False, "ms": (time.perf_counter() - t0) * 1000,
+                    "detail": str(e)})
+        return out
+
+    try:
+        old_tree: Optional[ast.Module] = ast.parse(old_code or "")
+    except SyntaxError:
+        old_tree = None
+
+    if check_imports:
+        t0 = time.perf_counter()
+        old_keys = set(_import_keys(old_tree)) if old_tree is not None else set()
+        problems: List[str] = []
+        # проверяем только импорты, добавленные патчем: старые уже «живут» в проекте
+        for (level, module, name), lineno in _import_keys(new_tree).items():
+            if (level, module, name) in old_keys:
+                continue
+            err = _resolve_import(level, module, name, file_path, project_root)
+            if err:
+                problems.append(f"L{lineno}: {err}")
+        out.append({"name": CHECK_IMPORTS, "ok": not problems, "ms": (time.perf_counter() - t0) * 1000,
+                    "detail": "; ".join(problems)})
+
+    if check_symbols and old_tree is not None:
+        t0 = time.perf_counter()
+        removed = sorted(_public_symbols(old_tree) - _public_symbols(new_tree) - set(allow_removed))
+        out.append({"name": CHECK_SYMBOLS, "ok": not removed, "ms": (time.perf_counter() - t0) * 1000,
+                    "detail": ("удалены публичные символы: " + ", ".join(removed)) if removed else ""})
+    return out
+
+
+# -------------------- валидатор --------------------
+
+class PatchValidator:
+    """
+    Быстрый гейт перед любой записью патча на диск.
+
+    Проверки (для .py):
+      - parse: ast.parse
+      - compile: compile() AST в байткод
+      - imports: новые импорты разрешимы (проектные модули/имена, stdlib, установленные пакеты)
+      - symbols: публичные классы/функции/методы не исчезли
+      - smoke_import (опционально): импорт нового модуля в отдельном интерпретаторе
+
+    Статические проверки выполняются в пуле процессов (ProcessPoolExecutor),
+    smoke-импорт — в subprocess. Каждая проверка возвращает тайминг (мс).
+    """
+
+    def __init__(
+        self,
+        project_root: Optional[str] = None,
+        *,
+        max_workers: int = 2,
+        use_processes: bool = True,
+        check_imports: bool = True,
+        check_symbols: bool = True,
+        smoke_import: bool = False,
+        smoke_timeout: float = 15.0,
+        timeout: float = 30.0,
+    ):
+        self.project_root = os.path.abspath(project_root or os.getcwd())
+        self.max_workers = max(1, int(max_workers))
+        self.use_processes = bool(use_processes)
+        self.check_imports = bool(check_imports)
+        self.check_symbols = bool(check_symbols)
+        self.smoke_import = bool(smoke_import)
+        self.smoke_timeout = float(smoke_timeout)
+        self.timeout = float(timeout)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], project_root: Optional[str] = None) -> "PatchValidator":
+        cfg = config or {}
+        return cls(
+            project_root=project_root or cfg.get("project_root"),
+            max_workers=int(cfg.get("validate_workers", 2)),
+            use_processes=bool(cfg.get("validate_in_processes", True)),
+            check_imports=bool(cfg.get("validate_imports", True)),
+            check_symbols=bool(cfg.get("validate_symbols", True)),
+            smoke_import=bool(cfg.get("validate_smoke_import", False)),
+            smoke_timeout=float(cfg.get("validate_smoke_timeout", 15.0)),
+        )
+
+    # ---------- публичные методы ----------
+
+    def validate(
+        self,
+        file_path: str,
+        old_code: str,
+        new_code: str,
+        *,
+        allow_removed: Iterable[str] = (),
+    ) -> ValidationReport:
+        return self.validate_many([(file_path, old_code, new_code)], allow_removed=allow_removed)[0]
+
+    def validate_many(
+        self,
+        items: List[Tuple[str, str, str]],
+        *,
+        allow_removed: Iterable[str] = (),
+    ) -> List[ValidationReport]:
+        """
+        Валидирует несколько кандидатов параллельно. items: [(file_path, old_code, new_code), ...]
+        """
+        allow = tuple(allow_removed)
+        reports = [ValidationReport(file_path=str(fp)) for fp, _, _ in items]
+        py_idx = [i for i, (fp, _, _) in enumerate(items) if str(fp).endswith(".py")]
+        if not py_idx:
+            return reports
+
+        args = [
+            (str(items[i][0]), items[i][1] or "", items[i][2] or "", self.project_root,
+             self.check_imports, self.check_symbols, allow)
+            for i in py_idx
+        ]
+        raw = self._run_in_pool(args)
+
+        for i, checks in zip(py_idx, raw):
+            rep = reports[i]
+            rep.checks = [CheckResult(**c) for c in checks]
+            if self.smoke_import and all(c.ok for c in rep.checks):
+                rep.checks.append(self._smoke(items[i][0], items[i][2]))
+            rep.ok = all(c.ok for c in rep.checks)
+            log_info(f"[PatchValidator] {'✅' if rep.ok else '❌'} {rep.file_path}: {rep.summary()}")
+        return reports
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # ---------- внутреннее ----------
+
+    def _run_in_pool(self, args: List[Tuple[Any, ...]]) -> List[List[Dict[str, Any]]]:
+        if self.use_processes:
+            try:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                futures = [self._pool.submit(_run_static_checks, *a) for a in args]
+                return [f.result(timeout=self.timeout) for f in futures]
+            except Exception as e:
+                log_warning(f"[PatchValidator] Пул процессов недоступен ({e}), проверяю в текущем процессе")
+                self.close()
+                self.use_processes = False
+        return [_run_static_checks(*a) for a in args]
+
+    def _module_name(self, file_path: str) -> str:
+        try:
+            rel = os.path.relpath(os.path.abspath(file_path), self.project_root)
+        except ValueError:
+            rel = os.path.basename(file_path)
+        if rel.startswith(".."):
+            rel = os.path.basename(file_path)
+        mod = rel[:-3] if rel.endswith(".py") else rel
+        parts = [p for p in mod.replace("\\", "/").split("/") if p]
+        if parts and parts[-1] == "__init__":
+            parts = parts[:-1]
+        return ".".join(parts) or "_aideon_smoke"
+
+    def _smoke(self, file_path: str, new_code: str) -> CheckResult:
+        t0 = time.perf_counter()
+        try:
+            proc = subprocess.run(
+                [sys.executable, "-c", _SMOKE_SCRIPT, self._module_name(file_path), os.path.abspath(file_path)],
+                input=new_code,
+                capture_output=True,
+                text=True,
+                cwd=self.project_root,
+                timeout=self.smoke_timeout,
+                env={**os.environ, "PYTHONPATH": self.project_root, "PYTHONDONTWRITEBYTECODE": "1"},
+            )
+            ok = proc.returncode == 0
+            detail = "" if ok else (proc.stderr.strip().splitlines() or [f"returncode={proc.returncode}"])[-1]
+        except subprocess.TimeoutExpired:
+            ok, detail = False, f"таймаут {self.smoke_timeout:.0f}с"
+        except Exception as e:
+            ok, detail = False, str(e)
+        return CheckResult(CHECK_SMOKE, ok, (time.perf_counter() - t0) * 1000, detail)
+
+
+__all__ = [
+    "CheckResult",
+    "ValidationReport",
+    "PatchValidationError",
+    "PatchValidator",
+]
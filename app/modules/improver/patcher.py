@@ -2,15 +2,26 @@
 from __future__ import annotations
 
 import os
-import shutil
-import difflib
+import hashlib
 import json
-import time
+import threading
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Tuple, Any, Dict
+from typing import Optional, Tuple, Any, Dict, Iterable, List
 
+from app.core.backup_store import BackupStore, get_backup_store
 from app.logger import log_info, log_error, log_warning
+from app.modules.improver.patch_validator import PatchValidator, PatchValidationError, ValidationReport
+from app.modules.improver.diff_engine import ALGORITHMS, unified_diff
+from app.modules.improver.approval_queue import (
+    STATUS_APPROVED, STATUS_PENDING, ApprovalItem, ApprovalPolicy, ApprovalQueue, ApprovalWorker, get_approval_queue,
+)
+from app.modules.improver.merge3 import MergeResult, merge3_text
+from app.modules.improver.patch_archive import PatchArchive, get_patch_archive, new_change_id, split_ref
+from app.modules.improver.patch_index import PatchIndex, get_patch_index
+from app.modules.improver.patch_set import PatchJournal, PatchSet, recover_once
+from app.modules.improver.patch_classifier import PATCH_COSMETIC, PATCH_SEMANTIC, classify_patch
 
 try:
     # Опциональная интеграция с централизованным менеджером файлов (если есть)
@@ -19,19 +30,53 @@ except Exception:
     CoreFileManager = None  # не требуем наличия
 
 
+# результат apply_saved_diff
+SAVED_APPLIED = "applied"                  # применён (напрямую или после чистого merge)
+SAVED_ALREADY_APPLIED = "already_applied"  # файл уже содержит код патча
+SAVED_CONFLICT = "conflict"                # merge с конфликтами — файл не тронут
+SAVED_NO_BASE = "no_base"                  # у диффа нет сохранённой базы (старый формат)
+
+
+@dataclass
+class SavedDiffResult:
+    change_id: str
+    file: str
+    status: str
+    merge: Optional[MergeResult] = None
+    set_id: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status in (SAVED_APPLIED, SAVED_ALREADY_APPLIED)
+
+
 class CodePatcher:
     """
     Применяет патчи к файлам:
-    - делает резервную копию,
+    - делает резервную копию (общий BackupStore),
     - показывает/сохраняет diff,
     - записывает новый код,
     - сохраняет .diff отдельно,
-    - сохраняет metadata о применённом патче (JSON).
+    - сохраняет metadata о применённом патче (JSON),
+    - (опционально) прогоняет PatchValidator до ЛЮБОЙ записи на диск,
+    - пропускает «пустые» патчи (identical; по флагу и cosmetic) без бэкапа, diff и метаданных.
+
+    Подтверждение:
+      - confirm_and_apply_patch(...) не блокирует: патч уходит в ApprovalQueue, решение —
+        ревьюер (CLI/UI) или ApprovalPolicy; одобренное применяет фоновый ApprovalWorker.
 
     Обратная совместимость:
-      - confirm_and_apply_patch(file_path, old_code, new_code) -> (backup_path, diff_path)
+      - confirm_and_apply_patch(file_path, old_code, new_code) -> (None, diff_path)
       - apply_patch_no_prompt(file_path, old_code, new_code, *, save_backup, save_diff, save_only, interactive_confirm)
       - _save_diff(file_path, diff_text) И _save_diff(file_path, old_code, new_code) — оба варианта поддержаны
+
+    Наборы патчей (несколько файлов атомарно):
+      - apply_patch_set([(file_path, old_code, new_code), ...]) -> PatchSet | None
+      - rollback_patch_set(set_id)
+
+    Сохранённые диффы (режим «только diff»):
+      - _save_diff(file_path, old_code, new_code) кладёт базу и результат в BackupStore (old_hash/new_hash);
+      - apply_saved_diff(ref) применяет позже трёхсторонним merge против базы, без запроса к модели.
     """
 
     def __init__(
@@ -41,44 +86,181 @@ class CodePatcher:
         *,
         file_manager: Optional["CoreFileManager"] = None,  # опционально
         diffs_dirname_nested: bool = True,                 # складывать дифы по относительным подпапкам
-        context_lines: int = 3
+        context_lines: int = 3,
+        validator: Optional[PatchValidator] = None,        # гейт перед записью патча/диффа
+        skip_noop: bool = True,                            # не применять identical-патчи
+        skip_cosmetic: bool = False,                       # ...и cosmetic (форматирование/комментарии/докстринги)
+        normalize_format: bool = False,                    # нормализовать форматирование (black) при сравнении
+        backup_store: Optional[BackupStore] = None,        # по умолчанию — общий (у FileManager или глобальный)
+        diff_algorithm: str = "myers",                     # myers | patience | histogram (diff_engine)
+        use_archive: bool = True,                          # диффы/метаданные — в diff_dir/archive.sqlite
+        approval_queue: Optional[ApprovalQueue] = None,    # по умолчанию — diff_dir/approvals.sqlite
+        approval_policy: Optional[ApprovalPolicy] = None,  # правила авто-одобрения/отклонения
+        approval_poll_interval: float = 2.0,               # опрос решений из других процессов (CLI)
     ):
-        self.backup_dir = Path(backup_dir)
+        self.backup_dir = Path(backup_dir)  # legacy: .bak-копии больше не пишутся, бэкапы — в BackupStore
         self.diff_dir = Path(diff_dir)
         self.fm = file_manager if CoreFileManager and isinstance(file_manager, CoreFileManager) else None
         self.diffs_dirname_nested = diffs_dirname_nested
+        if backup_store is not None:
+            self.backup_store = backup_store
+        elif self.fm is not None:
+            self.backup_store = self.fm.backup_store  # type: ignore[attr-defined]
+        else:
+            self.backup_store = get_backup_store()
         self.context_lines = int(context_lines)
+        self.diff_algorithm = diff_algorithm if diff_algorithm in ALGORITHMS else "myers"
+        self.validator = validator
+        self._validated: Dict[str, ValidationReport] = {}  # memo: один кандидат не валидируем дважды
+        self._validated_lock = threading.Lock()
+        # last_validation / last_change_ids / last_patch_set — свои у каждого потока:
+        # ApprovalWorker применяет патчи параллельно с вызывающим кодом
+        self._tls = threading.local()
+        self.skip_noop = bool(skip_noop)
+        self.skip_cosmetic = bool(skip_cosmetic)
+        self.normalize_format = bool(normalize_format)
+        self.last_patch_kind: Optional[str] = None
+        self.skipped: Dict[str, int] = {"identical": 0, "cosmetic": 0}
+
+        # журнал наборов патчей (рядом с блобами, на которые он ссылается);
+        # прерванные наборы упавших процессов откатываются здесь (под блокировкой журнала;
+        # наборы живых процессов — например, параллельного GUI — не трогаются)
+        self.journal = PatchJournal(self.backup_store.root / "journal", self.backup_store)
+        try:
+            recovered = recover_once(self.journal)
+            if recovered:
+                log_warning(f"[CodePatcher] ♻️ Восстановлено из журнала (откат прерванных наборов): {recovered}")
+        except Exception as e:
+            log_error(f"[CodePatcher] Восстановление по журналу не удалось: {e}")
 
         # гарантируем каталоги
-        self.backup_dir.mkdir(parents=True, exist_ok=True)
         self.diff_dir.mkdir(parents=True, exist_ok=True)
 
+        # архив диффов/метаданных текущего запуска (вместо отдельных файлов)
+        self.archive: Optional[PatchArchive] = get_patch_archive(self.diff_dir) if use_archive else None
+        self.run_id: Optional[str] = None
+
+        # индекс метаданных патчей (история/откаты/результаты тестов)
+        self.index: PatchIndex = get_patch_index(self.diff_dir)
+        self.patch_context: Dict[str, Any] = {}   # model, latency_ms — задаёт вызывающий (SelfImprover)
+
+        # очередь подтверждения патчей (вместо input()) и фоновое применение одобренных
+        self.approvals: ApprovalQueue = approval_queue or get_approval_queue(self.diff_dir, self.backup_store)
+        self.approval_policy: ApprovalPolicy = approval_policy or ApprovalPolicy()
+        self.approval_poll_interval = float(approval_poll_interval)
+        self.approval_worker: Optional[ApprovalWorker] = None
+        self.last_approval: Optional[ApprovalItem] = None
+
         log_info(
-            f"[CodePatcher] init backup_dir={self.backup_dir} diff_dir={self.diff_dir} "
+            f"[CodePatcher] init backups={self.backup_store.root} diff_dir={self.diff_dir} "
             f"core_fm={'on' if self.fm else 'off'}"
         )
 
+    # ---------- Состояние последнего вызова (на поток) ----------
+
+    @property
+    def last_change_ids(self) -> List[str]:
+        ids = getattr(self._tls, "change_ids", None)
+        if ids is None:
+            ids = self._tls.change_ids = []
+        return ids
+
+    @last_change_ids.setter
+    def last_change_ids(self, value: List[str]) -> None:
+        self._tls.change_ids = value
+
+    @property
+    def last_validation(self) -> Optional[ValidationReport]:
+        return getattr(self._tls, "validation", None)
+
+    @last_validation.setter
+    def last_validation(self, value: Optional[ValidationReport]) -> None:
+        self._tls.validation = value
+
+    @property
+    def last_patch_set(self) -> Optional[PatchSet]:
+        return getattr(self._tls, "patch_set", None)
+
+    @last_patch_set.setter
+    def last_patch_set(self, value: Optional[PatchSet]) -> None:
+        self._tls.patch_set = value
+
     # ---------- Публичные методы ----------
 
-    def confirm_and_apply_patch(self, file_path: str, old_code: str, new_code: str) -> Tuple[Optional[str], Optional[str]]:
+    def confirm_and_apply_patch(
+        self, file_path: str, old_code: str, new_code: str, *, after: Optional[str] = None,
+    ) -> Tuple[Optional[str], Optional[str]]:
         """
-        Интерактивное применение патча с вопросом в консоли.
-        Возвращает (backup_path, diff_path).
+        Применение патча с подтверждением — без блокировки конвейера.
+        Патч (с diff) ставится в ApprovalQueue; политика может сразу одобрить/отклонить,
+        иначе решение принимает ревьюер (CLI/UI). Одобренный патч применяет фоновый воркер
+        транзакционным набором. Заявка — в self.last_approval.
+        after — id заявки, поверх результата которой сделан патч (old_code): воркер применит
+        эту заявку только после неё, а отказ по базовой делает её устаревшей.
+        Возвращает (None, diff_path): бэкап делается в момент применения.
         """
         file_path = str(self._norm(file_path))
+        self.last_change_ids = []
+        self.last_approval = None
+        skip, kind = self._skip_if_noop(file_path, old_code, new_code)
+        if skip:
+            return None, None
+        self._check_patch(file_path, old_code, new_code)
         diff_text = self._generate_diff(file_path, old_code, new_code)
         diff_path = self._save_diff(file_path, diff_text)  # совместимо с новой сигнатурой
-        print(diff_text)
-
-        choice = input("[CodePatcher] Применить патч? (y/n): ").strip().lower()
-        if choice != "y":
-            log_info(f"[CodePatcher] ❌ Патч для {file_path} отменён.")
-            return None, diff_path
 
-        backup_path = self._backup(file_path)
-        self._write_code(file_path, new_code)
-        self._save_metadata(file_path, old_code, new_code, diff_path, interactive=True)
-        return backup_path, diff_path
+        context = dict(self.patch_context)
+        if after:
+            context["after"] = after
+        item = self.approvals.enqueue(
+            file_path, old_code, new_code, diff_text, diff_ref=diff_path, context=context,
+        )
+        if kind is None and self.approval_policy.rules:
+            kind = self._classify(file_path, old_code, new_code)
+        decision = self.approval_policy.decide(item, kind)
+        if decision == "approve":
+            self.approvals.approve(item.id, reviewer="policy")
+        elif decision == "reject":
+            self.approvals.reject(item.id, reviewer="policy")
+        self.last_approval = self.approvals.get(item.id) or item
+        if self.last_approval.status in (STATUS_PENDING, STATUS_APPROVED):
+            self.start_approval_worker()
+        return None, diff_path
+
+    def start_approval_worker(self) -> ApprovalWorker:
+        """
+        Запускает фоновое применение одобренных заявок — один воркер на очередь в процессе
+        (его переиспользуют все CodePatcher с этой очередью). Вызывается и при постановке
+        в очередь, и из UI (PanelApprovals), чтобы одобрения из CLI применялись в новой сессии.
+        """
+        with self.approvals._lock:
+            worker = self.approvals.worker
+            if worker is None or not worker.running:
+                worker = ApprovalWorker(self.approvals, self._apply_approved, poll_interval=self.approval_poll_interval)
+                self.approvals.worker = worker.start()
+        self.approval_worker = worker
+        return worker
+
+    def drain_approvals(self) -> int:
+        """Применяет одобренные заявки сейчас, в текущем потоке (CLI drain). Возвращает число применённых."""
+        worker = self.approval_worker or ApprovalWorker(self.approvals, self._apply_approved)
+        return worker.drain()
+
+    def stop_approval_worker(self) -> None:
+        if self.approval_worker is not None:
+            self.approval_worker.stop()
+
+    def _apply_approved(self, item: ApprovalItem) -> Optional[str]:
+        """Применяет одобренную заявку набором патчей; PatchSetError — файл изменился (заявка устарела)."""
+        old_code, new_code = self.approvals.code(item)
+        ps = self.apply_patch_set(
+            [(item.file, old_code, new_code)],
+            save_diff=False,
+            label=f"approval:{item.id}",
+            context=item.context,
+            diff_refs={item.file: item.diff_ref} if item.diff_ref else None,
+        )
+        return ps.set_id if ps is not None else None
 
     def apply_patch_no_prompt(
         self,
@@ -103,6 +285,10 @@ class CodePatcher:
           - interactive_confirm: игнорируется (неинтерактивный метод), оставлен для совместимости
         """
         file_path = str(self._norm(file_path))
+        self.last_change_ids = []
+        if self._skip_if_noop(file_path, old_code, new_code)[0]:
+            return None, None
+        self._check_patch(file_path, old_code, new_code)
 
         # save_only имеет приоритет
         if isinstance(save_only, bool):
@@ -133,25 +319,149 @@ class CodePatcher:
 
         return backup_path, diff_path
 
+    def apply_patch_set(
+        self,
+        edits: Iterable[Tuple[str, str, str]],
+        *,
+        save_diff: bool = True,
+        label: str = "",
+        context: Optional[Dict[str, Any]] = None,
+        diff_refs: Optional[Dict[str, str]] = None,
+    ) -> Optional[PatchSet]:
+        """
+        Транзакционно применяет набор правок [(file_path, old_code, new_code), ...]:
+        все файлы записываются или ни один (write-ahead журнал, групповой fsync).
+        Пустые патчи пропускаются, остальные валидируются ДО любой записи
+        (PatchValidationError). Возвращает PatchSet (set_id — для rollback_patch_set) или None.
+        context — model/latency_ms для индекса (вместо self.patch_context);
+        diff_refs — уже сохранённые диффы {file_path: ref} (например, из заявки на подтверждение).
+        """
+        self.last_change_ids = []
+        staged = []
+        for file_path, old_code, new_code in edits:
+            file_path = str(self._norm(file_path))
+            if self.fm is not None:
+                p = self.fm.resolve(file_path)  # type: ignore[attr-defined]
+                if self.fm._is_read_only(p):  # type: ignore[attr-defined]
+                    raise PermissionError(f"Path {p} is read-only")
+            if self._skip_if_noop(file_path, old_code, new_code)[0]:
+                continue
+            self._check_patch(file_path, old_code, new_code)
+            staged.append((file_path, old_code, new_code))
+        if not staged:
+            log_info("[CodePatcher] ♻️ Набор патчей пуст после фильтрации — нечего применять")
+            return None
+
+        ps = self.journal.apply(staged, label=label)
+        self.last_patch_set = ps
+        refs = {str(self._norm(k)): v for k, v in (diff_refs or {}).items()}
+        for file_path, old_code, new_code in staged:
+            diff_path = refs.get(file_path)
+            if diff_path is None and save_diff:
+                diff_path = self._save_diff(file_path, old_code, new_code)
+            self._save_metadata(
+                file_path, old_code, new_code, diff_path, interactive=False, set_id=ps.set_id, context=context,
+            )
+        log_info(f"[CodePatcher] ✅ Набор {ps.set_id} применён: {len(staged)} файл(ов)")
+        return ps
+
+    def rollback_patch_set(self, set_id: str, *, force: bool = False) -> PatchSet:
+        """
+        Откатывает весь набор одной операцией. Без force — PatchSetError,
+        если какой-то из файлов менялся после применения набора.
+        """
+        ps = self.journal.rollback(set_id, force=force)
+        self.index.mark_rolled_back(set_id=set_id)
+        return ps
+
+    def begin_run(self, label: str = "") -> Optional[str]:
+        """Начинает новый запуск в архиве: последующие диффы/метаданные группируются под этим run_id."""
+        if self.archive is None:
+            return None
+        self.run_id = self.archive.begin_run(label)
+        return self.run_id
+
+    def ensure_run(self) -> str:
+        if self.run_id is None:
+            self.begin_run()
+        return self.run_id or ""
+
+    def classify(self, file_path: str, old_code: str, new_code: str) -> str:
+        """identical | cosmetic | semantic (см. patch_classifier.classify_patch)."""
+        kind = self._classify(file_path, old_code, new_code)
+        self.last_patch_kind = kind
+        return kind
+
+    def _classify(self, file_path: str, old_code: str, new_code: str) -> str:
+        # без побочных эффектов: внутренние вызовы идут и из потока ApprovalWorker
+        return classify_patch(
+            old_code or "", new_code or "",
+            python=str(file_path).endswith(".py"),
+            format_code=self.normalize_format,
+        )
+
     # ---------- Внутренние утилиты ----------
 
+    def _skip_if_noop(self, file_path: str, old_code: str, new_code: str) -> Tuple[bool, Optional[str]]:
+        """
+        (skip, kind): skip=True — патч не меняет код по существу; ни бэкапа, ни diff,
+        ни метаданных не делаем. kind — результат классификации (None, если skip_noop выключен).
+        """
+        if not self.skip_noop:
+            return False, None
+        kind = self._classify(file_path, old_code, new_code)
+        if kind == PATCH_SEMANTIC or (kind == PATCH_COSMETIC and not self.skip_cosmetic):
+            return False, kind
+        self.skipped[kind] = self.skipped.get(kind, 0) + 1
+        log_info(f"[CodePatcher] ♻️ Патч без смысловых изменений ({kind}) — пропуск: {file_path}")
+        return True, kind
+
+    def validate_patch(self, file_path: str, old_code: str, new_code: str) -> Optional[ValidationReport]:
+        """
+        Прогоняет кандидата через PatchValidator (без записи и без исключения).
+        Результат кэшируется: последующая запись того же кандидата не валидирует повторно.
+        """
+        if self.validator is None:
+            return None
+        file_path = str(self._norm(file_path))
+        key = hashlib.sha1(f"{file_path}\0{old_code}\0{new_code}".encode("utf-8", "replace")).hexdigest()
+        with self._validated_lock:
+            report = self._validated.get(key)
+        if report is None:
+            report = self.validator.validate(file_path, old_code or "", new_code or "")
+            with self._validated_lock:
+                while len(self._validated) >= 64:
+                    self._validated.pop(next(iter(self._validated)))
+                self._validated[key] = report
+        self.last_validation = report
+        return report
+
+    def _check_patch(self, file_path: str, old_code: str, new_code: str) -> Optional[ValidationReport]:
+        """
+        Гейт валидации: бросает PatchValidationError, если кандидат не прошёл проверки.
+        """
+        report = self.validate_patch(file_path, old_code, new_code)
+        if report is not None and not report.ok:
+            log_warning(f"[CodePatcher] ⛔ Патч отклонён валидатором: {file_path}: {'; '.join(report.errors())}")
+            raise PatchValidationError(report)
+        return report
+
     def _backup(self, file_path: str) -> Optional[str]:
         """
-        Создаёт копию целевого файла в backup_dir. Если файла нет — просто логируем.
+        Кладёт текущую версию файла в BackupStore (сжатие + дедуп по содержимому).
+        Возвращает путь к объекту в хранилище. Если файла нет — просто логируем.
         """
         src = Path(file_path)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        dst = self.backup_dir / f"{src.name}.{ts}.bak"
-
         if not src.exists():
             log_warning(f"[CodePatcher] Бэкап пропущен: файл не найден для {src}")
             return None
 
         try:
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(str(src), str(dst))
-            log_info(f"[CodePatcher] 🧯 Бэкап создан: {dst}")
-            return str(dst)
+            rec = self.backup_store.put(src, label="patcher")
+            if rec is None:
+                return None
+            log_info(f"[CodePatcher] 🧯 Бэкап создан: {src.name} @ {rec.hash[:12]}")
+            return self.backup_store.object_path(rec)
         except Exception as e:
             log_error(f"[CodePatcher] ❌ Ошибка при создании бэкапа: {e}")
             return None
@@ -177,13 +487,14 @@ class CodePatcher:
     def _generate_diff(self, path: str, old_code: str, new_code: str) -> str:
         old_lines = (old_code or "").splitlines(keepends=True)
         new_lines = (new_code or "").splitlines(keepends=True)
-        diff = difflib.unified_diff(
+        diff = unified_diff(
             old_lines,
             new_lines,
             fromfile=path,
             tofile=f"{path} (updated)",
             n=self.context_lines,
-            lineterm=""
+            lineterm="",
+            algorithm=self.diff_algorithm,
         )
         return "\n".join(diff)
 
@@ -195,19 +506,34 @@ class CodePatcher:
           1) _save_diff(file_path, diff_text)
           2) _save_diff(file_path, old_code, new_code)
 
-        Возвращает путь к сохранённому diff-файлу или None при ошибке.
+        Возвращает путь к сохранённому diff-файлу (в режиме архива — ссылку
+        "<archive.sqlite>#<change_id>") или None при ошибке.
         """
         try:
+            change_id = new_change_id()
+            base_meta: Optional[Dict[str, Any]] = None
             if len(args) == 1:
                 # Старый вызов: вторым параметром уже готовый diff_text
                 diff_text = str(args[0])
             elif len(args) == 2:
                 # Новый вызов: переданы old_code и new_code
                 old_code, new_code = args
+                self._check_patch(file_path, str(old_code), str(new_code))
                 diff_text = self._generate_diff(file_path, str(old_code), str(new_code))
+                base_meta = self._store_base(file_path, str(old_code), str(new_code), change_id)
             else:
                 raise TypeError(f"_save_diff() ожидает 2 или 3 аргумента, получено: {1 + len(args)}")
 
+            if self.archive is not None:
+                change_id = self.archive.add(
+                    str(self._norm(file_path)), diff_text,
+                    run_id=self.ensure_run(), change_id=change_id, rel=self._diff_rel(file_path),
+                    meta=base_meta,
+                )
+                ref = self.archive.ref(change_id)
+                log_info(f"[CodePatcher] 💾 Diff в архиве: {change_id}")
+                return ref
+
             out_file = self._make_diff_output_path(file_path)
             out_file.parent.mkdir(parents=True, exist_ok=True)
 
@@ -217,13 +543,104 @@ class CodePatcher:
                 with open(out_file, "w", encoding="utf-8", newline="") as f:
                     f.write(diff_text)
 
+            if base_meta is not None:
+                meta_file = out_file.with_name(out_file.name[: -len(".diff.txt")] + ".meta.json")
+                payload = json.dumps(base_meta, ensure_ascii=False, indent=2)
+                if self.fm:
+                    self.fm.write_text(meta_file, payload)  # type: ignore[arg-type]
+                else:
+                    meta_file.write_text(payload, encoding="utf-8")
+
             log_info(f"[CodePatcher] 💾 Diff сохранён: {out_file}")
             return str(out_file)
 
+        except PatchValidationError:
+            raise
         except Exception as e:
             log_error(f"[CodePatcher] ❌ Ошибка при сохранении diff: {e}")
             return None
 
+    def _store_base(self, file_path: str, old_code: str, new_code: str, change_id: str) -> Dict[str, Any]:
+        """
+        База (код, против которого сделан патч) и результат патча — в BackupStore,
+        закреплены за диффом до его применения (apply_saved_diff).
+        """
+        old_hash = self.backup_store.put_blob(old_code.encode("utf-8"), pin=f"diff:{change_id}")
+        new_hash = self.backup_store.put_blob(new_code.encode("utf-8"), pin=f"diff:{change_id}")
+        return {
+            "change_id": change_id,
+            "file": str(self._norm(file_path)),
+            "mode": "diff_only",
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+            "old_hash": old_hash,
+            "new_hash": new_hash,
+        }
+
+    def _saved_diff_meta(self, ref: str) -> Tuple[str, Dict[str, Any]]:
+        """(change_id, meta) сохранённого диффа: ссылка/change_id в архиве или путь к .diff.txt."""
+        change_id = split_ref(ref) or ref
+        if self.archive is not None and not ref.endswith(".diff.txt"):
+            rec = self.archive.get(change_id)
+            if rec is None:
+                raise FileNotFoundError(f"saved diff not found: {ref}")
+            meta = dict(rec.meta or {})
+            meta.setdefault("file", rec.file)
+            return change_id, meta
+        meta_file = Path(ref[: -len(".diff.txt")] + ".meta.json") if ref.endswith(".diff.txt") else Path(ref)
+        if not meta_file.exists():
+            raise FileNotFoundError(f"saved diff metadata not found: {meta_file}")
+        meta = json.loads(meta_file.read_text(encoding="utf-8"))
+        return str(meta.get("change_id") or meta_file.stem), meta
+
+    def apply_saved_diff(self, ref: str) -> SavedDiffResult:
+        """
+        Применяет сохранённый дифф к файлу, который мог измениться после генерации:
+        - файл совпадает с базой — записываем код патча;
+        - файл уже равен коду патча — ничего не делаем;
+        - иначе трёхсторонний merge (база, текущий файл, код патча): чистый результат
+          применяется набором патчей (журнал, откат), при конфликтах файл не трогаем
+          и возвращаем точные диапазоны конфликтов (result.merge.conflicts, marked_text).
+        """
+        change_id, meta = self._saved_diff_meta(ref)
+        file_path = str(self._norm(meta["file"]))
+        if not meta.get("old_hash") or not meta.get("new_hash"):
+            log_warning(f"[CodePatcher] Дифф {change_id} без сохранённой базы — нужен повторный запрос к модели")
+            return SavedDiffResult(change_id, file_path, SAVED_NO_BASE)
+
+        base = self.backup_store.read(meta["old_hash"]).decode("utf-8")
+        patched = self.backup_store.read(meta["new_hash"]).decode("utf-8")
+        p = Path(file_path)
+        current = p.read_text(encoding="utf-8") if p.exists() else ""
+
+        merge: Optional[MergeResult] = None
+        if current == patched:
+            log_info(f"[CodePatcher] ♻️ Дифф {change_id} уже применён: {file_path}")
+            self.backup_store.unpin(f"diff:{change_id}")
+            return SavedDiffResult(change_id, file_path, SAVED_ALREADY_APPLIED)
+        if current == base:
+            merged = patched
+        else:
+            merge = merge3_text(base, current, patched, algorithm=self.diff_algorithm)
+            if not merge.ok:
+                for c in merge.conflicts:
+                    log_warning(f"[CodePatcher] ⚔️ Конфликт {change_id} в {file_path}: {c.describe()}")
+                return SavedDiffResult(change_id, file_path, SAVED_CONFLICT, merge=merge)
+            merged = merge.text
+            if merged == current:
+                log_info(f"[CodePatcher] ♻️ Изменения диффа {change_id} уже есть в файле: {file_path}")
+                self.backup_store.unpin(f"diff:{change_id}")
+                return SavedDiffResult(change_id, file_path, SAVED_ALREADY_APPLIED, merge=merge)
+            log_info(
+                f"[CodePatcher] 🔀 Дифф {change_id}: merge без конфликтов "
+                f"(перенесено кусков патча: {merge.taken_from_patch})"
+            )
+
+        ps = self.apply_patch_set([(file_path, current, merged)], label=f"saved_diff:{change_id}")
+        self.backup_store.unpin(f"diff:{change_id}")
+        return SavedDiffResult(
+            change_id, file_path, SAVED_APPLIED, merge=merge, set_id=ps.set_id if ps is not None else None,
+        )
+
     # ---------- Дополнительно: метаданные и пути ----------
 
     def _save_metadata(
@@ -232,25 +649,37 @@ class CodePatcher:
         old_code: str,
         new_code: str,
         diff_path: Optional[str],
-        interactive: bool
+        interactive: bool,
+        set_id: Optional[str] = None,
+        context: Optional[Dict[str, Any]] = None,
     ) -> None:
         """
-        Сохраняем метаданные о применённом патче рядом с .diff:
+        Сохраняем метаданные о применённом патче (в архив или рядом с .diff):
         - change_id, timestamps
         - пути, размеры, хэши (если CoreFileManager доступен)
         - режим применения (interactive/auto)
         """
         try:
-            change_id = f"{int(time.time())}"
+            change_id = split_ref(diff_path) or new_change_id()
             meta: Dict[str, Any] = {
                 "change_id": change_id,
+                "run_id": self.ensure_run() if self.archive is not None else self.run_id,
                 "file": str(Path(file_path).resolve()),
                 "diff_path": diff_path,
                 "mode": "interactive" if interactive else "auto",
+                "set_id": set_id,
                 "applied_at": datetime.now().isoformat(timespec="seconds"),
                 "old_len": len(old_code or ""),
                 "new_len": len(new_code or ""),
+                "old_hash": hashlib.sha256((old_code or "").encode("utf-8")).hexdigest(),
+                "new_hash": hashlib.sha256((new_code or "").encode("utf-8")).hexdigest(),
             }
+            try:
+                extra = self.patch_context if context is None else context
+                self.index.record(meta, diff_ref=diff_path, **extra)
+                self.last_change_ids.append(change_id)
+            except Exception as e:
+                log_warning(f"[CodePatcher] Индекс патчей не обновлён: {e}")
 
             # Хэши, если есть CoreFileManager
             if self.fm:
@@ -260,6 +689,15 @@ class CodePatcher:
                 except Exception:
                     pass
 
+            if self.archive is not None:
+                if not (split_ref(diff_path) and self.archive.set_meta(change_id, meta)):
+                    self.archive.add(
+                        meta["file"], None, run_id=meta["run_id"], change_id=change_id,
+                        rel=self._diff_rel(file_path), meta=meta,
+                    )
+                log_info(f"[CodePatcher] 🧾 Metadata в архиве: {change_id}")
+                return
+
             meta_path = self._make_diff_output_path(file_path, suffix=".meta.json")
             meta_path.parent.mkdir(parents=True, exist_ok=True)
 
@@ -282,33 +720,28 @@ class CodePatcher:
         - Иначе — в корне diff_dir.
         """
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        src = Path(file_path).resolve()
-
-        # База для относительного пути
-        base_candidates = []
-        if self.fm:
-            base_candidates.append(self.fm.base_dir)  # type: ignore[attr-defined]
-        # Евристика: если файл расположен внутри app/, положим дифы зеркально
-        base_candidates.append(Path.cwd())
-        chosen_rel = None
+        rel = self._diff_rel(file_path)
+        # app/agent/x.py -> app/patches/app/agent/x.py.<ts>.diff.txt
+        out_file = self.diff_dir / rel
+        return out_file.with_name(f"{out_file.name}.{ts}{suffix}")
 
+    def _diff_rel(self, file_path: str) -> str:
+        """
+        Относительный путь файла для раскладки диффов: относительно fm.base_dir или cwd
+        (если diffs_dirname_nested), иначе — просто имя файла.
+        """
+        src = Path(file_path).resolve()
         if self.diffs_dirname_nested:
+            base_candidates = []
+            if self.fm:
+                base_candidates.append(self.fm.base_dir)  # type: ignore[attr-defined]
+            base_candidates.append(Path.cwd())
             for base in base_candidates:
                 try:
-                    rel = src.relative_to(Path(base).resolve())
-                    chosen_rel = rel
-                    break
+                    return src.relative_to(Path(base).resolve()).as_posix()
                 except Exception:
                     continue
-
-        if chosen_rel:
-            # app/agent/x.py -> app/patches/app/agent/x.py.<ts>.diff.txt
-            out_file = self.diff_dir / chosen_rel
-            out_file = out_file.with_name(f"{out_file.name}.{ts}{suffix}")
-        else:
-            out_file = self.diff_dir / f"{src.name}.{ts}{suffix}"
-
-        return out_file
+        return src.name
 
     def _norm(self, p: str | os.PathLike) -> Path:
         return Path(p).expanduser().resolve()
\ No newline at end of file
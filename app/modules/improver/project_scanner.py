@@ -4,11 +4,11 @@ from __future__ import annotations
 import os
 import ast
 import re
-import hashlib
 import json
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Tuple
 
+from app.core.file_manager import file_digest
 from app.logger import log_info, log_warning, log_error
 
 # Лёгкая зависимость опциональна в ранних ветках
@@ -265,11 +265,7 @@ class ProjectScanner:
 
     def _sha256(self, abs_path: str) -> Optional[str]:
         try:
-            h = hashlib.sha256()
-            with open(abs_path, "rb") as f:
-                for chunk in iter(lambda: f.read(8192), b""):
-                    h.update(chunk)
-            return h.hexdigest()
+            return file_digest(abs_path, "sha256")
         except Exception as e:
             log_error(f"[ProjectScanner] ❌ Не удалось хэшировать файл {abs_path}: {e}")
             return None
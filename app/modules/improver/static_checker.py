@@ -0,0 +1,365 @@
+# app/modules/improver/static_checker.py
+from __future__ import annotations
+
+import ast
+import builtins
+import os
+import re
+import symtable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.logger import log_info, log_warning
+
+# Имена, которые есть у любого модуля, но отсутствуют в builtins
+_MODULE_DUNDERS = {
+    "__file__", "__name__", "__doc__", "__spec__", "__loader__",
+    "__package__", "__builtins__", "__path__", "__cached__", "__annotations__",
+}
+_BUILTINS: Set[str] = set(dir(builtins))
+# Встроенные имена, затенение которых считаем проблемой (без dunder и служебных site-имён)
+_SHADOWABLE_BUILTINS: Set[str] = {
+    n for n in _BUILTINS
+    if not n.startswith("_") and n not in {"copyright", "credits", "license", "exit", "quit"}
+}
+_IDENT_RE = re.compile(r"[A-Za-z_]\w*")
+
+
+@dataclass
+class Finding:
+    """
+    Одна находка локального статанализа.
+    kind: undefined-name | unused-import | unreachable-code | shadowed-builtin | bare-except | call-arity | syntax-error
+    """
+    kind: str
+    line: int
+    message: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def __str__(self) -> str:
+        return f"L{self.line}: [{self.kind}] {self.message}"
+
+
+class StaticChecker:
+    """
+    Быстрый локальный пре-фильтр перед LLM-багфиксом (ast + symtable, без импорта модуля).
+
+    Проверки:
+      - неопределённые имена (глобальные ссылки без определения в модуле/builtins)
+      - неиспользуемые импорты
+      - недостижимый код (после return/raise/break/continue)
+      - затенение builtins (def/class/аргументы/присваивания)
+      - голые except:
+      - несоответствие числа/имён аргументов при вызовах функций этого же модуля
+    """
+
+    def check_source(self, code: str, file_path: str = "<string>") -> List[Finding]:
+        try:
+            tree = ast.parse(code, filename=file_path)
+        except SyntaxError as e:
+            return [Finding("syntax-error", int(e.lineno or 0), str(e.msg))]
+
+        findings: List[Finding] = []
+        findings += self._undefined_names(code, tree, file_path)
+        if os.path.basename(file_path) != "__init__.py":  # в __init__ импорты — это реэкспорт
+            findings += self._unused_imports(tree)
+        findings += self._unreachable(tree)
+        findings += self._shadowed_builtins(tree)
+        findings += self._bare_excepts(tree)
+        findings += self._call_arity(tree)
+        findings.sort(key=lambda f: (f.line, f.kind))
+        return findings
+
+    def check_file(self, abs_path: str) -> List[Finding]:
+        try:
+            with open(abs_path, "r", encoding="utf-8") as f:
+                code = f.read()
+        except Exception as e:
+            log_warning(f"[StaticChecker] Не удалось прочитать {abs_path}: {e}")
+            return []
+        return self.check_source(code, abs_path)
+
+    # -------------------- проверки --------------------
+
+    def _undefined_names(self, code: str, tree: ast.Module, file_path: str) -> List[Finding]:
+        # `from x import *` делает проверку бессмысленной
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ImportFrom) and any(a.name == "*" for a in node.names):
+                return []
+        try:
+            top = symtable.symtable(code, file_path, "exec")
+        except SyntaxError:
+            return []
+
+        module_bound: Set[str] = set()
+        for sym in top.get_symbols():
+            if sym.is_assigned() or sym.is_imported() or sym.is_namespace():
+                module_bound.add(sym.get_name())
+        # `global x` + присваивание в функции тоже определяет x на уровне модуля
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Global):
+                module_bound.update(node.names)
+
+        undefined: Set[str] = set()
+        stack = [top]
+        while stack:
+            table = stack.pop()
+            is_module = table.get_type() == "module"
+            for sym in table.get_symbols():
+                name = sym.get_name()
+                if not sym.is_referenced():
+                    continue
+                if not (sym.is_global() or (is_module and not sym.is_assigned() and not sym.is_imported())):
+                    continue
+                if name in module_bound or name in _BUILTINS or name in _MODULE_DUNDERS:
+                    continue
+                undefined.add(name)
+            stack.extend(table.get_children())
+
+        if not undefined:
+            return []
+        first_line: Dict[str, int] = {}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id in undefined:
+                ln = getattr(node, "lineno", 0)
+                if node.id not in first_line or ln < first_line[node.id]:
+                    first_line[node.id] = ln
+        return [
+            Finding("undefined-name", first_line.get(n, 0), f"имя '{n}' не определено")
+            for n in sorted(undefined)
+        ]
+
+    def _unused_imports(self, tree: ast.Module) -> List[Finding]:
+        imported: Dict[str, int] = {}
+        for node in self._module_level_statements(tree.body):
+            if isinstance(node, ast.Import):
+                for a in node.names:
+                    imported.setdefault(a.asname or a.name.split(".")[0], node.lineno)
+            elif isinstance(node, ast.ImportFrom):
+                if node.module == "__future__":
+                    continue
+                for a in node.names:
+                    imported.setdefault(a.asname or a.name, node.lineno)
+        if not imported:
+            return []
+
+        used: Set[str] = set()
+        exported: Set[str] = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+                used.add(node.id)
+            elif isinstance(node, ast.Constant) and isinstance(node.value, str) and len(node.value) < 200:
+                # строковые аннотации вида Optional["OpenAI"] и содержимое __all__
+                exported.update(_IDENT_RE.findall(node.value))
+        return [
+            Finding("unused-import", ln, f"импорт '{name}' не используется")
+            for name, ln in imported.items()
+            if name not in used and name not in exported
+        ]
+
+    def _unreachable(self, tree: ast.Module) -> List[Finding]:
+        out: List[Finding] = []
+        terminal = (ast.Return, ast.Raise, ast.Break, ast.Continue)
+        for node in ast.walk(tree):
+            for field_name in ("body", "orelse", "finalbody"):
+                block = getattr(node, field_name, None)
+                if not isinstance(block, list):
+                    continue
+                for i, stmt in enumerate(block[:-1]):
+                    if isinstance(stmt, terminal):
+                        nxt = block[i + 1]
+                        out.append(Finding(
+                            "unreachable-code", nxt.lineno,
+                            f"код после '{type(stmt).__name__.lower()}' (строка {stmt.lineno}) недостижим",
+                        ))
+                        break
+        return out
+
+    def _shadowed_builtins(self, tree: ast.Module) -> List[Finding]:
+        out: List[Finding] = []
+        seen: Set[Tuple[str, int]] = set()
+
+        def _hit(name: str, line: int, what: str) -> None:
+            if name in _SHADOWABLE_BUILTINS and (name, line) not in seen:
+                seen.add((name, line))
+                out.append(Finding("shadowed-builtin", line, f"{what} '{name}' затеняет builtin"))
+
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                _hit(node.name, node.lineno, "определение")
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+                a = node.args
+                for arg in a.posonlyargs + a.args + a.kwonlyargs + [x for x in (a.vararg, a.kwarg) if x]:
+                    _hit(arg.arg, getattr(arg, "lineno", node.lineno), "аргумент")
+            elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                _hit(node.id, node.lineno, "переменная")
+        return out
+
+    def _bare_excepts(self, tree: ast.Module) -> List[Finding]:
+        return [
+            Finding("bare-except", node.lineno, "голый 'except:' перехватывает и SystemExit/KeyboardInterrupt")
+            for node in ast.walk(tree)
+            if isinstance(node, ast.ExceptHandler) and node.type is None
+        ]
+
+    def _call_arity(self, tree: ast.Module) -> List[Finding]:
+        """
+        Сверяем вызовы f(...) и self.m(...) с сигнатурами функций/методов этого же модуля.
+        Пропускаем всё, что может менять сигнатуру: декораторы (кроме static/classmethod),
+        повторные определения/переприсваивания, вызовы со *args/**kwargs.
+        """
+        out: List[Finding] = []
+
+        # модульные функции, определённые ровно один раз и нигде не переприсвоенные
+        defs: Dict[str, List[ast.AST]] = {}
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                defs.setdefault(node.name, []).append(node)
+        rebound: Set[str] = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+                rebound.add(node.id)
+            elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                rebound.update(a.asname or a.name.split(".")[0] for a in node.names)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node not in tree.body:
+                rebound.add(node.name)
+        module_funcs = {
+            name: nodes[0] for name, nodes in defs.items()
+            if len(nodes) == 1
+            and isinstance(nodes[0], (ast.FunctionDef, ast.AsyncFunctionDef))
+            and not nodes[0].decorator_list
+            and name not in rebound
+        }
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in module_funcs:
+                msg = self._arity_mismatch(module_funcs[node.func.id], node, skip_first=False)
+                if msg:
+                    out.append(Finding("call-arity", node.lineno, f"{node.func.id}(): {msg}"))
+
+        # методы: self.m(...) внутри того же класса
+        for cls in ast.walk(tree):
+            if not isinstance(cls, ast.ClassDef):
+                continue
+            if cls.bases and not all(isinstance(b, ast.Name) and b.id == "object" for b in cls.bases):
+                continue  # метод может быть переопределён/дополнен родителем — не гадаем
+            methods: Dict[str, Tuple[ast.AST, bool]] = {}
+            counts: Dict[str, int] = {}
+            for item in cls.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    counts[item.name] = counts.get(item.name, 0) + 1
+                    decos = [d.id for d in item.decorator_list if isinstance(d, ast.Name)]
+                    if len(decos) != len(item.decorator_list) or set(decos) - {"staticmethod", "classmethod"}:
+                        continue
+                    methods[item.name] = (item, "staticmethod" not in decos)
+            for node in ast.walk(cls):
+                if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+                    continue
+                owner = node.func.value
+                name = node.func.attr
+                if not (isinstance(owner, ast.Name) and owner.id in ("self", "cls")):
+                    continue
+                if name not in methods or counts.get(name, 0) != 1:
+                    continue
+                fn, bound = methods[name]
+                msg = self._arity_mismatch(fn, node, skip_first=bound)
+                if msg:
+                    out.append(Finding("call-arity", node.lineno, f"{cls.name}.{name}(): {msg}"))
+        return out
+
+    @staticmethod
+    def _arity_mismatch(fn: Any, call: ast.Call, *, skip_first: bool) -> Optional[str]:
+        if any(isinstance(a, ast.Starred) for a in call.args) or any(k.arg is None for k in call.keywords):
+            return None
+        a = fn.args
+        params = a.posonlyargs + a.args
+        n_defaults = len(a.defaults)
+        # (имя, есть_дефолт, только_позиционный)
+        positional = [
+            (p.arg, i >= len(params) - n_defaults, i < len(a.posonlyargs))
+            for i, p in enumerate(params)
+        ]
+        if skip_first and positional:
+            positional = positional[1:]  # self/cls
+        kw_names = {k.arg for k in call.keywords}
+        kwonly_required = {p.arg for p, d in zip(a.kwonlyargs, a.kw_defaults) if d is None}
+        accepted_kw = {name for name, _, pos_only in positional if not pos_only} | {p.arg for p in a.kwonlyargs}
+
+        n_args = len(call.args)
+        if a.vararg is None and n_args > len(positional):
+            return f"передано {n_args} позиционных, ожидается не более {len(positional)}"
+        if a.kwarg is None:
+            unknown = sorted(kw_names - accepted_kw)
+            if unknown:
+                return "неизвестные именованные аргументы: " + ", ".join(unknown)
+        missing = [name for name, has_default, _ in positional[n_args:] if not has_default and name not in kw_names]
+        missing += sorted(kwonly_required - kw_names)
+        if missing:
+            return "не переданы обязательные аргументы: " + ", ".join(missing)
+        return None
+
+    # -------------------- helpers --------------------
+
+    @staticmethod
+    def _module_level_statements(body: List[ast.stmt]) -> Iterable[ast.stmt]:
+        """Операторы верхнего уровня, включая вложенные в try/if (опциональные импорты)."""
+        stack = list(reversed(body))
+        while stack:
+            node = stack.pop()
+            yield node
+            if isinstance(node, (ast.Try, ast.If)):
+                nested: List[ast.stmt] = list(node.body) + list(node.orelse)
+                if isinstance(node, ast.Try):
+                    nested += list(node.finalbody)
+                    for h in node.handlers:
+                        nested += list(h.body)
+                stack.extend(reversed(nested))
+
+
+# -------------------- пакетный прогон в пуле процессов --------------------
+
+def _check_file_worker(abs_path: str) -> Tuple[str, List[Dict[str, Any]]]:
+    return abs_path, [f.to_dict() for f in StaticChecker().check_file(abs_path)]
+
+
+def check_files(paths: Iterable[str], max_workers: Optional[int] = None) -> Dict[str, List[Finding]]:
+    """
+    Прогоняет StaticChecker по файлам в ProcessPoolExecutor.
+    При недоступности пула (песочница/ограничения ОС) — последовательно в текущем процессе.
+    """
+    paths = list(paths)
+    results: Dict[str, List[Finding]] = {}
+    if not paths:
+        return results
+
+    raw: List[Tuple[str, List[Dict[str, Any]]]] = []
+    if len(paths) > 1 and (max_workers is None or max_workers > 1):
+        try:
+            workers = max_workers or min(len(paths), os.cpu_count() or 2)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                raw = list(pool.map(_check_file_worker, paths, chunksize=max(1, len(paths) // (workers * 4))))
+        except Exception as e:
+            log_warning(f"[StaticChecker] Пул процессов недоступен ({e}), работаю последовательно")
+            raw = []
+    if not raw:
+        raw = [_check_file_worker(p) for p in paths]
+
+    for path, items in raw:
+        results[path] = [Finding(**d) for d in items]
+    total = sum(len(v) for v in results.values())
+    log_info(f"[StaticChecker] Проверено файлов: {len(paths)}, находок: {total}")
+    return results
+
+
+def format_findings(findings: Iterable[Finding], limit: int = 50) -> str:
+    items = list(findings)
+    lines = [str(f) for f in items[:limit]]
+    if len(items) > limit:
+        lines.append(f"... и ещё {len(items) - limit}")
+    return "\n".join(lines)
+
+
+__all__ = ["Finding", "StaticChecker", "check_files", "format_findings"]
@@ -0,0 +1,159 @@
+# app/modules/improver/unit_splitter.py
+from __future__ import annotations
+
+import ast
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+
+@dataclass
+class CodeUnit:
+    """
+    Верхнеуровневая единица модуля (функция или класс) с точными границами в файле.
+    start/end — номера строк (с 1, включительно), start учитывает декораторы.
+    """
+    index: int
+    name: str
+    kind: str          # "function" | "class"
+    start: int
+    end: int
+    source: str
+    signature: str
+
+    @property
+    def lines(self) -> int:
+        return self.end - self.start + 1
+
+
+def _signature(node: ast.AST) -> str:
+    """Сигнатура без тела: def f(a, b) -> T: ... / class K(Base): + сигнатуры публичных методов."""
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        stub = type(node)(
+            name=node.name, args=node.args, body=[ast.Expr(ast.Constant(...))],
+            decorator_list=node.decorator_list, returns=node.returns,
+            type_comment=None, **({"type_params": node.type_params} if hasattr(node, "type_params") else {}),
+        )
+        return ast.unparse(ast.fix_missing_locations(stub))
+    if isinstance(node, ast.ClassDef):
+        body: List[ast.stmt] = []
+        for item in node.body:
+            if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and (
+                not item.name.startswith("_") or item.name == "__init__"
+            ):
+                body.append(item)
+        header = ast.ClassDef(
+            name=node.name, bases=node.bases, keywords=node.keywords,
+            body=[ast.Expr(ast.Constant(...))], decorator_list=node.decorator_list,
+            **({"type_params": node.type_params} if hasattr(node, "type_params") else {}),
+        )
+        lines = [ast.unparse(ast.fix_missing_locations(header)).rsplit("\n", 1)[0]]
+        for item in body:
+            lines.extend("    " + ln for ln in _signature(item).splitlines())
+        if not body:
+            lines.append("    ...")
+        return "\n".join(lines)
+    return ""
+
+
+def split_units(code: str) -> List[CodeUnit]:
+    """
+    Делит модуль на верхнеуровневые функции и классы по AST.
+    Бросает SyntaxError, если код не парсится.
+    """
+    tree = ast.parse(code)
+    lines = code.splitlines(keepends=True)
+    units: List[CodeUnit] = []
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        end = int(node.end_lineno or node.lineno)
+        units.append(CodeUnit(
+            index=len(units),
+            name=node.name,
+            kind="class" if isinstance(node, ast.ClassDef) else "function",
+            start=start,
+            end=end,
+            source="".join(lines[start - 1:end]),
+            signature=_signature(node),
+        ))
+    return units
+
+
+def _referenced_names(source: str) -> Set[str]:
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return set()
+    return {n.id for n in ast.walk(tree) if isinstance(n, ast.Name)}
+
+
+def unit_context(code: str, units: List[CodeUnit], unit: CodeUnit, *, max_const_lines: int = 3) -> str:
+    """
+    Минимальный контекст для юнита: только те импорты, короткие модульные константы
+    и сигнатуры соседних юнитов, на которые он реально ссылается.
+    """
+    tree = ast.parse(code)
+    lines = code.splitlines()
+    used = _referenced_names(unit.source)
+
+    imports: List[str] = []
+    consts: List[str] = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            bound = {a.asname or a.name.split(".")[0] for a in node.names}
+            if (isinstance(node, ast.ImportFrom) and node.module == "__future__") or bound & used:
+                imports.append("\n".join(lines[node.lineno - 1:node.end_lineno]))
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = {t.id for t in targets if isinstance(t, ast.Name)}
+            span = int(node.end_lineno or node.lineno) - node.lineno + 1
+            if names & used:
+                if span <= max_const_lines:
+                    consts.append("\n".join(lines[node.lineno - 1:node.end_lineno]))
+                else:
+                    consts.append(f"{', '.join(sorted(names))} = ...  # {span} строк")
+
+    neighbours = [u.signature for u in units if u.index != unit.index and u.name in used]
+
+    parts: List[str] = []
+    if imports:
+        parts.append("# импорты\n" + "\n".join(imports))
+    if consts:
+        parts.append("# константы модуля\n" + "\n".join(consts))
+    if neighbours:
+        parts.append("# сигнатуры соседних функций/классов\n" + "\n\n".join(neighbours))
+    return "\n\n".join(parts)
+
+
+def splice_units(code: str, units: List[CodeUnit], replacements: Dict[int, str]) -> str:
+    """
+    Вклеивает новые версии юнитов (по CodeUnit.index) обратно в файл.
+    Замены идут снизу вверх, поэтому смещения строк вышележащих юнитов не «плывут».
+    """
+    lines = code.splitlines(keepends=True)
+    by_index = {u.index: u for u in units}
+    for idx in sorted(replacements, key=lambda i: by_index[i].start, reverse=True):
+        unit = by_index[idx]
+        new_src = replacements[idx]
+        if unit.source.endswith("\n") and not new_src.endswith("\n"):
+            new_src += "\n"
+        lines[unit.start - 1:unit.end] = new_src.splitlines(keepends=True)
+    return "".join(lines)
+
+
+def check_unit_replacement(unit: CodeUnit, new_src: str) -> Optional[str]:
+    """
+    None — замена корректна (парсится и определяет юнит с тем же именем и видом); иначе причина.
+    """
+    try:
+        tree = ast.parse(new_src)
+    except SyntaxError as e:
+        return f"синтаксическая ошибка L{e.lineno}: {e.msg}"
+    kinds = (ast.ClassDef,) if unit.kind == "class" else (ast.FunctionDef, ast.AsyncFunctionDef)
+    if not any(isinstance(n, kinds) and n.name == unit.name for n in tree.body):
+        return f"в ответе нет {unit.kind} '{unit.name}' верхнего уровня"
+    return None
+
+
+__all__ = ["CodeUnit", "split_units", "unit_context", "splice_units", "check_unit_replacement"]
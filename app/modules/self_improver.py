@@ -2,20 +2,30 @@
 from __future__ import annotations
 
 import os
-import ast
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Generator, Optional, Dict, Any, Iterable, List, Tuple
 
+from app.core.backup_store import get_backup_store
 from app.core.file_manager import FileManager
 from app.modules.improver.project_scanner import ProjectScanner
 from app.modules.improver.file_summarizer import FileSummarizer
 from app.modules.improver.improvement_planner import ImprovementPlanner
 from app.modules.improver.patch_requester import PatchRequester
 from app.modules.improver.patcher import CodePatcher
+from app.modules.improver.approval_queue import (
+    STATUS_APPROVED, STATUS_PENDING, STATUS_REJECTED, ApprovalPolicy,
+)
+from app.modules.improver.patch_validator import PatchValidator, PatchValidationError
+from app.modules.improver.patch_classifier import PATCH_IDENTICAL, PATCH_COSMETIC
 from app.modules.improver.error_debugger import ErrorDebugger
 from app.modules.analyzer import CodeAnalyzer
 from app.logger import log_info, log_warning, log_error
 
 from app.modules.improver.ai_bug_fixer import AIBugFixer
+from app.modules.improver.static_checker import Finding, check_files, format_findings
+from app.modules.improver.unit_splitter import (
+    CodeUnit, split_units, unit_context, splice_units, check_unit_replacement,
+)
 
 
 # ───────────────────────── настройки по умолчанию ─────────────────────────
@@ -73,17 +83,33 @@ class SelfImprover:
 
         self.chatgpt = CodeAnalyzer(self.config)
 
-        # Пути бэкапов/диффов
-        self.backup_path = self.config.get("backups_dir", "app/backups")
+        # Бэкапы — общий BackupStore (backups_dir в конфиге переопределяет корень); диффы — каталог
+        self.backup_store = get_backup_store(
+            self.config.get("backups_dir"),
+            codec=str(self.config.get("backup_codec", "zlib")),
+            keep_per_path=int(self.config.get("backup_keep_per_path", 20)),
+            max_age_days=self.config.get("backup_max_age_days", 30),
+        )
+        self.backup_path = str(self.backup_store.root)
         self.diff_path = self.config.get("diffs_dir", "app/patches")
-        os.makedirs(self.backup_path, exist_ok=True)
         os.makedirs(self.diff_path, exist_ok=True)
 
         # Модули пайплайна
         self.summarizer = FileSummarizer()
         self.planner = ImprovementPlanner()
         self.requester = PatchRequester()
-        self.patcher = CodePatcher(backup_dir=self.backup_path, diff_dir=self.diff_path)
+        self.validator = PatchValidator.from_config(self.config, project_root=self.project_root)
+        self.patcher = CodePatcher(
+            backup_dir=self.backup_path,
+            diff_dir=self.diff_path,
+            validator=self.validator,
+            backup_store=self.backup_store,
+            skip_cosmetic=bool(self.config.get("skip_cosmetic_patches", True)),
+            normalize_format=bool(self.config.get("normalize_format", False)),
+            diff_algorithm=str(self.config.get("diff_algorithm", "myers")),
+            approval_policy=ApprovalPolicy.from_config(self.config, project_root=self.project_root),
+            approval_poll_interval=float(self.config.get("approval_poll_interval", 2.0)),
+        )
         self.debugger = ErrorDebugger(self.chatgpt)
 
         # Флаги/управление
@@ -107,8 +133,24 @@ class SelfImprover:
         # Диагностика сканирования
         self.debug_scan: bool = bool(self.config.get("debug_scan", True))
 
+        # Локальный статанализ перед LLM-багфиксом: чистые файлы не отправляем в модель
+        self.static_prefilter: bool = bool(self.config.get("static_prefilter", True))
+        self.static_workers: Optional[int] = self.config.get("static_workers")
+
+        # Декомпозиция больших файлов: план/патч по функциям и классам, параллельно
+        self.unit_mode: bool = bool(self.config.get("unit_mode", True))
+        self.unit_mode_min_lines: int = int(self.config.get("unit_mode_min_lines", 300))
+        self.unit_min_lines: int = int(self.config.get("unit_min_lines", 5))
+        self.unit_workers: int = max(1, int(self.config.get("unit_workers", 4)))
+
+        self._latency_mark: float = 0.0  # total_latency_ms анализатора на начало текущего файла
+
         # Багфиксер
-        self.bugfixer = AIBugFixer(self.chatgpt, max_fix_cycles=self.max_fix_cycles)
+        self.bugfixer = AIBugFixer(
+            self.chatgpt,
+            max_fix_cycles=self.max_fix_cycles,
+            propose_first=bool(self.config.get("bugfix_propose_first", False)),
+        )
 
     # ───────────────────────── публичный API ─────────────────────────
 
@@ -158,6 +200,9 @@ class SelfImprover:
         for line in header.split("\n"):
             if line:
                 yield line
+        run_id = self.patcher.begin_run("self_improver")
+        if run_id:
+            yield f"🗃️ run_id={run_id} (диффы и метаданные — в {self.patcher.archive.path})"
 
         # 1) Скан проекта (метаданные/кэш — для правой панели)
         scanner_root = os.path.abspath(os.path.join(self.project_root, root))
@@ -208,8 +253,23 @@ class SelfImprover:
             yield "ℹ️ Подходящих файлов не найдено. Ослабь фильтры (exclude/sensitive) или расширь include_exts."
             return
 
-        any_success = False
+        # 2.5) Локальный статанализ кандидатов (пул процессов) — фильтр для багфикса
+        static_findings: Dict[str, List[Finding]] = {}
+        if auto_bugfix and self.static_prefilter:
+            py_files = [p for p in candidates if p.endswith(".py")]
+            yield f"🔬 Локальный статанализ ({len(py_files)} файлов)…"
+            try:
+                static_findings = check_files(py_files, max_workers=self.static_workers)
+            except Exception as e:
+                log_warning(f"[SelfImprover] Статанализ не удался: {e}")
+                static_findings = {}
+            dirty = sum(1 for v in static_findings.values() if v)
+            yield f"🔬 Статанализ: с находками {dirty}, чистых {len(static_findings) - dirty}"
+
+        any_success = False  # применено (одобрено, в т.ч. политикой) или сохранён diff
+        queued = 0           # ждут решения ревьюера — ещё не применены
         processed = 0
+        noop_skipped: Dict[str, int] = {PATCH_IDENTICAL: 0, PATCH_COSMETIC: 0}
 
         # 3) Обработка каждого файла
         for abs_path in candidates:
@@ -231,6 +291,7 @@ class SelfImprover:
                 continue
 
             yield f"📥 Прочитан файл ({len(old_code)} симв.)"
+            self._latency_mark = self.chatgpt.total_latency_ms
 
             # summary
             yield "🧾 Генерация метасаммери (FileSummarizer)…"
@@ -243,123 +304,169 @@ class SelfImprover:
             yield f"📄 Саммери: {rel_path}\n{summary}"
 
             # предварительный багфикс
-            if auto_bugfix:
+            bugfix_id: Optional[str] = None  # заявка багфикса: основной патч сделан поверх неё
+            findings = static_findings.get(abs_path)
+            if auto_bugfix and findings is not None and not findings:
+                yield f"🧪 Статанализ чист — багфикс пропущен: {rel_path}"
+            elif auto_bugfix:
                 yield f"🧪 Предварительный багфикс включен → пытаюсь для {rel_path}"
+                hints = None
+                if findings:
+                    hints = "Находки локального статанализа:\n" + format_findings(findings)
+                    yield f"🔬 Находки статанализа ({len(findings)}):\n" + format_findings(findings, limit=10)
+
+                bugfix_noop: Optional[str] = None  # identical/cosmetic багфикс: ни diff, ни заявки
 
                 def _apply_attempt(new_text: str):
-                    if auto_apply_patches:
-                        self.patcher.confirm_and_apply_patch(abs_path, old_code, new_text)
-                    else:
-                        self.patcher._save_diff(abs_path, old_code, new_text)
+                    nonlocal bugfix_noop
+                    # тот же фильтр, что и для основного патча — и для очереди, и для diff-only
+                    kind = self.patcher.classify(abs_path, old_code, new_text)
+                    if kind == PATCH_IDENTICAL or (kind == PATCH_COSMETIC and self.patcher.skip_cosmetic):
+                        bugfix_noop = kind
+                        return
+                    # PatchValidationError → AIBugFixer сделает следующую попытку
+                    self._apply_or_save(abs_path, old_code, new_text, auto_apply_patches)
 
                 def _on_error(err: Exception, attempt: int):
                     log_warning(f"bugfix attempt {attempt} failed for {rel_path}: {err}")
 
+                self.bugfixer.max_fix_cycles = max_fix_cycles
+                self.patcher.last_approval = None
                 bugfixed = self.bugfixer.iterative_fix_cycle(
                     file_path=rel_path,
                     summary=summary,
                     old_code=old_code,
                     apply_callback=_apply_attempt,
-                    on_error_callback=_on_error
+                    on_error_callback=_on_error,
+                    hints=hints,
                 )
-                if bugfixed and bugfixed != old_code:
-                    yield "✅ Bugfix-патч подготовлен " + ("(applied)" if auto_apply_patches else "(diff сохранён)")
+                last = self.bugfixer.last_result
+                if last is not None and last.findings:
+                    yield "🐞 Находки багфикса:\n" + "\n".join(f"- {f}" for f in last.findings)
+                item = self.patcher.last_approval
+                if bugfixed and bugfix_noop is not None:
+                    # файл не меняется — основной патч строим от исходного кода
+                    noop_skipped[bugfix_noop] += 1
+                    yield f"♻️ Bugfix-патч без смысловых изменений ({bugfix_noop}) — пропуск: {rel_path}"
+                elif bugfixed and bugfixed != old_code and auto_apply_patches and (
+                    item is None or item.status not in (STATUS_PENDING, STATUS_APPROVED)
+                ):
+                    # патч пропущен (identical/cosmetic) или отклонён политикой — файл останется
+                    # прежним, поэтому основной патч строим от исходного кода, а не от bugfixed
+                    yield f"ℹ️ Bugfix-патч не поставлен в очередь ({self._approval_note(rel_path)})"
+                elif bugfixed and bugfixed != old_code:
+                    yield "✅ Bugfix-патч подготовлен " + (
+                        f"({self._approval_note(rel_path)})" if auto_apply_patches else "(diff сохранён)"
+                    )
+                    if auto_apply_patches:
+                        bugfix_id = item.id
+                        any_success, queued = self._tally_approval(any_success, queued)
                     old_code = bugfixed
                 else:
                     yield "ℹ️ Багфикс изменений не предложил."
             else:
                 yield "🧪 Предварительный багфикс отключён настройками."
 
-            # план
-            yield "📝 Формирую промпт плана (ImprovementPlanner)…"
-            plan_prompt = self.planner.build_prompt(rel_path, summary)
-            if self.chat_panel:
-                try:
-                    self.chat_panel.add_gpt_request(plan_prompt)
-                except Exception:
-                    pass
-            try:
-                yield "🤖 Запрашиваю план у OpenAI…"
-                raw_plan = self.chatgpt.chat(plan_prompt, system_msg=self.planner.SYSTEM_MSG)
+            # большой файл → план/патч по юнитам (функции/классы) параллельно
+            units = self._units_for(rel_path, old_code)
+            if units:
+                new_code = yield from self._improve_by_units(rel_path, old_code, summary, units)
+                if not new_code:
+                    yield f"ℹ️ Ни один юнит не изменён: {rel_path}"
+                    continue
+            else:
+                # план
+                yield "📝 Формирую промпт плана (ImprovementPlanner)…"
+                plan_prompt = self.planner.build_prompt(rel_path, summary)
                 if self.chat_panel:
                     try:
-                        self.chat_panel.add_gpt_response(raw_plan)
+                        self.chat_panel.add_gpt_request(plan_prompt)
                     except Exception:
                         pass
-            except Exception as e:
-                yield f"❌ Ошибка при запросе плана: {e}"
-                continue
+                try:
+                    yield "🤖 Запрашиваю план у OpenAI…"
+                    raw_plan = self.chatgpt.chat(plan_prompt, system_msg=self.planner.SYSTEM_MSG)
+                    if self.chat_panel:
+                        try:
+                            self.chat_panel.add_gpt_response(raw_plan)
+                        except Exception:
+                            pass
+                except Exception as e:
+                    yield f"❌ Ошибка при запросе плана: {e}"
+                    continue
 
-            plan_data = self.planner.extract_plan(raw_plan)
-            if not plan_data or not plan_data.get("plan"):
-                yield f"❌ GPT не дал валидный план для: {rel_path}"
-                continue
+                plan_data = self.planner.extract_plan(raw_plan)
+                if not plan_data or not plan_data.get("plan"):
+                    yield f"❌ GPT не дал валидный план для: {rel_path}"
+                    continue
 
-            if isinstance(plan_data["plan"], list):
-                pretty_lines = []
-                for it in plan_data["plan"]:
-                    s = it.get("step")
-                    a = it.get("action")
-                    d = it.get("details")
-                    if s is not None:
-                        pretty_lines.append(f"{s}. {a or ''}{(' — ' + d) if d else ''}")
-                    else:
-                        pretty_lines.append(f"- {a or ''}{(' — ' + d) if d else ''}")
-                plan_pretty = "\n".join(pretty_lines)
-            else:
-                plan_pretty = str(plan_data["plan"])
-            yield f"💡 План улучшений для {rel_path}:\n{plan_pretty}"
+                if isinstance(plan_data["plan"], list):
+                    pretty_lines = []
+                    for it in plan_data["plan"]:
+                        s = it.get("step")
+                        a = it.get("action")
+                        d = it.get("details")
+                        if s is not None:
+                            pretty_lines.append(f"{s}. {a or ''}{(' — ' + d) if d else ''}")
+                        else:
+                            pretty_lines.append(f"- {a or ''}{(' — ' + d) if d else ''}")
+                    plan_pretty = "\n".join(pretty_lines)
+                else:
+                    plan_pretty = str(plan_data["plan"])
+                yield f"💡 План улучшений для {rel_path}:\n{plan_pretty}"
 
-            # запрос нового кода
-            yield "🧵 Готовлю промпт для патча (PatchRequester)…"
-            patch_prompt = self.requester.build_prompt(rel_path, old_code, summary, plan_data)
-            if self.chat_panel:
-                try:
-                    self.chat_panel.add_gpt_request(patch_prompt)
-                except Exception:
-                    pass
-            try:
-                yield "🤖 Запрашиваю новый код у OpenAI…"
-                raw_code = self.chatgpt.chat(patch_prompt, system_msg=self.requester.SYSTEM_MSG)
-                new_code = self.requester.extract_code(raw_code)
+                # запрос нового кода
+                yield "🧵 Готовлю промпт для патча (PatchRequester)…"
+                patch_prompt = self.requester.build_prompt(rel_path, old_code, summary, plan_data)
                 if self.chat_panel:
                     try:
-                        self.chat_panel.add_gpt_response(raw_code)
+                        self.chat_panel.add_gpt_request(patch_prompt)
                     except Exception:
                         pass
-            except Exception as e:
-                yield f"⚠️ Ошибка при получении патча: {e}"
-                continue
+                try:
+                    yield "🤖 Запрашиваю новый код у OpenAI…"
+                    raw_code = self.chatgpt.chat(patch_prompt, system_msg=self.requester.SYSTEM_MSG)
+                    new_code = self.requester.extract_code(raw_code)
+                    if self.chat_panel:
+                        try:
+                            self.chat_panel.add_gpt_response(raw_code)
+                        except Exception:
+                            pass
+                except Exception as e:
+                    yield f"⚠️ Ошибка при получении патча: {e}"
+                    continue
 
-            if not new_code or not isinstance(new_code, str):
-                yield "⚠️ Пустой патч — пропускаю."
-                continue
+                if not new_code or not isinstance(new_code, str):
+                    yield "⚠️ Пустой патч — пропускаю."
+                    continue
 
-            yield f"📨 Патч получен ({len(new_code)} симв.)."
+                yield f"📨 Патч получен ({len(new_code)} симв.)."
 
-            # синтакс-проверка для .py
-            syntax_ok = True
-            if rel_path.endswith(".py"):
-                try:
-                    ast.parse(new_code)
-                except SyntaxError as e:
-                    syntax_ok = False
-                    log_warning(f"syntax error in new code for {rel_path}: {e}")
+            # пустой/косметический патч — ни валидации, ни diff, ни бэкапа
+            kind = self.patcher.classify(abs_path, old_code, new_code)
+            if kind == PATCH_IDENTICAL or (kind == PATCH_COSMETIC and self.patcher.skip_cosmetic):
+                noop_skipped[kind] += 1
+                yield f"♻️ Патч без смысловых изменений ({kind}) — пропуск: {rel_path}"
+                processed += 1
+                continue
+
+            # валидация кандидата (parse/compile/imports/symbols[/smoke]) — до любой записи
+            report = self.patcher.validate_patch(abs_path, old_code, new_code)
+            if report is not None and report.checks:
+                yield f"🧪 Валидация: {report.summary()}"
 
             # применить / сохранить diff
             try:
-                if auto_apply_patches and syntax_ok:
-                    self.patcher.confirm_and_apply_patch(abs_path, old_code, new_code)
-                    any_success = True
-                    yield "🧷 Применение патча… (applied)"
-                    yield f"✅ Патч успешно применён: {rel_path}"
+                if report is not None and not report.ok:
+                    raise PatchValidationError(report)
+                self._apply_or_save(abs_path, old_code, new_code, auto_apply_patches, after=bugfix_id)
+                if auto_apply_patches:
+                    any_success, queued = self._tally_approval(any_success, queued)
+                    yield f"🧷 {self._approval_note(rel_path)}"
                 else:
-                    self.patcher._save_diff(abs_path, old_code, new_code)
                     any_success = True
                     yield "🧷 Применение патча… (save diff only)"
                     yield f"📝 Diff сохранён (без применения): {rel_path}"
-                    if auto_apply_patches and not syntax_ok:
-                        yield "❌ Новый код не прошёл синтакс-проверку — авто-применение отменено."
             except Exception as e:
                 log_error(f"Ошибка применения патча для {rel_path}: {e}")
                 yield f"💥 Ошибка применения патча: {e}"
@@ -368,14 +475,15 @@ class SelfImprover:
                 fix_code: Optional[str] = None
                 try:
                     fix_code = self.debugger.request_fix(rel_path, new_code, str(e))
-                except Exception:
-                    pass
+                    if fix_code:
+                        # ответ ErrorDebugger проходит тот же гейт валидации внутри patcher
+                        self._apply_or_save(abs_path, old_code, fix_code, auto_apply_patches, after=bugfix_id)
+                except Exception as e2:
+                    log_warning(f"ErrorDebugger fix rejected for {rel_path}: {e2}")
+                    fix_code = None
                 if not fix_code and auto_bugfix:
                     def _apply_attempt2(nc: str):
-                        if auto_apply_patches:
-                            self.patcher.confirm_and_apply_patch(abs_path, old_code, nc)
-                        else:
-                            self.patcher._save_diff(abs_path, old_code, nc)
+                        self._apply_or_save(abs_path, old_code, nc, auto_apply_patches, after=bugfix_id)
                     def _on_error2(err: Exception, attempt: int):
                         log_warning(f"fallback bugfix attempt {attempt} failed for {rel_path}: {err}")
                     fix_code = self.bugfixer.iterative_fix_cycle(
@@ -386,10 +494,11 @@ class SelfImprover:
                         on_error_callback=_on_error2
                     )
                 if fix_code:
-                    any_success = True
                     if auto_apply_patches:
-                        yield f"✅ Исправление применено: {rel_path}"
+                        any_success, queued = self._tally_approval(any_success, queued)
+                        yield f"🧷 Исправление: {self._approval_note(rel_path)}"
                     else:
+                        any_success = True
                         yield f"📝 Diff исправления сохранён (без применения): {rel_path}"
                 else:
                     yield f"💥 Не удалось автоматически исправить: {rel_path}"
@@ -399,7 +508,28 @@ class SelfImprover:
                 yield f"⏳ Прогресс: {processed}/{chosen}"
 
         # 4) финальный статус
-        if not any_success:
+        if any(noop_skipped.values()):
+            msg = (
+                f"♻️ Пропущено пустых патчей: identical={noop_skipped[PATCH_IDENTICAL]}, "
+                f"cosmetic={noop_skipped[PATCH_COSMETIC]}"
+            )
+            log_info(msg)
+            yield msg
+        if auto_apply_patches:
+            counts = self.patcher.approvals.counts()
+            if counts[STATUS_PENDING] or counts[STATUS_APPROVED]:
+                msg = (
+                    f"⏳ Очередь подтверждения: ожидают={counts[STATUS_PENDING]}, "
+                    f"одобрены и применяются={counts[STATUS_APPROVED]} "
+                    "(python -m app.modules.improver.approval_queue list)"
+                )
+                log_info(msg)
+                yield msg
+        if not any_success and queued:
+            msg = f"⏳ Самоусовершенствование завершено: патчей ждут подтверждения — {queued}, применённых пока нет."
+            log_info(msg)
+            yield msg
+        elif not any_success:
             msg = "⚠️ Самоусовершенствование завершено, но ни один файл не был улучшён."
             log_warning(msg)
             yield msg
@@ -408,8 +538,125 @@ class SelfImprover:
             log_info(msg)
             yield msg
 
+    # ───────────────────────── декомпозиция больших файлов ─────────────────────────
+
+    def _units_for(self, rel_path: str, code: str) -> List[CodeUnit]:
+        """Юниты для режима декомпозиции или [] (режим выключен / файл мал / не парсится)."""
+        if not self.unit_mode or not rel_path.endswith(".py"):
+            return []
+        if len(code.splitlines()) < self.unit_mode_min_lines:
+            return []
+        try:
+            units = split_units(code)
+        except SyntaxError:
+            return []
+        return [u for u in units if u.lines >= self.unit_min_lines]
+
+    def _improve_unit(self, rel_path: str, summary: Any, code: str,
+                      units: List[CodeUnit], unit: CodeUnit) -> Tuple[Optional[str], str]:
+        """
+        План + патч одного юнита (выполняется в потоке). Возвращает (новый_исходник | None, статус).
+        """
+        context = unit_context(code, units, unit)
+        label = f"{rel_path}::{unit.name}"
+        unit_summary = (
+            f"{summary}\n\nФрагмент: {unit.kind} {unit.name} (строки {unit.start}–{unit.end})\n"
+            f"{context}\n\n{unit.source}"
+        )
+        raw_plan = self.chatgpt.chat(self.planner.build_prompt(label, unit_summary), system_msg=self.planner.SYSTEM_MSG)
+        plan_data = self.planner.extract_plan(raw_plan)
+        if not plan_data or not plan_data.get("plan"):
+            return None, "нет валидного плана"
+
+        prompt = self.requester.build_unit_prompt(rel_path, unit.name, unit.source, context, plan_data)
+        raw_code = self.chatgpt.chat(prompt, system_msg=self.requester.UNIT_SYSTEM_MSG)
+        new_src = self.requester.extract_code(raw_code)
+        if not new_src or new_src.strip() == self.requester.NO_CHANGES:
+            return None, "без изменений"
+        if new_src.strip() == unit.source.strip():
+            return None, "без изменений"
+        err = check_unit_replacement(unit, new_src)
+        if err:
+            return None, f"отклонён: {err}"
+        return new_src, "обновлён"
+
+    def _improve_by_units(
+        self, rel_path: str, code: str, summary: Any, units: List[CodeUnit]
+    ) -> Generator[str, None, Optional[str]]:
+        """
+        Параллельно планирует и патчит юниты, затем вклеивает изменённые обратно в файл
+        (снизу вверх — смещения строк остаются корректными). Возвращает новый код или None.
+        """
+        yield (
+            f"🧩 Режим декомпозиции: {len(units)} юнитов, {len(code.splitlines())} строк, "
+            f"потоков={self.unit_workers}"
+        )
+        replacements: Dict[int, str] = {}
+        with ThreadPoolExecutor(max_workers=self.unit_workers) as pool:
+            futures = {
+                pool.submit(self._improve_unit, rel_path, summary, code, units, u): u
+                for u in units
+            }
+            for fut in as_completed(futures):
+                unit = futures[fut]
+                try:
+                    new_src, status = fut.result()
+                except Exception as e:
+                    new_src, status = None, f"ошибка: {e}"
+                    log_warning(f"[SelfImprover] unit {rel_path}::{unit.name} failed: {e}")
+                if new_src:
+                    replacements[unit.index] = new_src
+                yield f"🧩 {unit.name} (L{unit.start}–{unit.end}): {status}"
+                if self.stop_requested:
+                    for f in futures:
+                        f.cancel()
+                    break
+
+        if not replacements:
+            return None
+        new_code = splice_units(code, units, replacements)
+        yield f"🧩 Вклеено юнитов: {len(replacements)}/{len(units)}"
+        return new_code
+
     # ───────────────────────── утилиты ─────────────────────────
 
+    def _apply_or_save(
+        self, abs_path: str, old_code: str, new_code: str, auto_apply: bool, *, after: Optional[str] = None,
+    ) -> None:
+        """
+        Единая точка записи патча: в очередь подтверждения (auto_apply) или сохранить только diff.
+        CodePatcher прогоняет PatchValidator до постановки в очередь и бросает PatchValidationError;
+        одобренный (ревьюером или политикой) патч применяется в фоне, конвейер не ждёт.
+        after — заявка, поверх которой сделан патч (багфикс): применяется только после неё.
+        Модель и суммарная латентность запросов по файлу уходят в индекс патчей.
+        """
+        self.patcher.patch_context = {
+            "model": self.chatgpt.openai_model,
+            "latency_ms": round(self.chatgpt.total_latency_ms - self._latency_mark, 1),
+        }
+        if auto_apply:
+            self.patcher.confirm_and_apply_patch(abs_path, old_code, new_code, after=after)
+        else:
+            self.patcher._save_diff(abs_path, old_code, new_code)
+
+    def _tally_approval(self, any_success: bool, queued: int) -> Tuple[bool, int]:
+        """Учитывает последнюю заявку: одобрена — успех, ждёт ревьюера — в очереди (не применена)."""
+        item = self.patcher.last_approval
+        if item is None:
+            return any_success, queued
+        return any_success or item.status == STATUS_APPROVED, queued + (item.status == STATUS_PENDING)
+
+    def _approval_note(self, rel_path: str) -> str:
+        """Строка статуса последней заявки на подтверждение."""
+        item = self.patcher.last_approval
+        if item is None:
+            return f"патч без изменений: {rel_path}"
+        if item.status == STATUS_APPROVED:
+            return f"одобрен политикой, применяется в фоне: {rel_path} [{item.id}]"
+        if item.status == STATUS_REJECTED:
+            return f"отклонён политикой: {rel_path} [{item.id}]"
+        return f"ожидает подтверждения: {rel_path} [{item.id}]"
+
     def _collect_candidates_with_debug(
         self,
         *,
@@ -5,15 +5,26 @@ import os
 from app.core.file_manager import FileManager
 from app.logger import log_info, log_warning
 
-def run(path: str) -> str:
+def run(path: str, offset: int = 0, max_bytes: Optional[int] = None) -> str:
     """
     Читать файл безопасно (только текст).
+    offset/max_bytes — прочитать только диапазон байт (большие логи/артефакты не копируются целиком);
+    offset < 0 — от конца файла.
     """
     fm = FileManager()
     abs_path = os.path.abspath(path)
+    if offset or max_bytes is not None:
+        try:
+            data = fm.read_range(abs_path, int(offset), None if max_bytes is None else int(max_bytes))
+        except Exception as e:
+            log_warning(f"[fs.read] не удалось прочитать: {abs_path}: {e}")
+            return ""
+        text = data.decode("utf-8", errors="replace")
+        log_info(f"[fs.read] {abs_path} [{offset}:+{len(data)}] ({len(text)} симв.)")
+        return text
     text: Optional[str] = fm.read_file(abs_path)
     if text is None:
         log_warning(f"[fs.read] не удалось прочитать: {abs_path}")
         return ""
     log_info(f"[fs.read] {abs_path} ({len(text)} симв.)")
-    return text
\ No newline at end of file
+    return text
@@ -0,0 +1,59 @@
+from __future__ import annotations
+from typing import Dict, Any
+import os
+
+from app.core.code_index import get_code_index
+from app.logger import log_info, log_warning
+
+MAX_RESULTS = 100
+PER_FILE = 20
+
+
+def run(
+    query: str,
+    path: str = ".",
+    regex: bool = False,
+    ignore_case: bool = False,
+    max_results: int = MAX_RESULTS,
+) -> Dict[str, Any]:
+    """
+    Найти строки с query в текстовых файлах под path.
+    Каталог внутри текущего проекта ищется по общему индексу проекта (с фильтром по префиксу),
+    иначе — по собственному индексу каталога. Базы индексов лежат в проекте (app/data/code_index),
+    в искомый каталог ничего не пишется.
+    Перед поиском индекс сверяется с диском всегда (sync(force=True)): файл, записанный
+    предыдущим шагом плана, должен находиться сразу.
+    """
+    if not query:
+        return {"ok": False, "error": "empty query"}
+    abs_path = os.path.abspath(path)
+    project = os.getcwd()
+    rel = os.path.relpath(abs_path, project)
+    if rel == "." or not rel.startswith(".."):
+        index, prefix = get_code_index(project), "" if rel == "." else rel.replace(os.sep, "/")
+    else:
+        index, prefix = get_code_index(abs_path), ""
+
+    stats: Dict[str, Any] = {}
+    try:
+        index.sync(force=True)
+        matches = [m.to_dict() for m in index.search_iter(
+            query, regex=bool(regex), ignore_case=bool(ignore_case), path_prefix=prefix,
+            max_results=int(max_results) + 1, per_file=PER_FILE, stats=stats,
+        )]
+    except Exception as e:  # в т.ч. re.error
+        log_warning(f"[fs.search] {query!r}: {e}")
+        return {"ok": False, "error": str(e)}
+    truncated = len(matches) > int(max_results)
+    matches = sorted(matches[: int(max_results)], key=lambda m: (m["path"], m["line"]))
+    log_info(f"[fs.search] {query!r} в {abs_path}: {len(matches)} совп., "
+             f"кандидатов {stats.get('candidates')}, {stats.get('elapsed_ms')} ms")
+    return {
+        "ok": True,
+        "root": index.root,
+        "matches": matches,
+        "truncated": truncated,
+        "candidates": stats.get("candidates"),
+        "indexed": stats.get("indexed"),
+        "elapsed_ms": stats.get("elapsed_ms"),
+    }
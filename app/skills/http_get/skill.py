@@ -1,22 +1,141 @@
 from __future__ import annotations
-from typing import Dict, Any
-import json
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import codecs
+import threading
 
 try:
     import requests  # опционально
+    from requests.adapters import HTTPAdapter
 except Exception:
     requests = None  # type: ignore
+    HTTPAdapter = None  # type: ignore
 
 from app.logger import log_warning
 
-def run(url: str, timeout: int = 10) -> Dict[str, Any]:
+MAX_BODY_CHARS = 10000
+MAX_BODY_BYTES = 64 * 1024  # тело читаем потоково и не дальше этого предела
+CHUNK_SIZE = 16 * 1024
+POOL_CONNECTIONS = 8        # хостов в пуле соединений
+POOL_MAXSIZE = 8            # соединений на хост (параллельные шаги Executor)
+VALIDATOR_CACHE_SIZE = 128  # URL в локальном кэше ETag/Last-Modified
+
+_CONDITIONAL = ("if-none-match", "if-modified-since")
+
+_session = None
+_session_lock = threading.Lock()
+# (url, max_bytes, заголовки запроса) -> (etag, last_modified, status, body, truncated)
+_validators: "OrderedDict[Tuple[Any, ...], Tuple[Optional[str], Optional[str], int, str, bool]]" = OrderedDict()
+_validators_lock = threading.Lock()
+
+
+def _get_session():
+    """Общая Session: keep-alive и пул соединений на весь процесс (и все вызовы навыка)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _session = s
+    return _session
+
+
+def _read_capped(r, max_bytes: int) -> Tuple[str, bool]:
+    """
+    Читает тело потоково до max_bytes и декодирует только сохранённое.
+    Неполный многобайтовый символ на границе отбрасывается (инкрементальный декодер).
+    """
+    buf = bytearray()
+    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+        buf += chunk
+        if len(buf) > max_bytes:  # хотя бы один байт сверх лимита — тело обрезано
+            break
+    truncated = len(buf) > max_bytes
+    try:
+        decoder = codecs.getincrementaldecoder(r.encoding or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    return decoder.decode(bytes(buf[:max_bytes]), final=not truncated), truncated
+
+
+def _validator_key(url: str, cap: int, headers: Dict[str, str]) -> Tuple[Any, ...]:
+    """
+    Ключ локального кэша: тело, сохранённое с меньшим max_bytes, не отдаётся запросу с большим,
+    а ответ на другие Accept/Authorization/... — не подменяет представление.
+    """
+    return url, cap, tuple(sorted((k.lower(), str(v)) for k, v in headers.items() if k.lower() not in _CONDITIONAL))
+
+
+def _remember(key: Tuple[Any, ...], etag: Optional[str], last_modified: Optional[str], status: int, body: str, truncated: bool) -> None:
+    with _validators_lock:
+        _validators[key] = (etag, last_modified, status, body, truncated)
+        _validators.move_to_end(key)
+        while len(_validators) > VALIDATOR_CACHE_SIZE:
+            _validators.popitem(last=False)
+
+
+def run(
+    url: str,
+    timeout: int = 10,
+    headers: Optional[Dict[str, str]] = None,
+    max_bytes: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    GET с префиксом тела (не больше max_bytes байт, по умолчанию MAX_BODY_BYTES; соединение
+    закрывается сразу после префикса).
+
+    Условный GET: для URL, который уже читали с тем же max_bytes и заголовками, отправляются
+    If-None-Match / If-Modified-Since из локального кэша; на 304 возвращается сохранённое тело (revalidated=True).
+    Если условные заголовки передал вызывающий (кэш Executor) — 304 возвращается как есть.
+    """
     if requests is None:
         log_warning("[http.get] модуль requests не установлен")
         return {"ok": False, "error": "requests not installed"}
+    cap = max(1, int(max_bytes or MAX_BODY_BYTES))
+    req_headers = dict(headers or {})
+    caller_conditional = any(h.lower() in _CONDITIONAL for h in req_headers)
+    key = _validator_key(url, cap, req_headers)
+    cached = None
+    if not caller_conditional:
+        with _validators_lock:
+            cached = _validators.get(key)
+        if cached is not None:
+            etag, last_modified = cached[0], cached[1]
+            if etag:
+                req_headers["If-None-Match"] = etag
+            if last_modified:
+                req_headers["If-Modified-Since"] = last_modified
     try:
-        r = requests.get(url, timeout=timeout)
-        # не возвращаем гигантские тела
-        body = r.text[:10000]
-        return {"ok": True, "status": r.status_code, "body": body}
+        # не возвращаем (и не скачиваем) гигантские тела: только префикс
+        with _get_session().get(url, timeout=timeout, stream=True, headers=req_headers or None) as r:
+            etag = r.headers.get("ETag")
+            last_modified = r.headers.get("Last-Modified")
+            if r.status_code == 304:
+                if cached is None:
+                    return {"ok": True, "status": 304, "body": "", "etag": etag, "last_modified": last_modified}
+                _remember(key, etag or cached[0], last_modified or cached[1], cached[2], cached[3], cached[4])
+                return {
+                    "ok": True,
+                    "status": cached[2],
+                    "body": cached[3][:MAX_BODY_CHARS],
+                    "truncated": cached[4],
+                    "revalidated": True,
+                    "etag": etag or cached[0],
+                    "last_modified": last_modified or cached[1],
+                }
+            body, truncated = _read_capped(r, cap)
+        if r.status_code == 200 and (etag or last_modified):
+            _remember(key, etag, last_modified, r.status_code, body, truncated)
+        return {
+            "ok": True,
+            "status": r.status_code,
+            "body": body[:MAX_BODY_CHARS],
+            "truncated": truncated or len(body) > MAX_BODY_CHARS,
+            "etag": etag,
+            "last_modified": last_modified,
+        }
     except Exception as e:
-        return {"ok": False, "error": str(e)}
\ No newline at end of file
+        return {"ok": False, "error": str(e)}
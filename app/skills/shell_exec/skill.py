@@ -1,11 +1,151 @@
 from __future__ import annotations
+import os
+import selectors
+import signal
 import subprocess
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Optional, Tuple
 
-def run(cmd: str) -> Dict[str, Any]:
+MAX_OUTPUT_CHARS = 5000
+READ_SIZE = 64 * 1024
+KILL_GRACE = 1.0  # секунд между SIGTERM и SIGKILL группе процессов
+
+
+class _Tail:
+    """Кольцевой буфер: хранит последние cap байт потока (не больше 2*cap в памяти)."""
+    def __init__(self, cap: int):
+        self.cap = max(1, cap)
+        self.buf = bytearray()
+        self.total = 0
+
+    def feed(self, data: bytes) -> None:
+        self.total += len(data)
+        self.buf += data
+        if len(self.buf) > 2 * self.cap:
+            del self.buf[: len(self.buf) - self.cap]
+
+    def text(self, max_chars: int) -> str:
+        data = bytes(self.buf[-self.cap:])
+        text = data.decode("utf-8", errors="replace")
+        if self.total > len(data):
+            text = text.lstrip("�")  # начало обрезано посреди символа
+        return text[-max_chars:]
+
+
+def _kill_group(p: subprocess.Popen) -> Optional[Tuple[int, Any]]:
     """
-    Опасный скилл — как правило блокируется SafetyGuardian по policy.
+    SIGTERM всей группе (shell и его дети), через KILL_GRACE — SIGKILL оставшимся.
+    Если shell завершился в пределах KILL_GRACE — возвращает (status, rusage) из wait4.
     """
+    reaped = None
+    try:
+        os.killpg(p.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return None
+    deadline = time.monotonic() + KILL_GRACE
+    while time.monotonic() < deadline:
+        pid, status, usage = os.wait4(p.pid, os.WNOHANG)
+        if pid:
+            reaped = (status, usage)
+            break
+        time.sleep(0.02)
+    try:
+        os.killpg(p.pid, signal.SIGKILL)  # дети, пережившие SIGTERM (или сам shell)
+    except ProcessLookupError:
+        pass
+    return reaped
+
+
+def _run_legacy(cmd: str, timeout: float, max_output: int) -> Dict[str, Any]:
+    """Не-POSIX (Windows): без selectors на пайпах и групп процессов."""
     p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    out, err = p.communicate(timeout=30)
-    return {"code": p.returncode, "stdout": out[-5000:], "stderr": err[-5000:]}
\ No newline at end of file
+    try:
+        out, err = p.communicate(timeout=timeout)
+        timed_out = False
+    except subprocess.TimeoutExpired:
+        p.kill()
+        out, err = p.communicate()
+        timed_out = True
+    return {"code": p.returncode, "stdout": out[-max_output:], "stderr": err[-max_output:], "timed_out": timed_out}
+
+
+def run(cmd: str, timeout: float = 30, max_output: int = MAX_OUTPUT_CHARS) -> Dict[str, Any]:
+    """
+    Опасный скилл — как правило блокируется SafetyGuardian по policy.
+
+    Команда запускается в своей группе процессов; stdout/stderr читаются по мере поступления
+    (selectors) в кольцевые буферы — в памяти только хвост, сколько бы ни писала команда.
+    По timeout убивается вся группа. Возвращает хвосты вывода, объём вывода, CPU-время и
+    пиковый RSS (wait4).
+    """
+    max_output = max(1, int(max_output))
+    if os.name != "posix":
+        return _run_legacy(cmd, float(timeout), max_output)
+
+    started = time.monotonic()
+    p = subprocess.Popen(
+        cmd, shell=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    # байт на символ UTF-8 — до 4; держим с запасом, чтобы хватило на max_output символов
+    tails = {p.stdout.fileno(): _Tail(max_output * 4), p.stderr.fileno(): _Tail(max_output * 4)}
+    out_fd, err_fd = p.stdout.fileno(), p.stderr.fileno()
+    deadline = started + float(timeout)
+    timed_out = False
+
+    with selectors.DefaultSelector() as sel:
+        sel.register(out_fd, selectors.EVENT_READ)
+        sel.register(err_fd, selectors.EVENT_READ)
+        while sel.get_map():
+            left = deadline - time.monotonic()
+            if left <= 0:
+                timed_out = True
+                break
+            for key, _ in sel.select(timeout=left):
+                data = os.read(key.fd, READ_SIZE)
+                if data:
+                    tails[key.fd].feed(data)
+                else:
+                    sel.unregister(key.fd)
+
+    reaped = None
+    if not timed_out:
+        # пайпы закрыты, но shell мог перенаправить вывод (cmd > log 2>&1) и ещё работать —
+        # ждём его до того же дедлайна
+        pause = 0.001
+        while True:
+            pid, status, usage = os.wait4(p.pid, os.WNOHANG)
+            if pid:
+                reaped = (status, usage)
+                break
+            left = deadline - time.monotonic()
+            if left <= 0:
+                timed_out = True
+                break
+            time.sleep(min(pause, left))
+            pause = min(pause * 2, 0.05)
+    if timed_out:
+        reaped = _kill_group(p)
+    p.stdout.close()
+    p.stderr.close()
+
+    if reaped is None:
+        _, status, usage = os.wait4(p.pid, 0)
+    else:
+        status, usage = reaped
+    p.returncode = os.waitstatus_to_exitcode(status)
+
+    res: Dict[str, Any] = {
+        "code": p.returncode,
+        "stdout": tails[out_fd].text(max_output),
+        "stderr": tails[err_fd].text(max_output),
+        "timed_out": timed_out,
+        "stdout_bytes": tails[out_fd].total,
+        "stderr_bytes": tails[err_fd].total,
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+        # rusage shell-а и дождавшихся его детей
+        "cpu_user_s": round(usage.ru_utime, 3),
+        "cpu_sys_s": round(usage.ru_stime, 3),
+        "max_rss_kb": usage.ru_maxrss,  # Linux: КБ (macOS: байты)
+    }
+    return res
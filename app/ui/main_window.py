@@ -14,12 +14,14 @@ from PyQt6.QtGui import QAction
 from PyQt6.QtCore import QSettings, Qt
 
 from .chat_panel import ChatPanel
+from .panels.panel_approvals import PanelApprovals
 from app.modules.self_improver import SelfImprover
 from app.modules.improver.project_scanner import ProjectScanner
 from app.modules.analyzer import CodeAnalyzer
 
 # безопасные геттеры параметров
 from app.modules.utils import load_api_key, load_model_name, load_temperature
+from app.logger import DEFAULT_LOG_DIR, MAIN_LOG_FILE
 
 # ----- Агент и его совместимые зависимости (мягкие импорты) -----
 try:
@@ -33,10 +35,11 @@ except Exception:
     SelfImproverBridge = None  # type: ignore
 
 try:
-    from app.core.file_manager import FileManager, FileManagerConfig  # type: ignore
+    from app.core.file_manager import FileManager, FileManagerConfig, read_tail  # type: ignore
 except Exception:
     FileManager = None  # type: ignore
     FileManagerConfig = None  # type: ignore
+    read_tail = None  # type: ignore
 
 try:
     from app.modules.improver.patcher import CodePatcher  # type: ignore
@@ -47,7 +50,7 @@ except Exception:
 class SelfImproverPanel(QWidget):
     """
     Правая панель: модуль саморазвития (SelfImprover).
-    Вкладки: процесс, метасаммери, AI-идеи, история, задачи.
+    Вкладки: процесс, метасаммери, AI-идеи, история, задачи, подтверждение патчей.
     """
     def __init__(self, config: Dict[str, Any], chat_panel: Optional[ChatPanel] = None, parent: Optional[QWidget] = None):
         super().__init__(parent)
@@ -82,6 +85,10 @@ class SelfImproverPanel(QWidget):
         self.ai_ideas_output = self._make_tab("💡 AI-идеи/Экспансия", "#e8faef")
         self.history_output = self._make_tab("🕓 История изменений", "#f5f0e6")
         self.tasks_output = self._make_tab("📝 Запросы/Задачи", "#f4eaff")
+        self.approvals_panel = PanelApprovals(
+            self.improver.patcher.approvals, parent=self, patcher=self.improver.patcher,
+        )
+        self.tabs.addTab(self.approvals_panel, "✅ Подтверждение патчей")
 
         header = QLabel("🤖 Саморазвитие Aideon")
         header.setStyleSheet("font-weight: 600;")
@@ -608,6 +615,9 @@ class MainWindow(QMainWindow):
                 msg = "Агент не смог выполнить цель. Смотри app/logs/agent.jsonl и aideon.log."
                 if err:
                     msg += f"\nПоследняя ошибка: {err}"
+                log_tail = self._log_tail()
+                if log_tail:
+                    msg += f"\n\nХвост aideon.log:\n{log_tail}"
                 QMessageBox.critical(self, "Агент", msg)
                 return
 
@@ -617,6 +627,16 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "Агент", f"Ошибка выполнения: {e}")
 
+    def _log_tail(self, lines: int = 15) -> str:
+        """Последние строки основного лога (читается только хвост файла, не весь лог)."""
+        path = os.path.join(DEFAULT_LOG_DIR, MAIN_LOG_FILE)
+        if read_tail is None:
+            return ""
+        try:
+            return read_tail(path, 16 * 1024, lines=lines).rstrip() if os.path.exists(path) else ""
+        except Exception:
+            return ""
+
     # ---------- безопасная загрузка конфига ----------
 
     def _load_config(self, passed: Optional[Dict[str, Any]]) -> Dict[str, Any]:
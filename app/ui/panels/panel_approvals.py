@@ -0,0 +1,121 @@
+# app/ui/panels/panel_approvals.py
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QTextEdit, QPushButton,
+    QListWidget, QInputDialog, QMessageBox
+)
+
+from app.modules.improver.approval_queue import STATUS_PENDING, STATUSES
+
+
+class PanelApprovals(QWidget):
+    def __init__(self, queue, refresh_ms=2000, parent=None, patcher=None):
+        """
+        Панель подтверждения патчей: ожидающие заявки ApprovalQueue, diff, одобрить/отклонить.
+        Одобренные патчи применяет фоновый ApprovalWorker (запускается здесь через patcher —
+        иначе одобренное в новой сессии GUI не применит никто); список обновляется по таймеру
+        (решения могут прийти и из CLI другого процесса).
+        """
+        super().__init__(parent)
+        self.queue = queue
+        self.items = []
+        if patcher is not None:
+            patcher.start_approval_worker()
+        self._init_ui()
+        self.refresh()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(int(refresh_ms))
+
+    def _init_ui(self):
+        layout = QVBoxLayout(self)
+
+        self.label = QLabel("Патчи, ожидающие подтверждения")
+        layout.addWidget(self.label)
+
+        self.items_list = QListWidget()
+        self.items_list.itemClicked.connect(self.show_details)
+        layout.addWidget(self.items_list)
+
+        self.diff_output = QTextEdit()
+        self.diff_output.setReadOnly(True)
+        self.diff_output.setStyleSheet("font-family: monospace;")
+        layout.addWidget(self.diff_output)
+
+        buttons = QHBoxLayout()
+        self.approve_button = QPushButton("✅ Одобрить")
+        self.approve_button.clicked.connect(self.approve_selected)
+        buttons.addWidget(self.approve_button)
+
+        self.reject_button = QPushButton("❌ Отклонить")
+        self.reject_button.clicked.connect(self.reject_selected)
+        buttons.addWidget(self.reject_button)
+
+        self.refresh_button = QPushButton("🔄 Обновить")
+        self.refresh_button.clicked.connect(self.refresh)
+        buttons.addWidget(self.refresh_button)
+        layout.addLayout(buttons)
+
+        self.setLayout(layout)
+
+    def refresh(self):
+        """Перечитывает ожидающие заявки, сохраняя выбранную."""
+        selected = self._selected()
+        selected_id = selected.id if selected is not None else None
+        try:
+            self.items = self.queue.pending()
+            counts = self.queue.counts()
+        except Exception as e:
+            self.label.setText(f"Очередь подтверждения недоступна: {e}")
+            return
+
+        self.items_list.clear()
+        for i, item in enumerate(self.items):
+            after = item.context.get("after")
+            self.items_list.addItem(
+                f"{item.when}  {item.file}  (+{item.added_lines}/-{item.removed_lines})"
+                + (f"  ⛓ после {after}" if after else "")
+            )
+            if item.id == selected_id:
+                self.items_list.setCurrentRow(i)
+        summary = ", ".join(f"{s}={counts[s]}" for s in STATUSES if counts.get(s))
+        self.label.setText(f"Патчи, ожидающие подтверждения: {counts.get(STATUS_PENDING, 0)}  ({summary})")
+        if selected_id is not None and self._selected() is None:
+            self.diff_output.clear()
+
+    def _selected(self):
+        row = self.items_list.currentRow()
+        if row < 0 or row >= len(self.items):
+            return None
+        return self.items[row]
+
+    def show_details(self, item):
+        entry = self._selected()
+        if entry is None:
+            return
+        header = f"# {entry.id}  {entry.file}\n"
+        if entry.context.get("model"):
+            header += f"# модель: {entry.context['model']}\n"
+        self.diff_output.setPlainText(header + "\n" + entry.diff)
+
+    def approve_selected(self):
+        entry = self._selected()
+        if entry is None:
+            QMessageBox.warning(self, "Ошибка", "Выберите патч в списке.")
+            return
+        if not self.queue.approve(entry.id, reviewer="ui"):
+            QMessageBox.information(self, "Подтверждение", "Решение по этому патчу уже принято.")
+        self.refresh()
+
+    def reject_selected(self):
+        entry = self._selected()
+        if entry is None:
+            QMessageBox.warning(self, "Ошибка", "Выберите патч в списке.")
+            return
+        reason, ok = QInputDialog.getText(self, "Отклонить патч", "Причина (необязательно):")
+        if not ok:
+            return
+        if not self.queue.reject(entry.id, reviewer="ui", reason=reason):
+            QMessageBox.information(self, "Подтверждение", "Решение по этому патчу уже принято.")
+        self.refresh()
@@ -1,20 +1,31 @@
 import json
 import os
+from pathlib import Path
 from PyQt6.QtWidgets import (
-    QWidget, QVBoxLayout, QLabel, QTextEdit, QPushButton,
-    QListWidget, QMessageBox
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QTextEdit, QPushButton,
+    QListWidget, QLineEdit, QMessageBox
 )
 
+from app.modules.improver.patch_archive import ARCHIVE_REF_SEP, get_patch_archive, split_ref
+from app.modules.improver.patch_index import get_patch_index
+
+PATCH_PAGE_SIZE = 50
+
+
 class PanelHistory(QWidget):
-    def __init__(self, history_path="app/logs/history.json", parent=None):
+    def __init__(self, history_path="app/logs/history.json", diff_dir="app/patches", parent=None):
         """
         Панель истории (исправлений, тестов, загрузок проектов и т.д.).
+        Патчи читаются из индекса (PatchIndex) постранично, с фильтром по файлу.
         """
         super().__init__(parent)
         self.history_path = history_path
         self.history = self._load_history()  # Загружаем историю при запуске
+        self.patch_index = get_patch_index(diff_dir)
+        self.patch_entries = []  # загруженные страницы PatchEntry
         self._init_ui()
         self.load_history()
+        self.load_patches()
 
     def _init_ui(self):
         layout = QVBoxLayout(self)
@@ -27,6 +38,28 @@ class PanelHistory(QWidget):
         self.history_list.itemClicked.connect(self.show_details)
         layout.addWidget(self.history_list)
 
+        # Патчи из индекса: фильтр по файлу + постраничная загрузка
+        self.patches_label = QLabel("Патчи")
+        layout.addWidget(self.patches_label)
+
+        filter_row = QHBoxLayout()
+        self.patch_filter = QLineEdit()
+        self.patch_filter.setPlaceholderText("Фильтр по пути файла (например, app/ui/main_window.py)")
+        self.patch_filter.returnPressed.connect(self.load_patches)
+        filter_row.addWidget(self.patch_filter)
+        self.patch_filter_button = QPushButton("Найти")
+        self.patch_filter_button.clicked.connect(self.load_patches)
+        filter_row.addWidget(self.patch_filter_button)
+        layout.addLayout(filter_row)
+
+        self.patch_list = QListWidget()
+        self.patch_list.itemClicked.connect(self.show_patch_details)
+        layout.addWidget(self.patch_list)
+
+        self.more_button = QPushButton("Загрузить ещё")
+        self.more_button.clicked.connect(self.load_more_patches)
+        layout.addWidget(self.more_button)
+
         # Поле вывода деталей
         self.details_output = QTextEdit()
         self.details_output.setReadOnly(True)
@@ -65,10 +98,90 @@ class PanelHistory(QWidget):
 
             self.history_list.addItem(item_str)
 
+    # ---------- патчи (индекс) ----------
+
+    def _patch_filters(self):
+        text = self.patch_filter.text().strip()
+        return {"file_like": text.replace("\\", "/")} if text else {}
+
+    def load_patches(self):
+        """Первая страница патчей с учётом фильтра."""
+        self.patch_entries = []
+        self.patch_list.clear()
+        self.load_more_patches()
+
+    def load_more_patches(self):
+        """Следующая страница патчей (PATCH_PAGE_SIZE записей)."""
+        filters = self._patch_filters()
+        try:
+            page = self.patch_index.query(limit=PATCH_PAGE_SIZE, offset=len(self.patch_entries), **filters)
+            total = self.patch_index.count(**filters)
+        except Exception as e:
+            QMessageBox.warning(self, "Ошибка", f"Индекс патчей недоступен: {e}")
+            return
+        for entry in page:
+            status = entry.test_status or "—"
+            mark = " ↩️" if entry.rolled_back else ""
+            self.patch_list.addItem(f"{entry.when}  {entry.file}  [{status}]{mark}")
+        self.patch_entries.extend(page)
+        self.patches_label.setText(f"Патчи: {len(self.patch_entries)} из {total}")
+        self.more_button.setEnabled(len(self.patch_entries) < total)
+
+    def _patch_diff(self, entry):
+        """Текст diff по diff_ref: запись архива ("<archive.sqlite>#<change_id>") или старый .diff.txt."""
+        ref = entry.diff_ref
+        change_id = split_ref(ref)
+        try:
+            if change_id:
+                archive_path = ref.rpartition(ARCHIVE_REF_SEP)[0]
+                rec = get_patch_archive(Path(archive_path).parent).get(change_id)
+                return rec.diff if rec is not None else None
+            if ref and os.path.exists(ref):
+                with open(ref, "r", encoding="utf-8") as f:
+                    return f.read()
+        except Exception as e:
+            return f"⚠️ Не удалось прочитать diff: {e}"
+        return None
+
+    def _selected_patch(self):
+        item = self.patch_list.currentItem()
+        if item is None:
+            return None
+        index = self.patch_list.row(item)
+        if index < 0 or index >= len(self.patch_entries):
+            return None
+        return self.patch_entries[index]
+
+    def show_patch_details(self, item):
+        """Метаданные патча из индекса + diff из архива."""
+        self.history_list.clearSelection()
+        entry = self._selected_patch()
+        if entry is None:
+            return
+        html = f"<b>Патч:</b> {entry.change_id}<br>"
+        html += f"<b>Файл:</b> {entry.file}<br>"
+        html += f"<b>Время:</b> {entry.when}<br>"
+        html += f"<b>Запуск:</b> {entry.run_id or '—'}; <b>набор:</b> {entry.set_id or '—'}<br>"
+        html += f"<b>Размер:</b> {entry.old_len} → {entry.new_len}<br>"
+        if entry.model:
+            html += f"<b>Модель:</b> {entry.model}"
+            if entry.latency_ms is not None:
+                html += f" ({entry.latency_ms:.0f} мс)"
+            html += "<br>"
+        if entry.test_status:
+            html += f"<b>Тест:</b> {entry.test_status} (код {entry.test_rc})<br>"
+        if entry.rolled_back:
+            html += "<b>Откатан</b><br>"
+        self.details_output.setHtml(html)
+        self.compare_button.setEnabled(bool(entry.diff_ref))
+
+    # ---------- история действий ----------
+
     def show_details(self, item):
         """
         Показывает детали записи истории в details_output.
         """
+        self.patch_list.clearSelection()
         index = self.history_list.row(item)
         if index < 0 or index >= len(self.history):
             return
@@ -138,6 +251,12 @@ class PanelHistory(QWidget):
         """
         Показывает diff, если он есть, в отдельном QMessageBox.
         """
+        entry = self._selected_patch()
+        if entry is not None and self.patch_list.currentItem().isSelected():
+            diff = self._patch_diff(entry) or "Нет `diff`-разницы."
+            QMessageBox.information(self, "Сравнение исправлений", f"Разница:\n\n{diff}")
+            return
+
         selected_item = self.history_list.currentItem()
         if not selected_item:
             QMessageBox.warning(self, "Ошибка", "Выберите запись в истории для сравнения.")
@@ -1,5 +1,6 @@
 import os
 import json
+import time
 import signal
 import subprocess
 
@@ -259,8 +260,7 @@ class PanelProcess(QWidget):
             return
 
         try:
-            with open(self.current_file, "w", encoding="utf-8") as f:
-                f.write(self.original_code)
+            self.file_manager.restore_content(self.current_file, self.original_code)
 
             self._append_log(f'<b>Код откатился к предыдущей версии:</b> {self.current_file}')
             QMessageBox.information(self, "Откат выполнен",
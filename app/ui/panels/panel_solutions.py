@@ -111,8 +111,7 @@ class PanelSolutions(QWidget):
             return
 
         try:
-            with open(self.current_file, "w", encoding="utf-8") as f:
-                f.write(self.original_code)
+            self.file_manager.restore_content(self.current_file, self.original_code)
             
             QMessageBox.information(self, "Откат выполнен", "Файл восстановлен до исходного состояния.")
             self.rollback_button.setEnabled(False)
@@ -123,4 +122,4 @@ class PanelSolutions(QWidget):
                 self.panel_process.log_output.append(f"<b>Код откатился к предыдущей версии:</b> {self.current_file}")
 
         except Exception as e:
-            QMessageBox.critical(self, "Ошибка отката", f"Ошибка при восстановлении файла: {e}")
\ No newline at end of file
+            QMessageBox.critical(self, "Ошибка отката", f"Ошибка при восстановлении файла: {e}")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк поиска по коду (CodeIndex / навык fs.search) против полного перебора файлов.
+
+Дерево из --files .py-файлов во временном каталоге; редкий идентификатор встречается
+в --hits файлах. Сравнение: перебор (чтение всех файлов + regex) и запросы по индексу
+(первая сборка, синхронизация без изменений, литерал, regex, regex без обязательных подстрок).
+
+  python scripts/bench_code_search.py [--files 20000] [--hits 20]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO_ROOT))
+
+from app.core.code_index import CodeIndex  # noqa: E402
+
+NEEDLE = "confirm_and_apply_patch"
+
+
+def _make_tree(root: Path, n_files: int, hits: int) -> None:
+    step = max(1, n_files // max(1, hits))
+    for i in range(n_files):
+        d = root / f"pkg_{i // 2000}" / f"mod_{(i // 100) % 20}"
+        if i % 100 == 0:
+            d.mkdir(parents=True, exist_ok=True)
+        body = "".join(
+            f"def func_{i}_{j}(value, other=None):\n    result = value * {j} + len(str(other))\n    return result\n\n"
+            for j in range(30)
+        )
+        if i % step == 0:
+            body += f"\nfrom patcher import {NEEDLE}\n{NEEDLE}(path, old, new)\n"
+        (d / f"file_{i}.py").write_text(body, encoding="utf-8")
+
+
+def _naive(root: Path, pattern: str) -> int:
+    rx = re.compile(pattern, re.MULTILINE)
+    n = 0
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if name.endswith(".py"):
+                with open(os.path.join(dirpath, name), "rb") as f:
+                    n += len(rx.findall(f.read().decode("utf-8", errors="replace")))
+    return n
+
+
+def _timed(label: str, fn, repeat: int = 1):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"{label:<34} {best * 1000:>10.1f} ms")
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="CodeIndex vs full scan")
+    ap.add_argument("--files", type=int, default=20_000)
+    ap.add_argument("--hits", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_search_")).resolve()
+    try:
+        t0 = time.perf_counter()
+        _make_tree(tmp / "tree", args.files, args.hits)
+        print(f"tree: {args.files} files in {time.perf_counter() - t0:.1f}s")
+
+        _timed("full scan (literal)", lambda: _naive(tmp / "tree", re.escape(NEEDLE)))
+        idx = CodeIndex(tmp / "tree", tmp / "index.sqlite")
+        _timed("index build (first sync)", lambda: idx.sync(force=True))
+        _timed("sync, no changes", lambda: idx.sync(force=True), args.repeat)
+
+        def query(q: str, regex: bool = False):
+            return lambda: len(idx.search(q, regex=regex, max_results=1000))
+
+        n = _timed("indexed literal", query(NEEDLE), args.repeat)
+        print(f"{'':<34} {n} matches")
+        _timed("indexed regex", query(r"from \w+ import confirm_and_\w+", True), args.repeat)
+        _timed("indexed regex, no literals (cap)", query(r"\d{3}\w", True), args.repeat)
+        idx.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк diff_engine против difflib.unified_diff.
+
+Сценарии:
+  - small:   ~200 строк, несколько точечных правок;
+  - large:   ~20k строк с длинными повторяющимися участками, правки по всему файлу;
+  - rewrite: ~3k строк, модель переписала ~80% файла.
+
+Для каждого сценария печатает время (лучшее из --repeat) и размер diff в строках.
+
+  python scripts/bench_diff.py [--repeat 3] [--only small,large,rewrite]
+"""
+from __future__ import annotations
+
+import argparse
+import difflib
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO_ROOT))
+
+from app.modules.improver.diff_engine import ALGORITHMS, unified_diff  # noqa: E402
+
+
+def _small(rng: random.Random) -> Tuple[List[str], List[str]]:
+    a = [f"    value_{i} = compute({i}, flag={i % 3 == 0})\n" for i in range(200)]
+    b = list(a)
+    for i in rng.sample(range(len(b)), 8):
+        b[i] = b[i].replace("compute", "compute_fast")
+    b.insert(100, "    # added\n")
+    return a, b
+
+
+def _large(rng: random.Random) -> Tuple[List[str], List[str]]:
+    block = ["    pass\n", "\n", "    return None\n", "\n"]
+    a: List[str] = []
+    for i in range(2500):
+        a.append(f"def handler_{i}(event):\n")
+        a.extend(block)
+        a.extend(["    }\n", "    ]\n", "\n"][: 1 + i % 3])
+    b = list(a)
+    for i in sorted(rng.sample(range(len(b)), 300), reverse=True):
+        if i % 2:
+            b[i] = "    log(event)\n"
+        else:
+            del b[i]
+    return a, b
+
+
+def _rewrite(rng: random.Random) -> Tuple[List[str], List[str]]:
+    a = [f"line {i}: {rng.randint(0, 10**6)}\n" for i in range(3000)]
+    b = []
+    for line in a:
+        if rng.random() < 0.8:
+            b.append(f"rewritten {rng.randint(0, 10**6)}\n")
+        else:
+            b.append(line)
+        if rng.random() < 0.1:
+            b.append("\n")
+    return a, b
+
+
+SCENARIOS: Dict[str, Callable[[random.Random], Tuple[List[str], List[str]]]] = {
+    "small": _small,
+    "large": _large,
+    "rewrite": _rewrite,
+}
+
+
+def _bench(fn: Callable[[], List[str]], repeat: int) -> Tuple[float, int]:
+    best = float("inf")
+    size = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+        size = len(out)
+    return best, size
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="diff_engine vs difflib")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--only", default=",".join(SCENARIOS))
+    args = ap.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'scenario':<9} {'engine':<10} {'lines a/b':>13} {'time, ms':>10} {'diff lines':>11}")
+    for name in [s.strip() for s in args.only.split(",") if s.strip()]:
+        a, b = SCENARIOS[name](rng)
+        runs = [("difflib", lambda: list(difflib.unified_diff(a, b, "a", "b", n=3)))]
+        for alg in ALGORITHMS:
+            runs.append((alg, lambda alg=alg: list(unified_diff(a, b, "a", "b", n=3, algorithm=alg))))
+        for engine, fn in runs:
+            sec, size = _bench(fn, args.repeat)
+            print(f"{name:<9} {engine:<10} {len(a):>6}/{len(b):<6} {sec * 1000:>10.1f} {size:>11}")
+
+
+if __name__ == "__main__":
+    main()
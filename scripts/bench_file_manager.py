@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк FileManager: накладные расходы на разрешение путей.
+
+Сценарии:
+  - list_files: дерево из --files файлов (по умолчанию 50k) во временном каталоге;
+    сравнение с прежней реализацией (rglob + двойной resolve + цикл по корням);
+  - read loop:  --reads вызовов exists()+read_text() по 200 файлам с кэшем путей и без него.
+
+  python scripts/bench_file_manager.py [--files 50000] [--reads 20000] [--roots 8]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO_ROOT))
+
+from app.core.file_manager import FileManager  # noqa: E402
+
+
+def _make_tree(root: Path, n_files: int) -> None:
+    per_dir = 100
+    for i in range(n_files):
+        d = root / f"pkg_{i // (per_dir * 20)}" / f"mod_{(i // per_dir) % 20}"
+        if i % per_dir == 0:
+            d.mkdir(parents=True, exist_ok=True)
+        (d / f"file_{i}.py").write_text(f"x = {i}\n", encoding="utf-8")
+
+
+def _legacy_list_files(fm: FileManager, root: Path) -> List[Path]:
+    """Прежняя list_files: rglob + is_file + два resolve и цикл по корням на каждый файл."""
+    def in_roots(p: Path) -> bool:
+        ps = str(p)
+        for r in fm.allowed_roots:
+            rs = str(r)
+            if ps == rs or ps.startswith(rs + os.sep) or ps.startswith(rs + "/"):
+                return True
+        return False
+
+    root_p = root.expanduser().resolve()
+    files = [p for p in root_p.rglob("*") if p.is_file()]
+    return [p.expanduser().resolve() for p in files if in_roots(p.expanduser().resolve())]
+
+
+def _bench(fn: Callable[[], object], repeat: int) -> Tuple[float, object]:
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="FileManager path overhead")
+    ap.add_argument("--files", type=int, default=50_000)
+    ap.add_argument("--reads", type=int, default=20_000)
+    ap.add_argument("--roots", type=int, default=8, help="число allowed_roots (матчер против цикла)")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_fm_")).resolve()
+    try:
+        t0 = time.perf_counter()
+        _make_tree(tmp / "tree", args.files)
+        print(f"tree: {args.files} files in {time.perf_counter() - t0:.1f}s")
+
+        roots = [tmp / f"other_{i}" for i in range(args.roots - 1)] + [tmp]
+        fm = FileManager(base_dir=tmp, allowed_roots=roots)
+        fm_nocache = FileManager(base_dir=tmp, allowed_roots=roots, path_cache_size=0)
+
+        sec_old, old = _bench(lambda: _legacy_list_files(fm, tmp / "tree"), args.repeat)
+        sec_new, new = _bench(lambda: fm.list_files("tree"), args.repeat)
+        assert sorted(map(str, old)) == sorted(map(str, new)), "list_files mismatch"
+        n = len(new)
+        print(f"{'list_files':<22} {'legacy':>10} {sec_old * 1000:>9.1f} ms  {sec_old / n * 1e6:>7.2f} us/file")
+        print(f"{'list_files':<22} {'new':>10} {sec_new * 1000:>9.1f} ms  {sec_new / n * 1e6:>7.2f} us/file")
+
+        sample = [p.relative_to(tmp).as_posix() for p in new[:: max(1, n // 200)]][:200]
+
+        def loop(m: FileManager) -> int:
+            total = 0
+            for i in range(args.reads):
+                rel = sample[i % len(sample)]
+                if m.exists(rel):
+                    total += len(m.read_text(rel))
+            return total
+
+        for label, m in (("no cache", fm_nocache), ("path cache", fm)):
+            sec, _ = _bench(lambda m=m: loop(m), args.repeat)
+            print(f"{'exists+read_text':<22} {label:>10} {sec * 1000:>9.1f} ms  {sec / args.reads * 1e6:>7.2f} us/call")
+
+        for label, m in (("no cache", fm_nocache), ("path cache", fm)):
+            sec, _ = _bench(lambda m=m: [m.resolve(sample[i % len(sample)]) for i in range(args.reads)], args.repeat)
+            print(f"{'resolve':<22} {label:>10} {sec * 1000:>9.1f} ms  {sec / args.reads * 1e6:>7.2f} us/call")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверка навыка http.get на локальном HTTP-сервере (вместо внешних сайтов).
+
+Сценарии:
+  - pooling:     --requests GET подряд — сколько TCP-соединений открыл клиент;
+  - byte cap:    тело --big-mb МБ — сколько байт сервер успел отдать до закрытия соединения;
+  - utf-8 cut:   многобайтовые символы на границе лимита — без мусора в конце;
+  - conditional: ETag / Last-Modified — повторный GET получает 304 и тело из локального кэша;
+  - cache key:   тело, сохранённое с меньшим max_bytes или другими заголовками, не отдаётся на 304.
+
+  python scripts/check_http_get.py [--requests 50] [--big-mb 20]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO_ROOT))
+
+from app.skills.http_get import skill as http_get  # noqa: E402
+
+ETAG = '"v1"'
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.connections = set()
+        self.big_sent = 0
+        self.not_modified = 0
+
+
+def _handler(stats: _Stats, big_bytes: int):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+        disable_nagle_algorithm = True  # иначе заголовки и тело уходят с задержкой delayed ACK
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def _send(self, code: int, body: bytes = b"", headers=None) -> None:
+            self.send_response(code)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            with stats.lock:
+                stats.connections.add(self.client_address)
+            if self.path == "/small":
+                self._send(200, b"ok", {"Content-Type": "text/plain; charset=utf-8"})
+            elif self.path == "/big":
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(big_bytes))
+                self.end_headers()
+                chunk = b"x" * 65536
+                try:
+                    sent = 0
+                    while sent < big_bytes:
+                        self.wfile.write(chunk)
+                        sent += len(chunk)
+                        with stats.lock:
+                            stats.big_sent = sent
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+            elif self.path == "/utf8":
+                self._send(200, "я".encode("utf-8") * 100_000, {"Content-Type": "text/plain; charset=utf-8"})
+            elif self.path == "/etag":
+                if self.headers.get("If-None-Match") == ETAG or self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+                    with stats.lock:
+                        stats.not_modified += 1
+                    self._send(304, b"", {"ETag": ETAG})
+                else:
+                    self._send(200, b"cached body", {
+                        "Content-Type": "text/plain; charset=utf-8", "ETag": ETAG, "Last-Modified": LAST_MODIFIED,
+                    })
+            else:
+                self._send(404)
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address) -> None:
+        # клиент закрыл соединение после префикса тела — ожидаемо
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="http.get against a local server")
+    ap.add_argument("--requests", type=int, default=50)
+    ap.add_argument("--big-mb", type=int, default=20)
+    args = ap.parse_args()
+    if http_get.requests is None:
+        print("requests не установлен — проверка невозможна")
+        return 1
+
+    stats = _Stats()
+    server = _Server(("127.0.0.1", 0), _handler(stats, args.big_mb * 1024 * 1024))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    failed = 0
+
+    def check(name: str, ok: bool, detail: str) -> None:
+        nonlocal failed
+        failed += 0 if ok else 1
+        print(f"{'OK ' if ok else 'FAIL'} {name:<12} {detail}")
+
+    try:
+        t0 = time.perf_counter()
+        for _ in range(args.requests):
+            assert http_get.run(f"{base}/small")["body"] == "ok"
+        ms = (time.perf_counter() - t0) * 1000 / args.requests
+        check("pooling", len(stats.connections) == 1,
+              f"{args.requests} GET, соединений: {len(stats.connections)}, {ms:.2f} ms/GET")
+
+        t0 = time.perf_counter()
+        res = http_get.run(f"{base}/big")
+        time.sleep(0.2)
+        check("byte cap", res["truncated"] and stats.big_sent < args.big_mb * 1024 * 1024 // 2,
+              f"тело {args.big_mb} MB, сервер отдал {stats.big_sent // 1024} KiB, "
+              f"{(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        res = http_get.run(f"{base}/utf8", max_bytes=1001)
+        body = res["body"]
+        check("utf-8 cut", body == "я" * 500, f"max_bytes=1001 -> {len(body)} симв., без U+FFFD: {'�' not in body}")
+
+        first = http_get.run(f"{base}/etag")
+        second = http_get.run(f"{base}/etag")
+        check("conditional", second.get("revalidated") is True and second["body"] == first["body"]
+              and stats.not_modified == 1, f"304 от сервера: {stats.not_modified}, тело: {second['body']!r}")
+
+        raw = http_get.run(f"{base}/etag", headers={"If-None-Match": ETAG})
+        check("passthrough", raw["status"] == 304, "условные заголовки вызывающего -> 304 как есть")
+
+        before = stats.not_modified
+        short = http_get.run(f"{base}/etag", max_bytes=3)
+        full = http_get.run(f"{base}/etag", max_bytes=1024)
+        other = http_get.run(f"{base}/etag", headers={"Accept": "application/json"})
+        check("cache key", short["body"] == "cac" and full["body"] == "cached body" and not full.get("revalidated")
+              and not other.get("revalidated") and stats.not_modified == before,
+              f"max_bytes=3 -> {short['body']!r}, max_bytes=1024 -> {full['body']!r}, другой Accept -> 200")
+    finally:
+        server.shutdown()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())